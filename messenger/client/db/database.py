@@ -1,17 +1,20 @@
 import datetime
 from pathlib import Path
-from typing import List
+from typing import Iterable, List
 
 from sqlalchemy import (
-    create_engine, MetaData, Table, Column,
-    Integer, String, Text, DateTime,
+    create_engine, MetaData, Table, Column, Index,
+    Integer, String, Text, DateTime, insert,
 )
 from sqlalchemy.orm import sessionmaker, mapper
 
-from client.db.definitions import KnownUser, MessageHistory, Contact
+from client.db.definitions import KnownUser, MessageHistory, GroupMessageHistory, Contact, SyncState
 
 _BASE_DIR = Path(__file__).resolve().parent.parent.parent
 _DEFAULT_NAME = 'client_db.db3'
+SQLITE_MAX_PARAMETERS = 900  # параметров в одном запросе IN (...)
+SYNC_KNOWN_USERS = 'known_users'  # имя ревизии справочника пользователей в sync_state
+SYNC_CONTACTS = 'contacts'  # имя ревизии списка контактов в sync_state
 
 
 class ClientDatabase:
@@ -33,12 +36,28 @@ class ClientDatabase:
                                  Column('direction', String),
                                  Column('msg_text', Text),
                                  Column('created_at', DateTime, default=datetime.datetime.utcnow))
+        # История бесед групп хранится отдельно: имя группы может совпадать с именем пользователя
+        group_history_msg__tbl = Table('group_message_history', metadata,
+                                       Column('id', Integer, primary_key=True),
+                                       Column('group_name', String, index=True, nullable=False),
+                                       Column('sender', String, nullable=False),
+                                       Column('direction', String),
+                                       Column('msg_text', Text),
+                                       Column('created_at', DateTime, default=datetime.datetime.utcnow))
         contacts__tbl = Table('users_contacts', metadata,
                               Column('id', Integer, primary_key=True),
                               Column('username', String, unique=True, nullable=False))
+        # Ревизии данных, синхронизированных с сервером: имя набора -> ревизия сервера
+        sync_state__tbl = Table('sync_state', metadata,
+                                Column('name', String, primary_key=True),
+                                Column('revision', Integer, nullable=False))
         metadata.create_all(engine)
+        # Индекс добавлен после первой версии схемы: create_all не создаёт индексы существующих таблиц
+        Index('ix_known_users_username', users__tbl.c.username).create(engine, checkfirst=True)
         mapper(KnownUser, users__tbl)
+        mapper(SyncState, sync_state__tbl)
         mapper(MessageHistory, history_msg__tbl)
+        mapper(GroupMessageHistory, group_history_msg__tbl)
         mapper(Contact, contacts__tbl)
         self._Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
         self.session = self._Session()
@@ -55,16 +74,59 @@ class ClientDatabase:
         self.session.query(Contact).filter_by(username=username).delete()
         self.session.commit()
 
-    def refresh_known_users(self, users: List[str]):
+    def refresh_known_users(self, users: List[str], revision: int = 0):
+        """Замена справочника известных пользователей полным списком с сервера"""
         self.session.query(KnownUser).delete()
-        for user in users:
-            self.session.add(KnownUser(user))
+        if users:
+            self.session.execute(insert(KnownUser), [{'username': user} for user in users])
+        self._set_revision(SYNC_KNOWN_USERS, revision)
         self.session.commit()
 
+    def apply_known_users_changes(self, added: List[str], removed: List[str], revision: int):
+        """Применение изменений справочника после сохранённой ревизии одной транзакцией"""
+        self._delete_usernames(KnownUser, added + removed)  # повторно добавленные имена не дублируются
+        if added:
+            self.session.execute(insert(KnownUser), [{'username': user} for user in added])
+        self._set_revision(SYNC_KNOWN_USERS, revision)
+        self.session.commit()
+
+    def refresh_contacts(self, contacts: List[str], revision: int = 0):
+        """Замена списка контактов полным списком с сервера"""
+        self.session.query(Contact).delete()
+        if contacts:
+            self.session.execute(insert(Contact), [{'username': contact} for contact in set(contacts)])
+        self._set_revision(SYNC_CONTACTS, revision)
+        self.session.commit()
+
+    def apply_contacts_changes(self, added: List[str], removed: List[str], revision: int):
+        """Применение изменений списка контактов после сохранённой ревизии одной транзакцией"""
+        self._delete_usernames(Contact, added + removed)  # контакт, уже добавленный локально, не дублируется
+        if added:
+            self.session.execute(insert(Contact), [{'username': contact} for contact in added])
+        self._set_revision(SYNC_CONTACTS, revision)
+        self.session.commit()
+
+    def _delete_usernames(self, model, usernames: List[str]):
+        for start in range(0, len(usernames), SQLITE_MAX_PARAMETERS):
+            self.session.query(model).filter(
+                model.username.in_(usernames[start:start + SQLITE_MAX_PARAMETERS])).delete(synchronize_session=False)
+
+    def get_revision(self, name: str) -> int:
+        """Ревизия сервера, с которой синхронизирован набор данных (0 - не синхронизирован)"""
+        state = self.session.query(SyncState).get(name)
+        return state.revision if state else 0
+
+    def _set_revision(self, name: str, revision: int):
+        self.session.merge(SyncState(name, revision))
+
     def save_message(self, username: str, direction: str, msg_text: str):
         self.session.add(MessageHistory(username=username, direction=direction, msg_text=msg_text))
         self.session.commit()
 
+    def save_group_message(self, group: str, sender: str, direction: str, msg_text: str):
+        self.session.add(GroupMessageHistory(group, sender, direction, msg_text))
+        self.session.commit()
+
     def get_contacts(self):
         return [el[0] for el in self.session.query(Contact.username).all()]
 
@@ -79,6 +141,14 @@ class ClientDatabase:
             for el in messages
         ]
 
+    def get_group_history(self, group: str) -> List[dict]:
+        messages = self.session.query(GroupMessageHistory).filter_by(group_name=group).all()
+        return [
+            {'group': el.group_name, 'sender': el.sender, 'direction': el.direction,
+             'msg_text': el.msg_text, 'created_at': el.created_at}
+            for el in messages
+        ]
+
     def is_contact_exists(self, username: str):
         return bool(self.session.query(Contact).filter_by(username=username).first())
 
@@ -93,9 +163,21 @@ if __name__ == '__main__':
     __test_variable.add_contact('user_01')
     __test_variable.add_contact('user_02')
     __test_variable.del_contact('user_02')
-    __test_variable.refresh_known_users(['user_01', 'user_02', 'user_03'])
+    __test_variable.refresh_known_users(['user_01', 'user_02', 'user_03'], revision=3)
+    __test_variable.apply_known_users_changes(['user_04'], ['user_03'], revision=5)
+    assert sorted(__test_variable.get_known_users()) == ['user_01', 'user_02', 'user_04'], 'Check known users changes'
+    assert __test_variable.get_revision(SYNC_KNOWN_USERS) == 5, 'Check get_revision'
+    __test_variable.apply_known_users_changes(['user_03'], [], revision=6)
+    __test_variable.apply_contacts_changes(['user_01', 'user_03'], ['user_02'], revision=2)
+    assert sorted(__test_variable.get_contacts()) == ['user_01', 'user_03'], 'Check contacts changes'
+    __test_variable.refresh_contacts(['user_01'], revision=3)
+    assert __test_variable.get_revision(SYNC_CONTACTS) == 3, 'Check get_revision'
     __test_variable.save_message('user_01', 'out', 'Йоханга')
     __test_variable.save_message('user_02', 'in', 'Привет!')
+    __test_variable.save_group_message('user_01', 'user_02', 'in', 'Привет, группа!')
+    assert len(__test_variable.get_msg_history('user_01')) == 1, 'Check group history is stored separately'
+    assert [el['sender'] for el in __test_variable.get_group_history('user_01')] == ['user_02'], \
+        'Check get_group_history'
     pprint(__test_variable.get_contacts())
     print('=' * 42)
     pprint(__test_variable.get_known_users())
@@ -10,6 +10,15 @@ class KnownUser:
         return f'{self.__class__.__name__}(id={self.id!r}, username={self.username!r})'
 
 
+class SyncState:
+    def __init__(self, name, revision=0):
+        self.name = name
+        self.revision = revision
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(name={self.name!r}, revision={self.revision!r})'
+
+
 class MessageHistory:
     def __init__(self, username, direction, msg_text, created_at=None):
         self.id = None
@@ -22,6 +31,20 @@ class MessageHistory:
         return f'{self.__class__.__name__}(id={self.id!r}, username={self.username!r}, direction={self.direction!r})'
 
 
+class GroupMessageHistory:
+    def __init__(self, group_name, sender, direction, msg_text, created_at=None):
+        self.id = None
+        self.group_name = group_name
+        self.sender = sender
+        self.direction = direction
+        self.msg_text = msg_text
+        self.created_at = created_at or datetime.now()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(id={self.id!r}, group_name={self.group_name!r}, '
+                f'sender={self.sender!r}, direction={self.direction!r})')
+
+
 class Contact:
     def __init__(self, username):
         self.id = None
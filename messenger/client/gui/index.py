@@ -88,12 +88,16 @@ class ClientMainWindow(QMainWindow):
 
         self.history_list_update()
 
+    # Контакты в сети (по событиям присутствия от сервера) выделяются цветом
     def clients_list_update(self):
         contacts_list = self.database.get_contacts()
+        online = self.transport.online_contacts if self.transport else set()
         self.contacts_model = QStandardItemModel()
         for index in sorted(contacts_list):
             item = QStandardItem(index)
             item.setEditable(False)
+            if index in online:
+                item.setForeground(QBrush(QColor(0, 128, 0)))
             self.contacts_model.appendRow(item)
         self.ui.list_contacts.setModel(self.contacts_model)
 
@@ -209,6 +213,12 @@ class ClientMainWindow(QMainWindow):
         self.messages.warning(self, 'Сбой соединения', 'Потеряно соединение с сервером. ')
         self.close()
 
+    # Слот изменения состояния контактов (вход или выход)
+    @pyqtSlot()
+    def contacts_status_changed(self):
+        self.clients_list_update()
+
     def make_connection(self, trans_obj):
         trans_obj.new_message.connect(self.message)
         trans_obj.connection_lost.connect(self.connection_lost)
+        trans_obj.contacts_status_changed.connect(self.contacts_status_changed)
@@ -5,7 +5,7 @@ import logging
 import threading
 from PyQt5.QtCore import pyqtSignal, QObject
 
-from client.db.database import ClientDatabase
+from client.db.database import ClientDatabase, SYNC_CONTACTS, SYNC_KNOWN_USERS
 from client import logger
 from common import settings, utils
 from common.errors import ServerError
@@ -17,6 +17,10 @@ LOGGER = logging.getLogger(LOGGER_NAME)
 class ClientTransport(threading.Thread, QObject):
     new_message = pyqtSignal(str)
     connection_lost = pyqtSignal()
+    contacts_status_changed = pyqtSignal()
+    new_group_message = pyqtSignal(str)
+    # Кодеки, предлагаемые серверу, в порядке предпочтения
+    CODECS = (settings.CODEC_BINARY, settings.CODEC_JSON)
 
     def __init__(self, port, ip_address, username, password, database: ClientDatabase):
         threading.Thread.__init__(self)
@@ -26,12 +30,13 @@ class ClientTransport(threading.Thread, QObject):
         self.username = username
         self.password_hash = utils.get_hash(password, username)
         self.transport = None
+        self.buffer = utils.MessageBuffer()
         self.log_flag = threading.Lock()
+        self.online_contacts = set()  # контакты в сети по событиям присутствия от сервера
         self.connection_init(port, ip_address)
         # Обновляем таблицы известных пользователей и контактов
         try:
-            self.user_list_update()
-            self.contacts_list_update()
+            self.lists_update()
         except OSError as err:
             if err.errno:
                 msg = 'Потеряно соединение с сервером'
@@ -71,7 +76,9 @@ class ClientTransport(threading.Thread, QObject):
         try:
             with self.log_flag:
                 utils.send_message_to_socket(self.transport, self.create_presence())
-                self.process_server_ans(utils.get_message_from_socket(self.transport))
+                answer = utils.get_message_from_socket(self.transport, self.buffer)
+                self.process_server_ans(answer)
+                self.apply_features(answer.get(settings.FEATURES))
         except (OSError, json.JSONDecodeError):
             msg = 'Потеряно соединение с сервером'
             LOGGER.critical(msg)
@@ -88,11 +95,26 @@ class ClientTransport(threading.Thread, QObject):
             settings.USER: {
                 settings.ACCOUNT_NAME: self.username,
                 settings.PASSWORD_HASH: self.password_hash
+            },
+            settings.FEATURES: {
+                settings.FRAMING: [settings.FRAMING_LENGTH_PREFIX],
+                settings.CODEC: list(self.CODECS),
+                settings.COMPRESSION: [settings.COMPRESSION_ZLIB]
             }
         }
         LOGGER.debug(f'Сформировано {settings.PRESENCE} сообщение для пользователя {self.username}')
         return out
 
+    # Функция применения возможностей протокола, принятых сервером.
+    # Старый сервер не присылает FEATURES - остаёмся на прежнем формате.
+    def apply_features(self, features):
+        if not isinstance(features, dict):
+            return
+        # Кадры, пришедшие вместе с ответом на presence, уже в новом формате
+        self.buffer.pending.extend(self.buffer.apply_features(features))
+        LOGGER.debug(f'Согласован формат сообщений: заголовок длины - {self.buffer.framed}, '
+                     f'кодек - {self.buffer.codec.name}, сжатие - {self.buffer.compress}')
+
     def process_server_ans(self, message):
         LOGGER.debug(f'Разбор сообщения от сервера: {message}')
 
@@ -117,41 +139,135 @@ class ClientTransport(threading.Thread, QObject):
             self.database.save_message(message[settings.SENDER], 'in', message[settings.MESSAGE_TEXT])
             self.new_message.emit(message[settings.SENDER])
 
-    # Функция, обновляющая контакт - лист с сервера
-    def contacts_list_update(self):
-        LOGGER.debug(f'Запрос контакт листа для пользователя {self.name}')
+        # Сообщение группы сохраняется в историю беседы группы (отдельно от бесед с пользователями)
+        elif message.get(settings.ACTION) == settings.GROUP_MESSAGE \
+                and settings.SENDER in message \
+                and settings.GROUP in message \
+                and settings.MESSAGE_TEXT in message:
+            LOGGER.debug(f'Получено сообщение группы {message[settings.GROUP]} от {message[settings.SENDER]}')
+            self.database.save_group_message(message[settings.GROUP], message[settings.SENDER], 'in',
+                                             message[settings.MESSAGE_TEXT])
+            self.new_group_message.emit(message[settings.GROUP])
+
+        # События присутствия контактов: состояние при входе, затем только изменения
+        elif message.get(settings.ACTION) == settings.STATUS:
+            self.online_contacts.difference_update(message.get(settings.OFFLINE) or [])
+            self.online_contacts.update(message.get(settings.ONLINE) or [])
+            LOGGER.debug(f'Контакты в сети: {sorted(self.online_contacts)}')
+            self.contacts_status_changed.emit()
+
+    # Функция получения ответа на запрос. Сообщения пользователей, пришедшие раньше ответа
+    # (например, отложенные сервером до нашего подключения), обрабатываются по пути.
+    def get_response(self):
+        while True:
+            message = utils.get_message_from_socket(self.transport, self.buffer)
+            if settings.RESPONSE in message:
+                return message
+            self.process_server_ans(message)
+
+    # Функция отправки пакета запросов: один кадр с запросами, один кадр с ответами на них (по порядку).
+    # Сервер, не поддерживающий пакеты, отвечает ошибкой - ServerError.
+    def batch_request(self, requests):
         req = {
-            settings.ACTION: settings.GET_CONTACTS,
+            settings.ACTION: settings.BATCH,
             settings.TIME: time.time(),
-            settings.USER: self.username
+            settings.ACCOUNT_NAME: self.username,
+            settings.LIST_INFO: requests,
         }
+        with self.log_flag:
+            utils.send_message_to_socket(self.transport, req, self.buffer)
+            ans = self.get_response()
+        if ans.get(settings.RESPONSE) != 207:
+            self.process_server_ans(ans)
+            raise ServerError('Сервер не поддерживает пакеты запросов')
+        return ans[settings.LIST_INFO]
+
+    # Функция обновления списков известных пользователей и контактов за один запрос к серверу
+    def lists_update(self):
+        try:
+            users_ans, contacts_ans = self.batch_request([self.create_users_request(),
+                                                          self.create_contacts_request()])
+        except ServerError:
+            LOGGER.debug('Пакеты запросов не поддерживаются сервером, списки запрашиваются по одному')
+            self.user_list_update()
+            self.contacts_list_update()
+            return
+        self.apply_users_answer(users_ans)
+        self.apply_contacts_answer(contacts_ans)
+
+    # Функция, обновляющая контакт - лист с сервера (изменения после сохранённой ревизии)
+    def contacts_list_update(self):
+        LOGGER.debug(f'Запрос контакт листа для пользователя {self.name}')
+        req = self.create_contacts_request()
         LOGGER.debug(f'Сформирован запрос {req}')
         with self.log_flag:
-            utils.send_message_to_socket(self.transport, req)
-            ans = utils.get_message_from_socket(self.transport)
+            utils.send_message_to_socket(self.transport, req, self.buffer)
+            ans = self.get_response()
         LOGGER.debug(f'Получен ответ {ans}')
+        self.apply_contacts_answer(ans)
+
+    def create_contacts_request(self):
+        return {
+            settings.ACTION: settings.GET_CONTACTS,
+            settings.TIME: time.time(),
+            settings.USER: self.username,
+            settings.REVISION: self.database.get_revision(SYNC_CONTACTS),
+        }
+
+    def apply_contacts_answer(self, ans):
         if settings.RESPONSE in ans and ans[settings.RESPONSE] == 202:
-            for contact in ans[settings.LIST_INFO]:
-                self.database.add_contact(contact)
+            revision = ans.get(settings.REVISION, 0)
+            if settings.REMOVED in ans:
+                self.database.apply_contacts_changes(ans[settings.LIST_INFO], ans[settings.REMOVED], revision)
+            else:
+                self.database.refresh_contacts(ans[settings.LIST_INFO], revision)
         else:
             LOGGER.error('Не удалось обновить список контактов.')
 
     # Функция обновления таблицы известных пользователей.
+    # Сервер присылает только изменения после сохранённой ревизии справочника
+    # (или полный список - без поля REMOVED).
     def user_list_update(self):
         LOGGER.debug(f'Запрос списка известных пользователей {self.username}')
-        req = {
+        req = self.create_users_request()
+        with self.log_flag:
+            utils.send_message_to_socket(self.transport, req, self.buffer)
+            ans = self.get_response()
+        self.apply_users_answer(ans)
+
+    def create_users_request(self):
+        return {
             settings.ACTION: settings.USERS_REQUEST,
             settings.TIME: time.time(),
-            settings.ACCOUNT_NAME: self.username
+            settings.ACCOUNT_NAME: self.username,
+            settings.REVISION: self.database.get_revision(SYNC_KNOWN_USERS),
         }
-        with self.log_flag:
-            utils.send_message_to_socket(self.transport, req)
-            ans = utils.get_message_from_socket(self.transport)
+
+    def apply_users_answer(self, ans):
         if settings.RESPONSE in ans and ans[settings.RESPONSE] == 202:
-            self.database.refresh_known_users(ans[settings.LIST_INFO])
+            revision = ans.get(settings.REVISION, 0)
+            if settings.REMOVED in ans:
+                self.database.apply_known_users_changes(ans[settings.LIST_INFO], ans[settings.REMOVED], revision)
+            else:
+                self.database.refresh_known_users(ans[settings.LIST_INFO], revision)
         else:
             LOGGER.error('Не удалось обновить список известных пользователей.')
 
+    # Функция изменения нескольких контактов на сервере: пакетами, по одному запросу к серверу на пакет.
+    # При отказе сервера хотя бы по одному контакту - ServerError (остальные изменения пакета применены).
+    def edit_contacts(self, added=(), removed=()):
+        requests = [{settings.ACTION: action, settings.TIME: time.time(),
+                     settings.USER: self.username, settings.ACCOUNT_NAME: contact}
+                    for action, contacts in ((settings.ADD_CONTACT, added), (settings.REMOVE_CONTACT, removed))
+                    for contact in contacts]
+        errors = []
+        for start in range(0, len(requests), settings.MAX_BATCH_REQUESTS):
+            for ans in self.batch_request(requests[start:start + settings.MAX_BATCH_REQUESTS]):
+                if ans.get(settings.RESPONSE) == 400:
+                    errors.append(f'{ans[settings.ERROR]}')
+        if errors:
+            raise ServerError('; '.join(errors))
+
     # Функция сообщающая на сервер о добавлении нового контакта
     def add_contact(self, contact):
         LOGGER.debug(f'Создание контакта {contact}')
@@ -162,8 +278,8 @@ class ClientTransport(threading.Thread, QObject):
             settings.ACCOUNT_NAME: contact
         }
         with self.log_flag:
-            utils.send_message_to_socket(self.transport, req)
-            self.process_server_ans(utils.get_message_from_socket(self.transport))
+            utils.send_message_to_socket(self.transport, req, self.buffer)
+            self.process_server_ans(self.get_response())
 
     # Функция удаления клиента на сервере
     def remove_contact(self, contact):
@@ -175,8 +291,8 @@ class ClientTransport(threading.Thread, QObject):
             settings.ACCOUNT_NAME: contact
         }
         with self.log_flag:
-            utils.send_message_to_socket(self.transport, req)
-            self.process_server_ans(utils.get_message_from_socket(self.transport))
+            utils.send_message_to_socket(self.transport, req, self.buffer)
+            self.process_server_ans(self.get_response())
 
     # Функция закрытия соединения, отправляет сообщение о выходе.
     def transport_shutdown(self):
@@ -188,7 +304,7 @@ class ClientTransport(threading.Thread, QObject):
         }
         with self.log_flag:
             try:
-                utils.send_message_to_socket(self.transport, message)
+                utils.send_message_to_socket(self.transport, message, self.buffer)
             except OSError:
                 pass
         LOGGER.debug('Транспорт завершает работу.')
@@ -207,10 +323,61 @@ class ClientTransport(threading.Thread, QObject):
 
         # Необходимо дождаться освобождения сокета для отправки сообщения
         with self.log_flag:
-            utils.send_message_to_socket(self.transport, message_dict)
-            self.process_server_ans(utils.get_message_from_socket(self.transport))
+            utils.send_message_to_socket(self.transport, message_dict, self.buffer)
+            self.process_server_ans(self.get_response())
             LOGGER.info(f'Отправлено сообщение для пользователя {to}')
 
+    # Функция отправки сообщения в группу: сервер рассылает его всем участникам
+    def send_group_message(self, group, message):
+        message_dict = {
+            settings.ACTION: settings.GROUP_MESSAGE,
+            settings.SENDER: self.username,
+            settings.GROUP: group,
+            settings.TIME: time.time(),
+            settings.MESSAGE_TEXT: message
+        }
+        with self.log_flag:
+            utils.send_message_to_socket(self.transport, message_dict, self.buffer)
+            self.process_server_ans(self.get_response())
+            LOGGER.info(f'Отправлено сообщение в группу {group}')
+        self.database.save_group_message(group, self.username, 'out', message)
+
+    # Функции управления группами: создание, добавление и исключение участника (или выход из группы)
+    def create_group(self, group):
+        self._group_request(settings.CREATE_GROUP, group)
+
+    def add_group_member(self, group, username):
+        self._group_request(settings.ADD_MEMBER, group, username)
+
+    def remove_group_member(self, group, username):
+        self._group_request(settings.REMOVE_MEMBER, group, username)
+
+    def _group_request(self, action, group, username=None):
+        req = {
+            settings.ACTION: action,
+            settings.TIME: time.time(),
+            settings.USER: self.username,
+            settings.GROUP: group
+        }
+        if username is not None:
+            req[settings.ACCOUNT_NAME] = username
+        with self.log_flag:
+            utils.send_message_to_socket(self.transport, req, self.buffer)
+            self.process_server_ans(self.get_response())
+
+    # Функция получения списка групп пользователя
+    def get_groups(self):
+        req = {
+            settings.ACTION: settings.GET_GROUPS,
+            settings.TIME: time.time(),
+            settings.USER: self.username
+        }
+        with self.log_flag:
+            utils.send_message_to_socket(self.transport, req, self.buffer)
+            ans = self.get_response()
+        self.process_server_ans(ans)
+        return ans.get(settings.LIST_INFO) or []
+
     def run(self):
         LOGGER.debug('Запущен процесс - приёмник сообщений с сервера.')
         while self.running:
@@ -220,7 +387,7 @@ class ClientTransport(threading.Thread, QObject):
             with self.log_flag:
                 try:
                     self.transport.settimeout(0.5)
-                    message = utils.get_message_from_socket(self.transport)
+                    message = utils.get_message_from_socket(self.transport, self.buffer)
                 except OSError as err:
                     if err.errno:
                         # выход по таймауту вернёт номер ошибки err.errno равный None
@@ -230,7 +397,7 @@ class ClientTransport(threading.Thread, QObject):
                         self.connection_lost.emit()
                 # Проблемы с соединением
                 except (ConnectionError, ConnectionAbortedError,
-                        ConnectionResetError, json.JSONDecodeError, TypeError):
+                        ConnectionResetError, ValueError, TypeError):
                     LOGGER.debug(f'Потеряно соединение с сервером.')
                     self.running = False
                     self.connection_lost.emit()
@@ -238,5 +405,8 @@ class ClientTransport(threading.Thread, QObject):
                 else:
                     LOGGER.debug(f'Принято сообщение с сервера: {message}')
                     self.process_server_ans(message)
+                    # Разбираем сообщения, пришедшие вместе с первым
+                    while self.buffer.pending:
+                        self.process_server_ans(self.buffer.pending.popleft())
                 finally:
                     self.transport.settimeout(5)
@@ -2,28 +2,62 @@ DEFAULT_ENCODING = 'utf-8'
 DEFAULT_IP_ADDRESS = '127.0.0.1'
 DEFAULT_PORT = 7777
 MAX_PACKET_LENGTH = 4096
+MAX_MESSAGE_LENGTH = 16 * 1024 * 1024
+MAX_UNFRAMED_LENGTH = MAX_PACKET_LENGTH  # Сообщение без заголовка длины (старый формат) - не больше одного пакета
+MAX_BATCH_REQUESTS = 256  # Запросов в одном пакете (BATCH)
+MAX_NESTING_DEPTH = 32  # Вложенность списков и словарей в сообщении
+COMPRESSION_THRESHOLD = 1024  # Тела кадров меньшего размера не сжимаются
 MIN_ADMISSIBLE_PORT = 1024
 MAX_ADMISSIBLE_PORT = 65535
 # -----------------------------------------------------------------------------
 ACTION = 'action'
 ACCOUNT_NAME = 'account_name'
 ADD_CONTACT = 'add'
+ADD_MEMBER = 'add_member'
+BATCH = 'batch'
+CREATE_GROUP = 'create_group'
 DESTINATION = 'to'
 GET_CONTACTS = 'get_contacts'
+GET_GROUPS = 'get_groups'
+GROUP = 'group'
+GROUP_MESSAGE = 'group_message'
 ERROR = 'error'
 EXIT = 'exit'
+FEATURES = 'features'
+FRAMING = 'framing'
+FRAMING_LENGTH_PREFIX = 'length_prefix'
+CODEC = 'codec'
+CODEC_JSON = 'json'
+CODEC_BINARY = 'binary'
+COMPRESSION = 'compression'
+COMPRESSION_ZLIB = 'zlib'
 LIST_INFO = 'data_list'
 MESSAGE = 'message'
 MESSAGE_TEXT = 'mess_text'
+OFFLINE = 'offline'
+ONLINE = 'online'
 PRESENCE = 'presence'
 REMOVE_CONTACT = 'remove'
+REMOVE_MEMBER = 'remove_member'
+REMOVED = 'removed'
+REVISION = 'revision'
 PASSWORD_HASH = 'password_hash'
 RESPONSE = 'response'
 SENDER = 'from'
+STATUS = 'status'
 TIME = 'time'
 USER = 'user'
 USERS_REQUEST = 'get_users'
 # -----------------------------------------------------------------------------
 RESPONSE_200 = {RESPONSE: 200}
 RESPONSE_202 = {RESPONSE: 202, LIST_INFO: None}
+RESPONSE_207 = {RESPONSE: 207, LIST_INFO: None}  # ответы на запросы пакета, по порядку
 RESPONSE_400 = {RESPONSE: 400, ERROR: None}
+# -----------------------------------------------------------------------------
+# Теги полей двоичного кодека: номер тега - позиция в кортеже + 1.
+# Порядок - часть протокола, новые поля добавляются только в конец.
+BINARY_FIELD_TAGS = (
+    ACTION, ACCOUNT_NAME, DESTINATION, ERROR, FEATURES, FRAMING, LIST_INFO,
+    MESSAGE_TEXT, PASSWORD_HASH, RESPONSE, SENDER, TIME, USER, CODEC, COMPRESSION, REVISION, REMOVED, GROUP,
+    ONLINE, OFFLINE,
+)
@@ -1,31 +1,421 @@
 import binascii
+import errno
 import hashlib
 import ipaddress
 import json
 import socket
-from typing import Union
+import struct
+import zlib
+from collections import deque
+from typing import List, Optional, Union
 
 from common.settings import (
-    MAX_PACKET_LENGTH, DEFAULT_ENCODING, MIN_ADMISSIBLE_PORT, MAX_ADMISSIBLE_PORT
+    MAX_PACKET_LENGTH, MAX_MESSAGE_LENGTH, MAX_UNFRAMED_LENGTH, MAX_NESTING_DEPTH, DEFAULT_ENCODING,
+    MIN_ADMISSIBLE_PORT, MAX_ADMISSIBLE_PORT,
+    FRAMING, FRAMING_LENGTH_PREFIX, CODEC, CODEC_JSON, CODEC_BINARY, BINARY_FIELD_TAGS,
+    COMPRESSION, COMPRESSION_ZLIB, COMPRESSION_THRESHOLD,
 )
 
+# Заголовок кадра: длина тела (4 байта, big-endian) и байт флагов.
+# Младшие биты флагов - номер кодека тела кадра, старший - тело сжато zlib.
+FRAME_HEADER = struct.Struct('!IB')
+FRAME_CODEC_MASK = 0x0F
+FRAME_COMPRESSED = 0x80
+COMPRESSION_LEVEL = 6
 
-def get_message_from_socket(sock: socket.socket) -> dict:
-    """Приём и декодирования сообщения из заданного сокета"""
-    data = sock.recv(MAX_PACKET_LENGTH).decode(DEFAULT_ENCODING)
-    response = json.loads(data)
+
+def decode_message(data: bytes) -> dict:
+    """Декодирование сообщения из байтового представления"""
+    try:
+        response = json.loads(data.decode(DEFAULT_ENCODING))
+    except RecursionError:
+        raise ValueError('Превышена допустимая вложенность сообщения')
     if not isinstance(response, dict):
         raise TypeError
     return response
 
 
-def send_message_to_socket(sock: socket.socket, message: dict):
-    """Кодирование переданного сообщения и отправка по заданному сокету"""
+class JsonCodec:
+    """Кодек JSON - формат по умолчанию, единственный для сообщений без заголовка длины"""
+    name = CODEC_JSON
+    flag = 0
+
+    @staticmethod
+    def encode(message: dict) -> bytes:
+        return json.dumps(message).encode(DEFAULT_ENCODING)
+
+    @staticmethod
+    def decode(data: bytes) -> dict:
+        return decode_message(data)
+
+
+class BinaryCodec:
+    """Компактный двоичный кодек.
+
+    Значение - байт типа и данные. Имена известных полей заменяются тегами из
+    BINARY_FIELD_TAGS (один байт), остальные ключи передаются строкой после байта 0.
+    Длина строки или коллекции - один байт, если она меньше 255, иначе 0xFF и 4 байта.
+    Список строк без символа '\\0' передаётся одной строкой с этим разделителем.
+    Вложенность списков и словарей ограничена MAX_NESTING_DEPTH (ValueError).
+    """
+    name = CODEC_BINARY
+    flag = 1
+
+    NONE, FALSE, TRUE, INT16, INT64, FLOAT, STR, LIST, DICT, STR_LIST = range(10)
+    _INT16 = struct.Struct('!h')
+    _INT64 = struct.Struct('!q')
+    _FLOAT = struct.Struct('!d')
+    _SIZE = struct.Struct('!I')
+    _CONTAINERS = (list, tuple, dict)
+
+    def __init__(self, fields=BINARY_FIELD_TAGS):
+        self._tags = {field: tag for tag, field in enumerate(fields, 1)}
+        self._fields = (None,) + tuple(fields)
+        self._encoders = {
+            type(None): self._encode_none, bool: self._encode_bool, int: self._encode_int,
+            float: self._encode_float, str: self._encode_str, list: self._encode_list,
+            tuple: self._encode_list, dict: self._encode_dict,
+        }
+        self._containers = (self.LIST, self.DICT)
+        self._decoders = (
+            self._decode_none, self._decode_false, self._decode_true, self._decode_int16,
+            self._decode_int64, self._decode_float, self._decode_str, self._decode_list, self._decode_dict,
+            self._decode_str_list,
+        )
+
+    def encode(self, message: dict) -> bytes:
+        out = bytearray()
+        self._encode_value(message, out)
+        return bytes(out)
+
+    def decode(self, data: bytes) -> dict:
+        try:
+            message, offset = self._decode_value(data, 0)
+        except (IndexError, struct.error, UnicodeDecodeError) as err:
+            raise ValueError(f'Некорректное двоичное сообщение: {err}')
+        if offset != len(data):
+            raise ValueError('Лишние данные после двоичного сообщения')
+        if not isinstance(message, dict):
+            raise TypeError
+        return message
+
+    # -------------------------------------------------------------------------
+    def _encode_value(self, value, out: bytearray, depth: int = 0):
+        encoder = self._encoders.get(type(value))
+        if encoder is None:
+            raise ValueError(f'Тип {type(value).__name__} не поддерживается двоичным кодеком')
+        if type(value) in self._CONTAINERS:
+            if depth >= MAX_NESTING_DEPTH:
+                raise ValueError('Превышена допустимая вложенность сообщения')
+            encoder(value, out, depth + 1)
+        else:
+            encoder(value, out)
+
+    def _encode_size(self, size: int, out: bytearray):
+        if size < 0xFF:
+            out.append(size)
+        else:
+            out.append(0xFF)
+            out += self._SIZE.pack(size)
+
+    def _encode_none(self, value, out: bytearray):
+        out.append(self.NONE)
+
+    def _encode_bool(self, value: bool, out: bytearray):
+        out.append(self.TRUE if value else self.FALSE)
+
+    def _encode_int(self, value: int, out: bytearray):
+        if -0x8000 <= value < 0x8000:
+            out.append(self.INT16)
+            out += self._INT16.pack(value)
+        else:
+            out.append(self.INT64)
+            try:
+                out += self._INT64.pack(value)
+            except struct.error as err:
+                raise ValueError(f'{err}')
+
+    def _encode_float(self, value: float, out: bytearray):
+        out.append(self.FLOAT)
+        out += self._FLOAT.pack(value)
+
+    def _encode_bytes(self, data: bytes, out: bytearray):
+        self._encode_size(len(data), out)
+        out += data
+
+    def _encode_str(self, value: str, out: bytearray):
+        out.append(self.STR)
+        self._encode_bytes(value.encode(DEFAULT_ENCODING), out)
+
+    def _encode_list(self, value: list, out: bytearray, depth: int):
+        if value and all(type(item) is str for item in value):
+            # Список строк (имена пользователей) - одна строка с разделителем '\0'
+            text = '\0'.join(value)
+            if text.count('\0') == len(value) - 1:
+                out.append(self.STR_LIST)
+                self._encode_bytes(text.encode(DEFAULT_ENCODING), out)
+                return
+        out.append(self.LIST)
+        self._encode_size(len(value), out)
+        for item in value:
+            self._encode_value(item, out, depth)
+
+    def _encode_dict(self, value: dict, out: bytearray, depth: int):
+        out.append(self.DICT)
+        self._encode_size(len(value), out)
+        for key, item in value.items():
+            tag = self._tags.get(key)
+            if tag:
+                out.append(tag)
+            elif isinstance(key, str):
+                out.append(0)
+                self._encode_bytes(key.encode(DEFAULT_ENCODING), out)
+            else:
+                raise ValueError(f'Ключ {key!r} не поддерживается двоичным кодеком')
+            self._encode_value(item, out, depth)
+
+    # -------------------------------------------------------------------------
+    def _decode_value(self, data: bytes, offset: int, depth: int = 0):
+        kind = data[offset]
+        if kind in self._containers:
+            if depth >= MAX_NESTING_DEPTH:
+                raise ValueError('Превышена допустимая вложенность сообщения')
+            return self._decoders[kind](data, offset + 1, depth + 1)
+        return self._decoders[kind](data, offset + 1)
+
+    def _decode_size(self, data: bytes, offset: int):
+        size = data[offset]
+        if size < 0xFF:
+            return size, offset + 1
+        return self._SIZE.unpack_from(data, offset + 1)[0], offset + 5
+
+    def _decode_bytes(self, data: bytes, offset: int):
+        size, offset = self._decode_size(data, offset)
+        end = offset + size
+        if end > len(data):
+            raise IndexError('строка выходит за границу сообщения')
+        return data[offset:end].decode(DEFAULT_ENCODING), end
+
+    @staticmethod
+    def _decode_none(data: bytes, offset: int):
+        return None, offset
+
+    @staticmethod
+    def _decode_false(data: bytes, offset: int):
+        return False, offset
+
+    @staticmethod
+    def _decode_true(data: bytes, offset: int):
+        return True, offset
+
+    def _decode_int16(self, data: bytes, offset: int):
+        return self._INT16.unpack_from(data, offset)[0], offset + 2
+
+    def _decode_int64(self, data: bytes, offset: int):
+        return self._INT64.unpack_from(data, offset)[0], offset + 8
+
+    def _decode_float(self, data: bytes, offset: int):
+        return self._FLOAT.unpack_from(data, offset)[0], offset + 8
+
+    def _decode_str(self, data: bytes, offset: int):
+        return self._decode_bytes(data, offset)
+
+    def _decode_list(self, data: bytes, offset: int, depth: int):
+        size, offset = self._decode_size(data, offset)
+        items = []
+        for _ in range(size):
+            item, offset = self._decode_value(data, offset, depth)
+            items.append(item)
+        return items, offset
+
+    def _decode_str_list(self, data: bytes, offset: int):
+        text, offset = self._decode_bytes(data, offset)
+        return text.split('\0'), offset
+
+    def _decode_dict(self, data: bytes, offset: int, depth: int):
+        size, offset = self._decode_size(data, offset)
+        result = dict()
+        for _ in range(size):
+            tag = data[offset]
+            if tag:
+                key = self._fields[tag]
+                offset += 1
+            else:
+                key, offset = self._decode_bytes(data, offset + 1)
+            result[key], offset = self._decode_value(data, offset, depth)
+        return result, offset
+
+
+JSON_CODEC = JsonCodec()
+BINARY_CODEC = BinaryCodec()
+CODECS = {codec.name: codec for codec in (JSON_CODEC, BINARY_CODEC)}
+_CODECS_BY_FLAG = {codec.flag: codec for codec in CODECS.values()}
+
+
+def encode_message(message: dict, framed: bool = False, codec=JSON_CODEC, compress: bool = False) -> bytes:
+    """Кодирование сообщения в байтовое представление (при framed - с заголовком длины).
+
+    При compress тело кадра от COMPRESSION_THRESHOLD байт сжимается, если это уменьшает его размер.
+    """
     if not isinstance(message, dict):
         raise ValueError
-    data = json.dumps(message)
-    data = data.encode(DEFAULT_ENCODING)
-    sock.send(data)
+    data = codec.encode(message)
+    if framed:
+        flags = codec.flag
+        if compress and len(data) >= COMPRESSION_THRESHOLD:
+            packed = zlib.compress(data, COMPRESSION_LEVEL)
+            if len(packed) < len(data):
+                data, flags = packed, flags | FRAME_COMPRESSED
+        return FRAME_HEADER.pack(len(data), flags) + data
+    if codec is not JSON_CODEC:
+        raise ValueError('Сообщения без заголовка длины передаются только в JSON')
+    return data
+
+
+def decompress_frame(data: bytes) -> bytes:
+    """Распаковка тела кадра с ограничением размера результата"""
+    decompressor = zlib.decompressobj()
+    try:
+        result = decompressor.decompress(data, MAX_MESSAGE_LENGTH)
+    except zlib.error as err:
+        raise ValueError(f'Некорректное сжатое сообщение: {err}')
+    if decompressor.unconsumed_tail:
+        raise ValueError('Превышен допустимый размер распакованного сообщения')
+    return result
+
+
+class MessageBuffer:
+    """Буфер сборки сообщений из потока байт одного соединения.
+
+    В режиме framed каждое сообщение предваряется заголовком FRAME_HEADER.
+    Без него (старые клиенты) сообщения - идущие подряд JSON-объекты.
+    За одно чтение из сокета может быть собрано ноль, одно или несколько сообщений.
+    """
+
+    def __init__(self, framed: bool = False):
+        self.framed = framed
+        self.codec = JSON_CODEC  # Кодек исходящих сообщений; входящие декодируются по флагам кадра
+        self.compress = False  # Сжимать крупные исходящие кадры
+        self.pending = deque()  # Собранные, но ещё не обработанные сообщения
+        self._data = bytearray()
+
+    def apply_features(self, features: dict) -> List[dict]:
+        """Переход на формат, согласованный в presence-сообщении.
+
+        Возвращает сообщения, уже принятые в новом формате вместе с ответом на presence.
+        """
+        if features.get(FRAMING) == FRAMING_LENGTH_PREFIX:
+            self.framed = True
+        codec = CODECS.get(features.get(CODEC))
+        if codec and self.framed:
+            self.codec = codec
+        if features.get(COMPRESSION) == COMPRESSION_ZLIB and self.framed:
+            self.compress = True
+        if self.framed and self._data:
+            return self._extract_frames()
+        return []
+
+    def encode(self, message: dict) -> bytes:
+        """Кодирование исходящего сообщения в согласованном формате"""
+        return encode_message(message, self.framed, self.codec, self.compress)
+
+    def feed(self, data: bytes) -> List[dict]:
+        """Добавление принятых байт, возвращает список полностью собранных сообщений"""
+        self._data += data
+        if self.framed:
+            return self._extract_frames()
+        return self._extract_json()
+
+    def _extract_frames(self) -> List[dict]:
+        messages = []
+        offset = 0
+        size = len(self._data)
+        while size - offset >= FRAME_HEADER.size:
+            length, flags = FRAME_HEADER.unpack_from(self._data, offset)
+            if length > MAX_MESSAGE_LENGTH:
+                raise ValueError(f'Превышен допустимый размер сообщения: {length}')
+            codec = _CODECS_BY_FLAG.get(flags & FRAME_CODEC_MASK)
+            if codec is None:
+                raise ValueError(f'Неизвестный кодек кадра: {flags & FRAME_CODEC_MASK}')
+            end = offset + FRAME_HEADER.size + length
+            if end > size:
+                break
+            body = bytes(self._data[offset + FRAME_HEADER.size:end])
+            if flags & FRAME_COMPRESSED:
+                body = decompress_frame(body)
+            messages.append(codec.decode(body))
+            offset = end
+        del self._data[:offset]
+        return messages
+
+    def _extract_json(self) -> List[dict]:
+        """Сборка JSON-объектов до первого байта, не являющегося их продолжением.
+
+        Остаток после хотя бы одного собранного сообщения сохраняется в буфере: это могут быть
+        кадры, отправленные сервером сразу после ответа на presence (см. apply_features).
+        Недособранное сообщение ограничено MAX_UNFRAMED_LENGTH: буфер разбирается заново
+        при каждом чтении, и без ограничения его разбор обходился бы всё дороже.
+        """
+        invalid = None
+        try:
+            text = self._data.decode(DEFAULT_ENCODING)
+        except UnicodeDecodeError as err:
+            # Последний символ мог прийти не полностью - дожидаемся остатка
+            if err.reason != 'unexpected end of data':
+                invalid = err
+            text = self._data[:err.start].decode(DEFAULT_ENCODING)
+        decoder = json.JSONDecoder()
+        messages = []
+        index = 0
+        while True:
+            while index < len(text) and text[index].isspace():
+                index += 1
+            if index == len(text):
+                break
+            try:
+                message, index = decoder.raw_decode(text, index)
+            except RecursionError:
+                raise ValueError('Превышена допустимая вложенность сообщения')
+            except json.JSONDecodeError as err:
+                if messages:
+                    break
+                # Ошибка в конце текста или незакрытая строка - сообщение пришло не полностью
+                if err.pos < len(text) and not err.msg.startswith('Unterminated string'):
+                    raise
+                if len(self._data) > MAX_UNFRAMED_LENGTH:
+                    raise ValueError('Превышен допустимый размер сообщения')
+                break
+            if not isinstance(message, dict):
+                raise TypeError
+            messages.append(message)
+        if invalid is not None and not messages:
+            raise ValueError(f'{invalid}')
+        del self._data[:len(text[:index].encode(DEFAULT_ENCODING))]
+        return messages
+
+
+def get_message_from_socket(sock: socket.socket, buffer: Optional[MessageBuffer] = None) -> dict:
+    """Приём и декодирования сообщения из заданного сокета.
+
+    Без буфера читается один пакет (поведение клиентов без поддержки кадров).
+    С буфером чтение продолжается до сборки сообщения, лишние сообщения остаются в буфере.
+    """
+    if buffer is None:
+        return decode_message(sock.recv(MAX_PACKET_LENGTH))
+    while not buffer.pending:
+        data = sock.recv(MAX_PACKET_LENGTH)
+        if not data:
+            raise ConnectionResetError(errno.ECONNRESET, 'Соединение закрыто удалённой стороной')
+        buffer.pending.extend(buffer.feed(data))
+    return buffer.pending.popleft()
+
+
+def send_message_to_socket(sock: socket.socket, message: dict, buffer: Optional[MessageBuffer] = None):
+    """Кодирование переданного сообщения и отправка по заданному сокету.
+
+    С буфером сообщение кодируется в согласованном для соединения формате.
+    """
+    sock.sendall(buffer.encode(message) if buffer else encode_message(message))
 
 
 def is_valid_ip_address(ip_address: str) -> bool:
@@ -51,3 +441,40 @@ def get_hash(word: str, salt: str):
     salt_bytes = salt.encode(DEFAULT_ENCODING)
     word_hash_bytes = hashlib.pbkdf2_hmac('sha256', word_bytes, salt_bytes, 1000)
     return binascii.hexlify(word_hash_bytes).decode(DEFAULT_ENCODING)
+
+
+# -----------------------------------------------------------------------------
+def __benchmark(number=100_000):
+    """Сравнение кодеков: время кодирования/декодирования сообщения и размер кадра"""
+    import timeit
+
+    from common import settings
+
+    messages = {
+        'message': {settings.ACTION: settings.MESSAGE, settings.SENDER: 'user_01', settings.DESTINATION: 'user_02',
+                    settings.TIME: 1662556800.123456, settings.MESSAGE_TEXT: 'Привет! Как дела?'},
+        'presence': {settings.ACTION: settings.PRESENCE, settings.TIME: 1662556800.123456,
+                     settings.USER: {settings.ACCOUNT_NAME: 'user_01', settings.PASSWORD_HASH: 'a1b2' * 16},
+                     settings.FEATURES: {settings.FRAMING: [settings.FRAMING_LENGTH_PREFIX],
+                                         settings.CODEC: [settings.CODEC_BINARY, settings.CODEC_JSON]}},
+        'response_200': settings.RESPONSE_200,
+        'users_100': {settings.RESPONSE: 202, settings.LIST_INFO: [f'user_{i:03}' for i in range(100)]},
+        'users_20000': {settings.RESPONSE: 202, settings.LIST_INFO: [f'user_{i:05}' for i in range(20_000)]},
+    }
+    for name, message in messages.items():
+        print(f'{name}:')
+        repeat = max(number // len(encode_message(message)), 10)
+        for codec in CODECS.values():
+            for compress in (False, True):
+                frame = encode_message(message, True, codec, compress)
+                buffer = MessageBuffer(framed=True)
+                assert buffer.feed(frame) == [message]
+                encode = timeit.timeit(lambda: encode_message(message, True, codec, compress), number=repeat)
+                decode = timeit.timeit(lambda: buffer.feed(frame), number=repeat)
+                print(f'    {codec.name + (" + zlib" if compress else ""):>13}: '
+                      f'encode {encode / repeat * 1e9:>12,.0f} ns | decode {decode / repeat * 1e9:>12,.0f} ns | '
+                      f'{len(frame):>7} bytes on the wire')
+
+
+if __name__ == '__main__':
+    __benchmark()
@@ -19,7 +19,7 @@ def run_on_win():
             break
         elif action == 's' and not processes:
             processes.append(subprocess.Popen('python run_server.py', creationflags=subprocess.CREATE_NEW_CONSOLE))
-            time.sleep(0.5)  # Время не должно быть меньше времени TIMEOUT_BLOCKING_SOCKET у сервера
+            time.sleep(0.5)  # Даём серверу время открыть прослушиваемый сокет
             for _ in range(NUMBER_CLIENTS):
                 processes.append(
                     subprocess.Popen(
@@ -46,7 +46,7 @@ def run_on_lin():
             ))
 
             file_path = BASE_DIR / 'run_client.py'
-            time.sleep(1)  # Время не должно быть меньше времени TIMEOUT_BLOCKING_SOCKET у сервера
+            time.sleep(1)  # Даём серверу время открыть прослушиваемый сокет
             for _ in range(NUMBER_CLIENTS):
                 processes.append(
                     subprocess.Popen(
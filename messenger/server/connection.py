@@ -0,0 +1,154 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from common import utils
+
+
+class Connection:
+    """Состояние одного клиентского соединения"""
+    __slots__ = ('sock', 'fileno', 'address', 'username', 'auth_pending', 'status_events', 'buffer', 'outgoing',
+                 'throttled', 'closing', 'messages_received', 'messages_sent')
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.fileno = sock.fileno()  # кэшируется: у закрытого сокета fileno() == -1
+        self.address = address
+        self.username: Optional[str] = None  # заполняется при получении presence
+        self.auth_pending = False  # presence получен, пароль ещё проверяется
+        self.status_events = False  # клиент разбирает события присутствия контактов (прислал FEATURES)
+        self.buffer = utils.MessageBuffer()  # сборка входящих сообщений
+        self.outgoing: Optional[bytearray] = None  # очередь исходящих данных, None - пуста
+        self.throttled = False  # чтение приостановлено до разгрузки очереди
+        self.closing = False  # закрыть после отправки очереди
+        self.messages_received = 0
+        self.messages_sent = 0
+
+    def getpeername(self):
+        return self.address
+
+    def queue_size(self) -> int:
+        """Размер очереди исходящих данных в байтах"""
+        return len(self.outgoing) if self.outgoing is not None else 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(address={self.address!r}, username={self.username!r})'
+
+
+class BatchReply:
+    """Сборка ответов на запросы одного пакета (BATCH) в порядке запросов"""
+    __slots__ = ('connection', 'responses', 'remaining')
+
+    def __init__(self, connection: Connection, size: int):
+        self.connection = connection
+        self.responses: List[Optional[dict]] = [None] * size
+        self.remaining = size
+
+    def set(self, index: int, response: dict) -> bool:
+        """Ответ на запрос №index; True - собраны ответы на все запросы пакета"""
+        self.responses[index] = response
+        self.remaining -= 1
+        return self.remaining == 0
+
+
+class BatchSlot:
+    """Соединение с точки зрения обработчика запроса из пакета.
+
+    Повторяет нужную обработчикам часть Connection; ответ, отправленный
+    в BatchSlot, попадает на место запроса в BatchReply.
+    """
+    __slots__ = ('reply', 'index')
+
+    def __init__(self, reply: BatchReply, index: int):
+        self.reply = reply
+        self.index = index
+
+    @property
+    def username(self) -> Optional[str]:
+        return self.reply.connection.username
+
+    @property
+    def auth_pending(self) -> bool:
+        return self.reply.connection.auth_pending
+
+    @property
+    def fileno(self) -> int:
+        return self.reply.connection.fileno
+
+    def getpeername(self):
+        return self.reply.connection.getpeername()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.reply.connection!r}, index={self.index!r})'
+
+
+def connections_in(args: tuple) -> List[Connection]:
+    """Соединения среди аргументов отложенного вызова (в т.ч. соединения пакетов запросов)"""
+    result = []
+    for arg in args:
+        if isinstance(arg, BatchSlot):
+            arg = arg.reply
+        if isinstance(arg, BatchReply):
+            arg = arg.connection
+        if isinstance(arg, Connection):
+            result.append(arg)
+    return result
+
+
+class ConnectionRegistry:
+    """Реестр соединений с индексами по дескриптору сокета и по имени пользователя.
+
+    Заменяет параллельные словарь клиентов и множество сокетов: добавление,
+    привязка к пользователю и удаление соединения выполняются за O(1).
+    """
+
+    def __init__(self):
+        self._by_fileno: Dict[int, Connection] = dict()
+        self._by_username: Dict[str, Connection] = dict()
+
+    def add(self, connection: Connection):
+        self._by_fileno[connection.fileno] = connection
+
+    def bind(self, connection: Connection, username: str):
+        """Привязка соединения к пользователю после успешной авторизации"""
+        connection.username = username
+        self._by_username[username] = connection
+
+    def unbind(self, connection: Connection):
+        """Отмена привязки соединения к пользователю (вход не состоялся)"""
+        if connection.username is not None and self._by_username.get(connection.username) is connection:
+            del self._by_username[connection.username]
+        connection.username = None
+
+    def remove(self, connection: Connection) -> bool:
+        """Удаление соединения из реестра; False - если его там уже нет"""
+        if self._by_fileno.get(connection.fileno) is not connection:
+            return False
+        del self._by_fileno[connection.fileno]
+        if connection.username is not None and self._by_username.get(connection.username) is connection:
+            del self._by_username[connection.username]
+        return True
+
+    def get_by_fileno(self, fileno: int) -> Optional[Connection]:
+        return self._by_fileno.get(fileno)
+
+    def get_by_username(self, username: str) -> Optional[Connection]:
+        return self._by_username.get(username)
+
+    def is_online(self, username: str) -> bool:
+        return username in self._by_username
+
+    def users(self) -> List[Tuple[str, Connection]]:
+        """Снимок авторизованных соединений (безопасен для чтения из другого потока)"""
+        return list(self._by_username.items())
+
+    def __contains__(self, connection: Connection) -> bool:
+        if self._by_fileno.get(connection.fileno) is connection:
+            return True
+        # Запрос из пакета - открыто ли соединение пакета
+        return isinstance(connection, BatchSlot) \
+            and self._by_fileno.get(connection.fileno) is connection.reply.connection
+
+    def __iter__(self) -> Iterator[Connection]:
+        return iter(list(self._by_fileno.values()))
+
+    def __len__(self) -> int:
+        return len(self._by_fileno)
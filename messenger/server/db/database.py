@@ -1,31 +1,113 @@
 import datetime
+import gzip
+import hmac
+import json
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from sqlalchemy import (
-    create_engine, MetaData, Table, Column,
-    Integer, String, DateTime, ForeignKey,
+    create_engine, event, MetaData, Table, Column,
+    Boolean, Integer, String, Text, Date, DateTime, ForeignKey, UniqueConstraint,
+    bindparam, func, insert, literal, tuple_, update,
 )
-from sqlalchemy.orm import sessionmaker, mapper
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker, scoped_session, mapper
+from sqlalchemy.pool import SingletonThreadPool
 
+from common import settings
+from server.db import migrations
 from server.db.definitions import (
-    AllUsers, ActiveUser, LoginHistory, UserContact, UserHistory,
+    AllUsers, ActiveUser, ChatGroup, ChatGroupMember, ContactChange, LoginHistory, LoginHistoryDaily, UserChange,
+    UserContact, UserHistory, SpooledMessage,
 )
 
 _BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DEFAULT_PATH_DB = str(_BASE_DIR / 'server_db.db3')
+SPOOL_PURGE_INTERVAL = 60  # Не чаще раза в минуту удаляем устаревшие отложенные сообщения
+
+# Перенос старой истории входов в архив: строк за одну транзакцию и пауза (с), когда переносить нечего
+LOGIN_HISTORY_BATCH = 500
+LOGIN_HISTORY_CHECK_INTERVAL = 60
+
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+SQLITE_BUSY_TIMEOUT = 5000  # мс ожидания блокировки БД другим процессом
+SQLITE_MAX_PARAMETERS = 900  # параметров в одном запросе IN (...) - ниже предела старых версий SQLite
+
+CachedUser = namedtuple('CachedUser', ('id', 'password_hash', 'history_id'))
+# Группа в памяти: участники - неизменяемое множество имён (заменяется целиком при изменении состава)
+CachedGroup = namedtuple('CachedGroup', ('id', 'owner', 'members'))
+GROUP_NAME_MAX_LENGTH = 64
+# Страница выборки: строки-кортежи и ключ для запроса следующей страницы (None - страница последняя)
+Page = namedtuple('Page', ('rows', 'cursor'))
+# Изменения справочника пользователей или списка контактов: ревизия, добавленные и удалённые имена
+# (removed is None - added содержит полный список)
+Delta = namedtuple('Delta', ('revision', 'added', 'removed'))
 
 
 class ServerDatabase:
-    def __init__(self, path: str = DEFAULT_PATH_DB):
+    """База данных сервера.
+
+    У каждого потока (сетевого, GUI) своя сессия и своё соединение с БД.
+    БД работает в режиме WAL: чтение не блокирует запись и наоборот.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH_DB, clear_active: bool = True,
+                 counters_flush_interval: float = 5.0, counters_flush_count: int = 1000,
+                 sqlite_synchronous: str = 'NORMAL', sqlite_cache_size: int = -16000,
+                 sqlite_mmap_size: int = 256 * 1024 * 1024,
+                 login_history_retention_days: int = 90, login_history_archive: str = ''):
         self.path = Path(path).resolve()
+        # Входы старше login_history_retention_days (0 - хранить всё) сводятся в суточные итоги
+        # пользователя, а сами строки переносятся в сжатый архив (JSON Lines в gzip)
+        self.login_history_retention_days = login_history_retention_days
+        self.login_history_archive = Path(login_history_archive) if login_history_archive \
+            else self.path.with_name(f'{self.path.stem}_login_history.jsonl.gz')
+        self._login_history_checked_at = 0.0
+        sqlite_synchronous = sqlite_synchronous.upper()
+        if sqlite_synchronous not in SQLITE_SYNCHRONOUS_MODES:
+            raise ValueError(f'Недопустимый режим synchronous: {sqlite_synchronous}')
+        self._pragmas = (
+            ('journal_mode', 'WAL'),
+            ('synchronous', sqlite_synchronous),
+            ('cache_size', int(sqlite_cache_size)),
+            ('mmap_size', int(sqlite_mmap_size)),
+            ('busy_timeout', SQLITE_BUSY_TIMEOUT),
+        )
+        # Счётчики сообщений копятся в памяти (history.id -> прирост) и записываются пачкой
+        self.counters_flush_interval = counters_flush_interval
+        self.counters_flush_count = counters_flush_count
+        self._counters_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._sent_deltas = Counter()
+        self._accepted_deltas = Counter()
+        self._flushing = (Counter(), Counter())  # Приросты, записываемые в данный момент
+        self._flush_generation = 0  # Номер последней зафиксированной записи счётчиков
+        self._counters_pending = 0
+        self._counters_flushed_at = time.monotonic()
+        self._spool_purged_at = 0.0
+        self._local = threading.local()  # Признак пакетной транзакции (batch) текущего потока
+        self._users: Dict[str, CachedUser] = dict()  # Справочник пользователей: имя -> идентификаторы
+        self._groups: Dict[str, CachedGroup] = dict()  # Группы, к которым уже обращались: имя -> состав
         self._init_database()
+        self._load_users()
         # [!] очищаем БД от возможных некорректных данных после ошибок
-        self.clear_active_users()
+        # (процессы-обработчики подключаются к уже очищенной БД и не сбрасывают чужие сеансы)
+        if clear_active:
+            self.clear_active_users()
 
     def _init_database(self):
         database_url = f"sqlite:///{self.path}"
-        engine = create_engine(database_url, pool_recycle=3600, connect_args={'check_same_thread': False})
+        # Одно соединение на поток - как и сессии (scoped_session)
+        engine = create_engine(database_url, poolclass=SingletonThreadPool, pool_size=16,
+                               connect_args={'check_same_thread': False})
+        event.listen(engine, 'connect', self._set_pragmas)
+        event.listen(engine, 'savepoint', self._begin_before_savepoint)
         metadata = MetaData()
         users__tbl = Table('users', metadata,
                            Column('id', Integer, primary_key=True),
@@ -44,6 +126,14 @@ class ServerDatabase:
                                    Column('date_time', DateTime, default=datetime.datetime.utcnow),
                                    Column('ip_address', String, nullable=False),
                                    Column('port', Integer))
+        login_history_daily__tbl = Table('login_history_daily', metadata,
+                                         Column('id', Integer, primary_key=True),
+                                         Column('user_id', ForeignKey('users.id'), nullable=False),
+                                         Column('day', Date, nullable=False),
+                                         Column('logins', Integer, nullable=False),
+                                         Column('first_login', DateTime),
+                                         Column('last_login', DateTime),
+                                         UniqueConstraint('user_id', 'day'))
         contacts__tbl = Table('contacts', metadata,
                               Column('id', Integer, primary_key=True),
                               Column('user_id', ForeignKey('users.id')),
@@ -53,48 +143,263 @@ class ServerDatabase:
                                    Column('user_id', ForeignKey('users.id')),
                                    Column('sent', Integer),
                                    Column('accepted', Integer))
+        # Журнал справочника пользователей: каждое добавление и удаление получает ревизию
+        # (AUTOINCREMENT - номера не используются повторно)
+        user_changes__tbl = Table('user_changes', metadata,
+                                  Column('revision', Integer, primary_key=True),
+                                  Column('username', String, nullable=False),
+                                  Column('removed', Boolean, nullable=False, default=False),
+                                  sqlite_autoincrement=True)
+        # Журнал контактов: ревизии общие для всех пользователей, но у каждого возрастают
+        contact_changes__tbl = Table('contact_changes', metadata,
+                                     Column('revision', Integer, primary_key=True),
+                                     Column('user_id', ForeignKey('users.id'), nullable=False),
+                                     Column('contact', String, nullable=False),
+                                     Column('removed', Boolean, nullable=False, default=False),
+                                     sqlite_autoincrement=True)
+        groups__tbl = Table('chat_groups', metadata,
+                            Column('id', Integer, primary_key=True),
+                            Column('name', String, unique=True, nullable=False),
+                            Column('owner_id', ForeignKey('users.id')),
+                            Column('created', DateTime, default=datetime.datetime.utcnow))
+        group_members__tbl = Table('chat_group_members', metadata,
+                                   Column('id', Integer, primary_key=True),
+                                   Column('group_id', ForeignKey('chat_groups.id'), nullable=False),
+                                   Column('user_id', ForeignKey('users.id'), nullable=False),
+                                   UniqueConstraint('group_id', 'user_id'))
+        spool__tbl = Table('spool', metadata,
+                           Column('id', Integer, primary_key=True),
+                           Column('recipient_id', ForeignKey('users.id'), index=True, nullable=False),
+                           Column('message', Text, nullable=False),
+                           Column('created', DateTime, index=True, default=datetime.datetime.utcnow))
         metadata.create_all(engine)
+        # Индексы и ограничения, добавленные после первой версии схемы, создаются миграциями:
+        # так же обновляются и существующие файлы БД
+        raw_connection = engine.raw_connection()
+        try:
+            migrations.upgrade(raw_connection.dbapi_connection)
+        finally:
+            raw_connection.close()
         mapper(AllUsers, users__tbl)
         mapper(ActiveUser, active_users__tbl)
         mapper(LoginHistory, login_history__tbl)
+        mapper(LoginHistoryDaily, login_history_daily__tbl)
         mapper(UserContact, contacts__tbl)
         mapper(UserHistory, users_history__tbl)
-        self._Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        self.session = self._Session()
+        mapper(UserChange, user_changes__tbl)
+        mapper(ContactChange, contact_changes__tbl)
+        mapper(ChatGroup, groups__tbl)
+        mapper(ChatGroupMember, group_members__tbl)
+        mapper(SpooledMessage, spool__tbl)
+        self._Session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+
+    def _set_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in self._pragmas:
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+    @staticmethod
+    def _begin_before_savepoint(connection, name):
+        """pysqlite открывает транзакцию только перед изменением данных, но не перед SAVEPOINT:
+        без явного BEGIN точка сохранения сама становится транзакцией и фиксируется при RELEASE,
+        а откат пакета её уже не отменяет. Чтение по-прежнему идёт вне транзакции и видит свежие данные.
+        IMMEDIATE, как в миграциях: блокировка записи ждёт busy_timeout, а не отказывает при записи
+        другого процесса между чтением и изменением внутри пакета.
+        """
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    @property
+    def session(self):
+        """Сессия текущего потока"""
+        return self._Session()
+
+    @contextmanager
+    def batch(self):
+        """Общая транзакция для нескольких изменений.
+
+        Методы, вызванные внутри блока, не фиксируют изменения сами: фиксация одна,
+        при выходе из блока; при исключении откатываются все изменения блока.
+        """
+        self._local.in_batch = True
+        self._local.touched = []
+        try:
+            yield
+            self.session.commit()
+        except BaseException:
+            self.session.rollback()
+            self._forget_touched(0)
+            raise
+        finally:
+            self._local.in_batch = False
+            self._local.touched = []
+
+    @contextmanager
+    def savepoint(self):
+        """Вложенная транзакция внутри batch(): при исключении откатываются только её изменения"""
+        mark = len(self._local.touched)
+        nested = self.session.begin_nested()
+        try:
+            yield
+            nested.commit()
+        except BaseException:
+            nested.rollback()
+            self._forget_touched(mark)
+            raise
+
+    def _commit(self):
+        if not getattr(self._local, 'in_batch', False):
+            self.session.commit()
+
+    def _touch(self, cache: dict, key: str):
+        """Запись справочника в памяти, которую нужно забыть при откате пакетной транзакции"""
+        if getattr(self._local, 'in_batch', False):
+            self._local.touched.append((cache, key))
+
+    def _forget_touched(self, mark: int):
+        """Сброс записей справочников, изменённых после отметки: при промахе они перечитаются из БД"""
+        for cache, key in self._local.touched[mark:]:
+            cache.pop(key, None)
+        del self._local.touched[mark:]
 
     def clear_active_users(self):
         self.session.query(ActiveUser).delete()
         self.session.commit()
 
+    def _load_users(self):
+        """Загрузка справочника пользователей в память одним запросом"""
+        query = self.session.query(
+            AllUsers.username, AllUsers.id, AllUsers.password_hash, UserHistory.id).outerjoin(
+            UserHistory, UserHistory.user_id == AllUsers.id)
+        self._users = {el[0]: CachedUser(*el[1:]) for el in query}
+
+    def _get_cached_user(self, username: str) -> Optional[CachedUser]:
+        """Пользователь из справочника в памяти.
+
+        При промахе справочник дополняется из БД: пользователя мог добавить другой процесс.
+        """
+        user = self._users.get(username)
+        if user is None:
+            row = self.session.query(AllUsers.id, AllUsers.password_hash, UserHistory.id).outerjoin(
+                UserHistory, UserHistory.user_id == AllUsers.id).filter(AllUsers.username == username).first()
+            if row:
+                user = self._users[username] = CachedUser(*row)
+                self._touch(self._users, username)
+        return user
+
+    def forget_user(self, username: str):
+        """Удаление пользователя из справочника (пользователь удалён другим процессом)"""
+        self._users.pop(username, None)
+        self._groups.clear()  # пользователь мог состоять в любой из групп
+
     def get_user_by_name(self, username):
         return self.session.query(AllUsers).filter_by(username=username).first()
 
     def add_user(self, username, password_hash):
         user = AllUsers(username=username, password_hash=password_hash)
         self.session.add(user)
-        self.session.commit()
+        self.session.flush()  # идентификатор пользователя нужен для строки счётчиков
         history_of_user = UserHistory(user_id=user.id)
         self.session.add(history_of_user)
-        self.session.commit()
+        self.session.add(UserChange(username))
+        self._commit()
+        self._users[username] = CachedUser(user.id, password_hash, history_of_user.id)
+        self._touch(self._users, username)
+
+    def add_users(self, users: Iterable[Tuple[str, str]]) -> Tuple[int, int]:
+        """Регистрация пачки пользователей одной транзакцией.
+
+        users - пары (имя, хэш пароля). Уже зарегистрированные имена и повторы
+        внутри пачки пропускаются. Возвращает (добавлено, пропущено).
+        """
+        total = 0
+        unique = dict()  # при повторе имени остаётся первая запись
+        for username, password_hash in users:
+            total += 1
+            unique.setdefault(username, password_hash)
+        names = list(unique)
+        for start in range(0, len(names), SQLITE_MAX_PARAMETERS):
+            for el in self.session.query(AllUsers.username).filter(
+                    AllUsers.username.in_(names[start:start + SQLITE_MAX_PARAMETERS])):
+                del unique[el.username]
+        if not unique:
+            return 0, total
+        # Вставка строк пачкой (executemany) без создания объектов ORM
+        now = datetime.datetime.now()
+        self.session.execute(insert(AllUsers), [
+            {'username': username, 'password_hash': password_hash, 'last_login': now}
+            for username, password_hash in unique.items()])
+        names = list(unique)
+        user_ids = dict()
+        for start in range(0, len(names), SQLITE_MAX_PARAMETERS):
+            user_ids.update(self.session.query(AllUsers.username, AllUsers.id).filter(
+                AllUsers.username.in_(names[start:start + SQLITE_MAX_PARAMETERS])))
+        self.session.execute(insert(UserHistory), [
+            {'user_id': user_id, 'sent': 0, 'accepted': 0} for user_id in user_ids.values()])
+        self.session.execute(insert(UserChange), [{'username': username, 'removed': False} for username in names])
+        ids = list(user_ids.values())
+        history_ids = dict()
+        for start in range(0, len(ids), SQLITE_MAX_PARAMETERS):
+            history_ids.update(self.session.query(UserHistory.user_id, UserHistory.id).filter(
+                UserHistory.user_id.in_(ids[start:start + SQLITE_MAX_PARAMETERS])))
+        self._commit()
+        for username, password_hash in unique.items():
+            user_id = user_ids[username]
+            self._users[username] = CachedUser(user_id, password_hash, history_ids[user_id])
+            self._touch(self._users, username)
+        return len(unique), total - len(unique)
 
     def del_user(self, username):
-        user = self.get_user_by_name(username)
+        user = self._get_cached_user(username)
+        if not user:
+            return
         self.session.query(ActiveUser).filter_by(user_id=user.id).delete()
         self.session.query(LoginHistory).filter_by(user_id=user.id).delete()
+        self.session.query(LoginHistoryDaily).filter_by(user_id=user.id).delete()
         self.session.query(UserHistory).filter_by(user_id=user.id).delete()
+        self.session.query(SpooledMessage).filter_by(recipient_id=user.id).delete()
+        self.session.query(ContactChange).filter_by(user_id=user.id).delete()
+        self.session.query(ChatGroupMember).filter_by(user_id=user.id).delete()
+        self.session.query(ChatGroup).filter_by(owner_id=user.id).update({ChatGroup.owner_id: None})
+        # Пользователь пропадает из чужих списков контактов - это тоже изменение этих списков
+        self.session.execute(insert(ContactChange).from_select(
+            ('user_id', 'contact', 'removed'),
+            self.session.query(UserContact.user_id, literal(username), literal(True)).filter(
+                UserContact.contact_id == user.id, UserContact.user_id != user.id)))
         self.session.query(UserContact).filter(
             (UserContact.user_id == user.id) | (UserContact.contact_id == user.id)).delete()
         self.session.query(AllUsers).filter_by(username=username).delete()
+        self.session.add(UserChange(username, removed=True))
         self.session.commit()
+        self.forget_user(username)
 
     def user_login(self, username, password_hash, ip_address, port):
         """Действия при подключении пользователя к серверу"""
-        user: AllUsers = self.get_user_by_name(username)
+        self._get_cached_user(username)  # дополнение справочника пользователем, добавленным другим процессом
+        self.authenticate(username, password_hash)
+        self.record_login(username, ip_address, port)
+
+    def authenticate(self, username: str, password_hash: str) -> CachedUser:
+        """Проверка имени и пароля по справочнику в памяти.
+
+        Не обращается к сессии, поэтому может выполняться вне потока записи; справочник
+        дополняется из БД заранее - проверкой is_user_registered.
+        """
+        user = self._users.get(username)
         if not user:
             raise ValueError('Пользователь не зарегистрирован')
-        if user.password_hash != password_hash:
+        if not hmac.compare_digest(str(user.password_hash), str(password_hash)):
             raise ValueError('Некорректный пароль пользователя')
-        user.last_login = datetime.datetime.now()
+        return user
+
+    def record_login(self, username: str, ip_address: str, port: int):
+        """Запись входа проверенного пользователя: время входа, активный сеанс и история входов"""
+        user = self._get_cached_user(username)
+        if not user:
+            return
+        self.session.query(AllUsers).filter_by(id=user.id).update(
+            {AllUsers.last_login: datetime.datetime.now()}, synchronize_session=False)
         new_active_user = ActiveUser(
             user_id=user.id, ip_address=ip_address,
             port=port, login_time=datetime.datetime.now())
@@ -102,50 +407,379 @@ class ServerDatabase:
         history = LoginHistory(
             user_id=user.id, date=datetime.datetime.now(), ip_address=ip_address, port=port)
         self.session.add(history)
-        self.session.commit()
+        self._commit()
 
     def user_logout(self, username: str):
         """Действие при отключении пользователя от сервера"""
-        user = self.get_user_by_name(username)
+        user = self._get_cached_user(username)
+        if not user:
+            return
         self.session.query(ActiveUser).filter_by(user_id=user.id).delete()
-        self.session.commit()
+        self._commit()
 
-    def msg_registration(self, sender_username, recipient_username):
-        """Действия при регистрации сообщений (изменение счётчиков сообщений)"""
-        sender: AllUsers = self.get_user_by_name(sender_username)
-        recipient: AllUsers = self.get_user_by_name(recipient_username)
-        sender_history: UserHistory = self.session.query(UserHistory).filter_by(user_id=sender.id).first()
-        sender_history.sent += 1
-        recipient_history: UserHistory = self.session.query(UserHistory).filter_by(user_id=recipient.id).first()
-        recipient_history.accepted += 1
-        self.session.commit()
+    def msg_registration(self, sender_username, recipient_username, count: int = 1):
+        """Действия при регистрации сообщений (изменение счётчиков сообщений).
+
+        Счётчики изменяются в памяти и записываются в БД в flush_counters
+        (поток записи вызывает его между пакетами и при простое).
+        """
+        sender = self._get_cached_user(sender_username)
+        recipient = self._get_cached_user(recipient_username)
+        with self._counters_lock:
+            if sender:
+                self._sent_deltas[sender.history_id] += count
+            if recipient:
+                self._accepted_deltas[recipient.history_id] += count
+            self._counters_pending += count
+
+    def group_msg_registration(self, sender_username: str, recipients: Iterable[str]):
+        """Счётчики сообщения группы: одно сообщение отправителю и каждому получателю за один захват блокировки"""
+        sender = self._get_cached_user(sender_username)
+        history_ids = [user.history_id for user in map(self._users.get, recipients) if user]
+        with self._counters_lock:
+            if sender:
+                self._sent_deltas[sender.history_id] += len(history_ids)
+            self._accepted_deltas.update(history_ids)
+            self._counters_pending += len(history_ids)
+
+    def flush_counters(self, force: bool = False):
+        """Запись накопленных счётчиков сообщений одной транзакцией.
+
+        Без force - только при накоплении counters_flush_count сообщений
+        или по истечении counters_flush_interval с прошлой записи.
+        """
+        if not self._counters_pending:
+            return
+        if not force and self._counters_pending < self.counters_flush_count \
+                and time.monotonic() - self._counters_flushed_at < self.counters_flush_interval:
+            return
+        with self._flush_lock:  # запись из сетевого потока и при завершении сервера не пересекаются
+            with self._counters_lock:
+                self._flushing = (self._sent_deltas, self._accepted_deltas)
+                self._sent_deltas, self._accepted_deltas = Counter(), Counter()
+                self._counters_pending = 0
+            sent, accepted = self._flushing
+            # Один UPDATE с пачкой параметров (executemany) вместо запроса на каждую строку
+            self.session.execute(
+                update(UserHistory).where(UserHistory.id == bindparam('history_id')).values(
+                    sent=UserHistory.sent + bindparam('sent_delta'),
+                    accepted=UserHistory.accepted + bindparam('accepted_delta')),
+                [{'history_id': history_id, 'sent_delta': sent[history_id], 'accepted_delta': accepted[history_id]}
+                 for history_id in sent.keys() | accepted.keys()],
+                execution_options={'synchronize_session': False})
+            try:
+                self.session.commit()
+            except OperationalError:
+                # БД занята другим процессом-обработчиком - возвращаем приросты до следующей попытки
+                self.session.rollback()
+                with self._counters_lock:
+                    self._sent_deltas.update(sent)
+                    self._accepted_deltas.update(accepted)
+                    self._counters_pending += sum(sent.values())
+                    self._flushing = (Counter(), Counter())
+                return
+            with self._counters_lock:
+                self._flushing = (Counter(), Counter())
+                self._flush_generation += 1
+            self._counters_flushed_at = time.monotonic()
+
+    def spool_message(self, recipient_username: str, message: dict, limit: int) -> bool:
+        """Сохранение сообщения для получателя не в сети.
+
+        Возвращает False, если получатель не зарегистрирован или его очередь заполнена.
+        """
+        recipient = self._get_cached_user(recipient_username)
+        if not recipient:
+            return False
+        if self.session.query(SpooledMessage).filter_by(recipient_id=recipient.id).count() >= limit:
+            return False
+        self.session.add(SpooledMessage(
+            recipient_id=recipient.id, message=json.dumps(message), created=datetime.datetime.utcnow()))
+        self.session.flush()  # запись в транзакцию без фиксации - учитывается в подсчёте очереди
+        self._commit()
+        return True
+
+    def spool_group_message(self, recipients: List[str], message: dict, limit: int) -> int:
+        """Сохранение сообщения группы для её участников не в сети одной вставкой.
+
+        Сообщение сериализуется один раз; получатели с заполненной очередью пропускаются.
+        Возвращает число сохранённых копий.
+        """
+        user_ids = [user.id for user in map(self._get_cached_user, recipients) if user]
+        full = set()
+        for start in range(0, len(user_ids), SQLITE_MAX_PARAMETERS):
+            full.update(el[0] for el in self.session.query(SpooledMessage.recipient_id).filter(
+                SpooledMessage.recipient_id.in_(user_ids[start:start + SQLITE_MAX_PARAMETERS])).group_by(
+                SpooledMessage.recipient_id).having(func.count() >= limit))
+        user_ids = [user_id for user_id in user_ids if user_id not in full]
+        if user_ids:
+            data, created = json.dumps(message), datetime.datetime.utcnow()
+            self.session.execute(insert(SpooledMessage), [
+                {'recipient_id': user_id, 'message': data, 'created': created} for user_id in user_ids])
+            self._commit()
+        return len(user_ids)
+
+    def purge_spool(self, ttl: int):
+        """Удаление устаревших отложенных сообщений (не чаще раза в SPOOL_PURGE_INTERVAL)"""
+        if time.monotonic() - self._spool_purged_at < SPOOL_PURGE_INTERVAL:
+            return
+        self._spool_purged_at = time.monotonic()
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl)
+        try:
+            self.session.query(SpooledMessage).filter(SpooledMessage.created < cutoff).delete()
+            self.session.commit()
+        except OperationalError:
+            # БД занята другим процессом-обработчиком - удалим при следующей проверке
+            self.session.rollback()
+
+    def compact_login_history(self, batch_size: int = LOGIN_HISTORY_BATCH) -> int:
+        """Перенос одной пачки устаревших входов в архив; возвращает число перенесённых строк.
+
+        Строки сначала дописываются в архив, затем одной короткой транзакцией добавляются
+        к суточным итогам и удаляются из login_history. Вызывается потоком записи между
+        пакетами: пока переносить есть что - на каждом вызове, иначе не чаще
+        раза в LOGIN_HISTORY_CHECK_INTERVAL.
+        """
+        if self.login_history_retention_days <= 0 \
+                or time.monotonic() - self._login_history_checked_at < LOGIN_HISTORY_CHECK_INTERVAL:
+            return 0
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.login_history_retention_days)
+        rows = self.session.query(
+            LoginHistory.id, LoginHistory.user_id, AllUsers.username, LoginHistory.date_time,
+            LoginHistory.ip_address, LoginHistory.port).join(AllUsers, LoginHistory.user_id == AllUsers.id).filter(
+            LoginHistory.date_time < cutoff).order_by(LoginHistory.date_time).limit(batch_size).all()
+        if len(rows) < batch_size:
+            self._login_history_checked_at = time.monotonic()
+        if not rows:
+            self.session.rollback()
+            return 0
+        self._archive_login_history(rows)
+        totals = dict()
+        for row in rows:
+            key = (row.user_id, row.date_time.date())
+            logins, first_login, last_login = totals.get(key, (0, row.date_time, row.date_time))
+            totals[key] = (logins + 1, min(first_login, row.date_time), max(last_login, row.date_time))
+        statement = sqlite_insert(LoginHistoryDaily)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={'logins': LoginHistoryDaily.logins + statement.excluded.logins,
+                  'first_login': func.min(LoginHistoryDaily.first_login, statement.excluded.first_login),
+                  'last_login': func.max(LoginHistoryDaily.last_login, statement.excluded.last_login)})
+        self.session.execute(statement, [
+            {'user_id': user_id, 'day': day, 'logins': logins, 'first_login': first_login, 'last_login': last_login}
+            for (user_id, day), (logins, first_login, last_login) in totals.items()])
+        self.session.query(LoginHistory).filter(LoginHistory.id.in_([row.id for row in rows])).delete(
+            synchronize_session=False)
+        self._commit()
+        return len(rows)
+
+    def _archive_login_history(self, rows: list):
+        """Дописывание строк истории входов в архив отдельным участком gzip.
+
+        Участки gzip-файла читаются подряд как один поток (gzip.open, zcat). Архив
+        сбрасывается на диск до удаления строк из БД: при сбое строки могут
+        попасть в архив повторно, но не будут потеряны.
+        """
+        data = ''.join(json.dumps({
+            'username': row.username, 'date_time': row.date_time.isoformat(),
+            'ip_address': row.ip_address, 'port': row.port}, ensure_ascii=False) + '\n' for row in rows)
+        with open(self.login_history_archive, 'ab') as file:
+            file.write(gzip.compress(data.encode(settings.DEFAULT_ENCODING)))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def get_login_history_daily(self, username: str) -> List[dict]:
+        """Суточные итоги входов пользователя, перенесённых в архив"""
+        user = self._get_cached_user(username)
+        if not user:
+            return []
+        query = self.session.query(LoginHistoryDaily).filter_by(user_id=user.id).order_by(LoginHistoryDaily.day)
+        return [
+            {'day': str(el.day), 'logins': el.logins,
+             'first_login': str(el.first_login), 'last_login': str(el.last_login)}
+            for el in query
+        ]
+
+    def peek_spooled_messages(self, username: str, ttl: int) -> List[Tuple[int, dict]]:
+        """Отложенные сообщения пользователя (в порядке поступления) без удаления: пары (номер, сообщение).
+
+        Сообщения удаляются ack_spooled_messages после отправки клиенту: если клиент отключится
+        раньше, они останутся в очереди до следующего входа.
+        """
+        user = self._get_cached_user(username)
+        if not user:
+            return []
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl)
+        query = self.session.query(SpooledMessage.id, SpooledMessage.message).filter(
+            SpooledMessage.recipient_id == user.id, SpooledMessage.created >= cutoff).order_by(SpooledMessage.id)
+        return [(el.id, json.loads(el.message)) for el in query]
+
+    def ack_spooled_messages(self, username: str, spooled: List[Tuple[int, dict]]):
+        """Удаление отправленных клиенту отложенных сообщений.
+
+        Счётчики сообщений увеличиваются при доставке, а не при постановке в очередь.
+        """
+        ids = [spooled_id for spooled_id, _ in spooled]
+        for start in range(0, len(ids), SQLITE_MAX_PARAMETERS):
+            self.session.query(SpooledMessage).filter(
+                SpooledMessage.id.in_(ids[start:start + SQLITE_MAX_PARAMETERS])).delete(synchronize_session=False)
+        self._commit()
+        for username_from, count in Counter(message.get(settings.SENDER) for _, message in spooled).items():
+            self.msg_registration(username_from, username, count)
 
     def add_contact(self, required_username: str, sender_username: str):
         """Действия при запросе нового контакта от пользователя"""
         if not required_username or not sender_username:
             return
-        user: AllUsers = self.get_user_by_name(required_username)
-        sender: AllUsers = self.get_user_by_name(sender_username)
+        user = self._get_cached_user(required_username)
+        sender = self._get_cached_user(sender_username)
+        if not user or not sender:
+            raise ValueError('Пользователь не зарегистрирован')  # отказ операции, а не ошибка записи пакета
         if self.session.query(UserContact).filter_by(
                 user_id=user.id, contact_id=sender.id).first():
             return
         contact = UserContact(user_id=user.id, contact_id=sender.id)
         self.session.add(contact)
-        self.session.commit()
+        self.session.add(ContactChange(user.id, sender_username))
+        self._commit()
 
     def del_contact(self, required_username: str, sender_username: str):
         """Действие при запросе удаления контакта пользователя"""
         if not required_username or not sender_username:
             return
-        user: AllUsers = self.get_user_by_name(required_username)
-        sender: AllUsers = self.get_user_by_name(sender_username)
-        self.session.query(UserContact).filter_by(user_id=user.id, contact_id=sender.id).delete()
-        self.session.commit()
+        user = self._get_cached_user(required_username)
+        sender = self._get_cached_user(sender_username)
+        if not user or not sender:
+            raise ValueError('Пользователь не зарегистрирован')  # отказ операции, а не ошибка записи пакета
+        if self.session.query(UserContact).filter_by(user_id=user.id, contact_id=sender.id).delete():
+            self.session.add(ContactChange(user.id, sender_username, removed=True))
+        self._commit()
+
+    def _get_cached_group(self, name: str) -> Optional[CachedGroup]:
+        """Группа и её состав из памяти; при промахе загружается из БД одним запросом"""
+        group = self._groups.get(name)
+        if group is None:
+            row = self.session.query(ChatGroup.id, AllUsers.username).outerjoin(
+                AllUsers, AllUsers.id == ChatGroup.owner_id).filter(ChatGroup.name == name).first()
+            if not row:
+                return None
+            members = frozenset(el[0] for el in self.session.query(AllUsers.username).join(
+                ChatGroupMember, ChatGroupMember.user_id == AllUsers.id).filter(ChatGroupMember.group_id == row[0]))
+            group = self._groups[name] = CachedGroup(row[0], row[1], members)
+            self._touch(self._groups, name)
+        return group
+
+    def forget_group(self, name: str):
+        """Удаление группы из памяти (состав изменён другим процессом)"""
+        self._groups.pop(name, None)
+
+    def get_group_members(self, name: str) -> Optional[frozenset]:
+        """Имена участников группы; None - группы нет"""
+        group = self._get_cached_group(name)
+        return group.members if group else None
+
+    def create_group(self, name: str, owner_username: str):
+        """Создание группы; владелец становится её первым участником"""
+        if not isinstance(name, str) or not 0 < len(name) <= GROUP_NAME_MAX_LENGTH or '\0' in name:
+            raise ValueError('Некорректное имя группы')
+        owner = self._get_cached_user(owner_username)
+        if not owner:
+            raise ValueError('Пользователь не зарегистрирован')
+        if self._get_cached_group(name):
+            raise ValueError('Группа с таким именем уже существует')
+        group = ChatGroup(name, owner.id, datetime.datetime.utcnow())
+        self.session.add(group)
+        self.session.flush()  # идентификатор группы нужен для строки участника
+        self.session.add(ChatGroupMember(group.id, owner.id))
+        self._commit()
+        self._groups[name] = CachedGroup(group.id, owner_username, frozenset((owner_username,)))
+        self._touch(self._groups, name)
+
+    def add_group_member(self, name: str, actor_username: str, member_username: str):
+        """Добавление участника группы; добавлять могут только её участники"""
+        group = self._get_cached_group(name)
+        if not group or actor_username not in group.members:
+            raise ValueError('Группа не найдена')
+        member = self._get_cached_user(member_username)
+        if not member:
+            raise ValueError('Пользователь не зарегистрирован')
+        if member_username in group.members:
+            return
+        self.session.add(ChatGroupMember(group.id, member.id))
+        self._commit()
+        self._groups[name] = group._replace(members=group.members | {member_username})
+        self._touch(self._groups, name)
+
+    def remove_group_member(self, name: str, actor_username: str, member_username: str):
+        """Исключение участника: выйти может сам участник, исключить - владелец группы"""
+        group = self._get_cached_group(name)
+        if not group or actor_username not in group.members:
+            raise ValueError('Группа не найдена')
+        if actor_username not in (member_username, group.owner):
+            raise ValueError('Исключать участников может только владелец группы')
+        member = self._get_cached_user(member_username)
+        if not member or member_username not in group.members:
+            return
+        self.session.query(ChatGroupMember).filter_by(group_id=group.id, user_id=member.id).delete()
+        self._commit()
+        self._groups[name] = group._replace(members=group.members - {member_username})
+        self._touch(self._groups, name)
+
+    def get_user_groups(self, username: str) -> List[str]:
+        """Имена групп, в которых состоит пользователь"""
+        user = self._get_cached_user(username)
+        query = self.session.query(ChatGroup.name).join(
+            ChatGroupMember, ChatGroupMember.group_id == ChatGroup.id).filter(
+            ChatGroupMember.user_id == user.id).order_by(ChatGroup.name)
+        return [el[0] for el in query]
 
     def get_list_of_usernames(self) -> List[str]:
         """Возвращает список имён всех пользователей зарегистрированных на сервере"""
-        query = self.session.query(AllUsers.username).all()
-        return sorted((el[0] for el in query))
+        return [el[0] for el in self.session.query(AllUsers.username).order_by(AllUsers.username)]
+
+    def get_users_revision(self) -> int:
+        """Текущая ревизия справочника пользователей (0 - пользователей ещё не было)"""
+        return self.session.query(func.max(UserChange.revision)).scalar() or 0
+
+    def get_users_delta(self, revision: int = 0) -> Delta:
+        """Изменения справочника пользователей после ревизии revision.
+
+        Полный список возвращается, если клиент ещё не синхронизировался (revision <= 0),
+        знает ревизию, которой на сервере нет (БД заменена), или изменений больше,
+        чем пользователей. Имя, добавленное и затем удалённое, попадает только в removed.
+        """
+        current = self.get_users_revision()
+        if not 0 < revision <= current or current - revision > len(self._users):
+            return Delta(current, self.get_list_of_usernames(), None)
+        return self._collect_changes(current, self.session.query(UserChange.username, UserChange.removed).filter(
+            UserChange.revision > revision, UserChange.revision <= current).order_by(UserChange.revision))
+
+    def get_contacts_revision(self, username: str) -> int:
+        """Ревизия списка контактов пользователя (0 - список ни разу не менялся)"""
+        user = self._get_cached_user(username)
+        return self.session.query(func.max(ContactChange.revision)).filter(
+            ContactChange.user_id == user.id).scalar() or 0
+
+    def get_contacts_delta(self, username: str, revision: int = 0) -> Delta:
+        """Изменения списка контактов пользователя после ревизии revision.
+
+        Полный список возвращается, если клиент ещё не синхронизировался или знает
+        ревизию новее текущей (БД сервера заменена).
+        """
+        user = self._get_cached_user(username)
+        current = self.get_contacts_revision(username)
+        if not 0 < revision <= current:
+            return Delta(current, self.get_contacts(username), None)
+        return self._collect_changes(current, self.session.query(ContactChange.contact, ContactChange.removed).filter(
+            ContactChange.user_id == user.id, ContactChange.revision > revision,
+            ContactChange.revision <= current).order_by(ContactChange.revision))
+
+    @staticmethod
+    def _collect_changes(revision: int, changes: Iterable[Tuple[str, bool]]) -> Delta:
+        """Итог журнала изменений: для каждого имени учитывается последнее изменение"""
+        last = dict(changes)
+        return Delta(revision, sorted(name for name, removed in last.items() if not removed),
+                     sorted(name for name, removed in last.items() if removed))
 
     def get_active_users(self) -> List[dict]:
         """Возвращает подробную информацию об активных пользователях"""
@@ -175,27 +809,105 @@ class ServerDatabase:
             for el in query
         ]
 
+    def get_login_history_page(self, cursor: Optional[Tuple[datetime.datetime, int]] = None, limit: int = 100,
+                               username: Optional[str] = None, since: Optional[datetime.datetime] = None,
+                               until: Optional[datetime.datetime] = None) -> Page:
+        """Страница истории входов, от новых к старым.
+
+        Строки - (username, date_time, ip_address, port). Постраничный вывод по ключу
+        (date_time, id): следующая страница продолжается после cursor предыдущей,
+        поэтому запрос не зависит от номера страницы и идёт по индексу.
+        """
+        query = self.session.query(
+            AllUsers.username, LoginHistory.date_time, LoginHistory.ip_address,
+            LoginHistory.port, LoginHistory.id).join(AllUsers, LoginHistory.user_id == AllUsers.id)
+        if username is not None:
+            user = self._get_cached_user(username)
+            if not user:
+                return Page([], None)
+            query = query.filter(LoginHistory.user_id == user.id)
+        if since is not None:
+            query = query.filter(LoginHistory.date_time >= since)
+        if until is not None:
+            query = query.filter(LoginHistory.date_time < until)
+        if cursor is not None:
+            query = query.filter(tuple_(LoginHistory.date_time, LoginHistory.id) < tuple_(*cursor))
+        rows = query.order_by(LoginHistory.date_time.desc(), LoginHistory.id.desc()).limit(limit).all()
+        next_cursor = (rows[-1].date_time, rows[-1].id) if len(rows) == limit else None
+        return Page([row[:4] for row in rows], next_cursor)
+
+    def get_msg_count_page(self, cursor: Optional[str] = None, limit: int = 100,
+                           username_prefix: Optional[str] = None) -> Page:
+        """Страница статистики сообщений в порядке имён пользователей.
+
+        Строки - (username, last_login, sent, accepted) с учётом ещё не записанных счётчиков;
+        cursor - имя последнего пользователя предыдущей страницы.
+        """
+        query = self.session.query(
+            AllUsers.username, AllUsers.last_login, UserHistory.id, UserHistory.sent,
+            UserHistory.accepted).join(AllUsers)
+        if username_prefix:
+            # Диапазон вместо LIKE: сравнение строк идёт по индексу имени
+            query = query.filter(AllUsers.username >= username_prefix,
+                                 AllUsers.username < username_prefix + '\U0010ffff')
+        if cursor is not None:
+            query = query.filter(AllUsers.username > cursor)
+        rows, sent, accepted = self._read_with_pending_counters(query.order_by(AllUsers.username).limit(limit))
+        next_cursor = rows[-1].username if len(rows) == limit else None
+        return Page([(el.username, el.last_login, el.sent + sent[el.id], el.accepted + accepted[el.id])
+                     for el in rows], next_cursor)
+
     def get_contacts(self, username: str) -> List[str]:
         """Возвращает список имён заданного пользователя"""
-        user: AllUsers = self.get_user_by_name(username)
+        user = self._get_cached_user(username)
         query = self.session.query(
             UserContact, AllUsers.username).filter_by(
             user_id=user.id).join(AllUsers, UserContact.contact_id == AllUsers.id)
         return [el[1] for el in query]
 
+    def get_contact_watchers(self, usernames: Iterable[str]) -> Dict[str, List[str]]:
+        """Чьи списки контактов содержат заданных пользователей: {владелец списка: [имена из usernames]}"""
+        names = {user.id: username for username, user in
+                 ((username, self._get_cached_user(username)) for username in usernames) if user}
+        ids = list(names)
+        watchers = dict()
+        for start in range(0, len(ids), SQLITE_MAX_PARAMETERS):
+            query = self.session.query(AllUsers.username, UserContact.contact_id).join(
+                AllUsers, UserContact.user_id == AllUsers.id).filter(
+                UserContact.contact_id.in_(ids[start:start + SQLITE_MAX_PARAMETERS]))
+            for watcher, contact_id in query:
+                watchers.setdefault(watcher, []).append(names[contact_id])
+        return watchers
+
     def get_msg_count_info(self) -> List[dict]:
         """Получить информацию о количестве сообщений"""
         query = self.session.query(
-            AllUsers.username, AllUsers.last_login, UserHistory.sent,
+            AllUsers.username, AllUsers.last_login, UserHistory.id, UserHistory.sent,
             UserHistory.accepted).join(AllUsers)
+        rows, sent, accepted = self._read_with_pending_counters(query)
         return [
             {'username': el.username, 'last_login': str(el.last_login),
-             'sent': str(el.sent), 'accepted': str(el.accepted)}
-            for el in query
+             'sent': str(el.sent + sent[el.id]), 'accepted': str(el.accepted + accepted[el.id])}
+            for el in rows
         ]
 
+    def _read_with_pending_counters(self, query) -> Tuple[list, Counter, Counter]:
+        """Чтение строк счётчиков вместе с ещё не записанными в БД приростами.
+
+        Запрос выполняется без блокировки; если за это время запись счётчиков
+        была зафиксирована, чтение повторяется.
+        """
+        while True:
+            with self._counters_lock:
+                generation = self._flush_generation
+                sent = self._sent_deltas + self._flushing[0]
+                accepted = self._accepted_deltas + self._flushing[1]
+            rows = query.all()
+            if generation == self._flush_generation:
+                return rows, sent, accepted
+
     def is_user_registered(self, username: str) -> bool:
-        return bool(self.get_user_by_name(username))
+        return self._get_cached_user(username) is not None
 
 
 if __name__ == '__main__':
@@ -220,9 +932,45 @@ if __name__ == '__main__':
     __test_variable.add_contact('user_01', 'user_02')
     __test_variable.add_contact('user_01', 'user_03')
     __test_variable.del_contact('user_01', 'user_03')
+    _contacts_revision = __test_variable.get_contacts_revision('user_01')
+    assert __test_variable.get_contacts_delta('user_01') == (_contacts_revision, ['user_02'], None)
+    __test_variable.add_contact('user_01', 'user_03')
+    __test_variable.add_contact('user_01', 'user_04')
+    __test_variable.del_contact('user_01', 'user_04')
+    assert __test_variable.get_contacts_delta('user_01', _contacts_revision)[1:] == (['user_03'], ['user_04'])
+    _watchers = __test_variable.get_contact_watchers(['user_02', 'user_03', 'user_04', 'user_13'])
+    assert {key: sorted(value) for key, value in _watchers.items()} == {'user_01': ['user_02', 'user_03']}
     assert __test_variable.get_list_of_usernames() == [
         'user_01', 'user_02', 'user_03', 'user_04'], 'Error in get_list_of_usernames'
+    _revision = __test_variable.get_users_revision()
+    assert __test_variable.get_users_delta() == (_revision, ['user_01', 'user_02', 'user_03', 'user_04'], None)
+    __test_variable.spool_message('user_04', {'from': 'user_01', 'to': 'user_04', 'mess_text': '1'}, limit=2)
+    __test_variable.spool_message('user_04', {'from': 'user_02', 'to': 'user_04', 'mess_text': '2'}, limit=2)
+    assert not __test_variable.spool_message('user_04', {'from': 'user_01', 'mess_text': '3'}, limit=2)
+    with __test_variable.batch():
+        __test_variable.user_logout('user_01')
+        __test_variable.user_logout('user_02')
+    _spooled = __test_variable.peek_spooled_messages('user_04', ttl=3600)
+    assert [el['mess_text'] for _, el in _spooled] == ['1', '2']
+    assert __test_variable.peek_spooled_messages('user_04', ttl=3600) == _spooled, 'Error in peek_spooled_messages'
+    __test_variable.ack_spooled_messages('user_04', _spooled)
+    assert __test_variable.peek_spooled_messages('user_04', ttl=3600) == []
+    __test_variable.create_group('group_01', 'user_01')
+    __test_variable.add_group_member('group_01', 'user_01', 'user_02')
+    __test_variable.add_group_member('group_01', 'user_02', 'user_03')
+    __test_variable.remove_group_member('group_01', 'user_02', 'user_02')
+    assert __test_variable.get_group_members('group_01') == {'user_01', 'user_03'}, 'Error in group members'
+    assert __test_variable.get_user_groups('user_03') == ['group_01'], 'Error in get_user_groups'
+    __test_variable.forget_group('group_01')
+    assert __test_variable.get_group_members('group_01') == {'user_01', 'user_03'}, 'Error in group cache'
+    assert __test_variable.spool_group_message(['user_02', 'user_04'], {'from': 'user_01', 'group': 'group_01'}, 1) == 2
+    assert __test_variable.spool_group_message(['user_04'], {'from': 'user_01', 'group': 'group_01'}, 1) == 0
     __test_variable.del_user('user_03')
+    assert __test_variable.get_group_members('group_01') == {'user_01'}, 'Error in del_user'
+    __test_variable.add_users([('user_05', 'password_hash')])
+    assert __test_variable.get_users_delta(_revision) == (_revision + 2, ['user_05'], ['user_03'])
+    assert __test_variable.get_users_delta(_revision + 2).added == []
+    assert __test_variable.get_contacts_delta('user_01', _contacts_revision).removed == ['user_03', 'user_04']
     pprint(__test_variable.get_active_users())
     print('=' * 42)
     pprint(__test_variable.get_login_history())
@@ -231,5 +979,13 @@ if __name__ == '__main__':
     pprint(__test_variable.get_contacts('user_01'))
     print('=' * 42)
     pprint(__test_variable.get_msg_count_info())
+    _page = __test_variable.get_login_history_page(limit=2)
+    assert [el[0] for el in _page.rows] == ['user_04', 'user_02'] and _page.cursor, 'Error in get_login_history_page'
+    assert [el[0] for el in __test_variable.get_login_history_page(_page.cursor, limit=2).rows] == ['user_01']
+    assert __test_variable.get_login_history_page(username='user_04').rows[0][0] == 'user_04'
+    _page = __test_variable.get_msg_count_page(limit=2)
+    assert [el[0] for el in _page.rows] == ['user_01', 'user_02'] and _page.cursor == 'user_02'
+    assert __test_variable.get_msg_count_page(_page.cursor, limit=2).rows[0][:1] == ('user_04',)
+    assert __test_variable.get_msg_count_page(username_prefix='user_02').rows[0][2:] == (1, 2)
     print(__test_variable.is_user_registered('user_01'))
     print(__test_variable.is_user_registered('user_13'))
@@ -37,6 +37,19 @@ class LoginHistory:
                f"address='{self.ip_address}:{self.port}')"
 
 
+class LoginHistoryDaily:
+    def __init__(self, user_id, day, logins, first_login, last_login):
+        self.id = None
+        self.user_id = user_id
+        self.day = day
+        self.logins = logins
+        self.first_login = first_login
+        self.last_login = last_login
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id!r}, user_id={self.user_id!r}, day={self.day!r})"
+
+
 class UserContact:
     def __init__(self, user_id, contact_id):
         self.id = None
@@ -56,3 +69,57 @@ class UserHistory:
 
     def __repr__(self):
         return f"{self.__class__.__name__}(id={self.id!r}, user_id={self.user_id!r})"
+
+
+class UserChange:
+    def __init__(self, username, removed=False):
+        self.revision = None
+        self.username = username
+        self.removed = removed
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(revision={self.revision!r}, username={self.username!r})"
+
+
+class ContactChange:
+    def __init__(self, user_id, contact, removed=False):
+        self.revision = None
+        self.user_id = user_id
+        self.contact = contact
+        self.removed = removed
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(revision={self.revision!r}, user_id={self.user_id!r}, " \
+               f"contact={self.contact!r})"
+
+
+class ChatGroup:
+    def __init__(self, name, owner_id, created=None):
+        self.id = None
+        self.name = name
+        self.owner_id = owner_id
+        self.created = created
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id!r}, name={self.name!r})"
+
+
+class ChatGroupMember:
+    def __init__(self, group_id, user_id):
+        self.id = None
+        self.group_id = group_id
+        self.user_id = user_id
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id!r}, group_id={self.group_id!r}, user_id={self.user_id!r})"
+
+
+class SpooledMessage:
+    def __init__(self, recipient_id, message, created):
+        self.id = None
+        self.recipient_id = recipient_id
+        self.message = message
+        self.created = created
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id!r}, recipient_id={self.recipient_id!r})"
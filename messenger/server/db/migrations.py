@@ -0,0 +1,154 @@
+import logging
+from collections import namedtuple
+
+from server import logger
+
+LOGGER_NAME = logger.__name__
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+Migration = namedtuple('Migration', ('version', 'description', 'statements'))
+
+# Миграции схемы БД сервера по возрастанию версии. Версия схемы хранится в PRAGMA user_version;
+# уже выпущенные миграции не изменяются - изменения схемы добавляются новой миграцией в конец списка.
+MIGRATIONS = (
+    Migration(1, 'индексы для поиска контактов, счётчиков и истории входов', (
+        # Дубли контактов (до уникального индекса их не проверяла БД) - оставляем первую запись
+        'DELETE FROM contacts WHERE id NOT IN '
+        '(SELECT MIN(id) FROM contacts GROUP BY user_id, contact_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_contacts_user_id_contact_id ON contacts (user_id, contact_id)',
+        'CREATE INDEX IF NOT EXISTS ix_contacts_contact_id ON contacts (contact_id)',
+        'CREATE INDEX IF NOT EXISTS ix_history_user_id ON history (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_login_history_user_id_date_time ON login_history (user_id, date_time)',
+    )),
+    Migration(2, 'индекс времени входа для постраничного просмотра истории', (
+        'CREATE INDEX IF NOT EXISTS ix_login_history_date_time ON login_history (date_time)',
+    )),
+    Migration(3, 'журнал изменений справочника пользователей для синхронизации клиентов', (
+        # Уже зарегистрированные пользователи - начальные ревизии журнала
+        'INSERT INTO user_changes (username, removed) SELECT username, 0 FROM users ORDER BY id',
+    )),
+    Migration(4, 'журнал изменений списков контактов для синхронизации клиентов', (
+        'CREATE INDEX IF NOT EXISTS ix_contact_changes_user_id_revision ON contact_changes (user_id, revision)',
+        # Существующие контакты - начальные ревизии журнала
+        'INSERT INTO contact_changes (user_id, contact, removed) '
+        'SELECT contacts.user_id, users.username, 0 FROM contacts '
+        'JOIN users ON users.id = contacts.contact_id ORDER BY contacts.id',
+    )),
+    Migration(5, 'индекс участников групп для поиска групп пользователя', (
+        'CREATE INDEX IF NOT EXISTS ix_chat_group_members_user_id ON chat_group_members (user_id)',
+    )),
+)
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(dbapi_connection) -> int:
+    return dbapi_connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def upgrade(dbapi_connection, migrations=MIGRATIONS) -> int:
+    """Применение недостающих миграций к БД; возвращает итоговую версию схемы.
+
+    Все миграции выполняются в одной транзакции BEGIN IMMEDIATE: процессы сервера,
+    одновременно открывшие старую БД, применяют их по очереди, и второй процесс
+    уже видит новую версию. При ошибке БД остаётся в исходной версии.
+    """
+    dbapi_connection.execute('BEGIN IMMEDIATE')
+    try:
+        version = get_schema_version(dbapi_connection)
+        for migration in migrations:
+            if migration.version <= version:
+                continue
+            LOGGER.info(f'Миграция БД до версии {migration.version}: {migration.description}')
+            for statement in migration.statements:
+                dbapi_connection.execute(statement)
+            version = migration.version
+        # PRAGMA не принимает параметры запроса; version - целое из списка миграций
+        dbapi_connection.execute(f'PRAGMA user_version = {int(version)}')
+        dbapi_connection.commit()
+    except BaseException:
+        dbapi_connection.rollback()
+        raise
+    return version
+
+
+# -----------------------------------------------------------------------------
+def __benchmark(users_count=100_000, contacts_per_user=10, logins_per_user=5, queries=200):
+    """Время запросов ServerDatabase на БД без индексов (версия 0) и после миграции"""
+    import random
+    import sqlite3
+    import tempfile
+    import time
+    from pathlib import Path
+
+    from server.db.database import ServerDatabase
+    from server.db.definitions import UserContact, UserHistory
+
+    logging.disable(logging.INFO)
+    directory = tempfile.TemporaryDirectory()
+    path = str(Path(directory.name) / 'benchmark.db3')
+    database = ServerDatabase(path)
+
+    # Файл БД до миграций: удаляем созданные ими индексы и сбрасываем версию
+    connection = sqlite3.connect(path)
+    for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                    "AND (name LIKE 'ix_contacts%' OR name LIKE 'ux_contacts%' "
+                                    "OR name LIKE 'ix_history%' OR name LIKE 'ix_login_history%')").fetchall():
+        connection.execute(f'DROP INDEX {name}')
+    connection.execute('PRAGMA user_version = 0')
+    random.seed(1)
+    started = time.perf_counter()
+    with connection:
+        connection.executemany('INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                               ((i, f'user_{i}', 'hash') for i in range(1, users_count + 1)))
+        connection.executemany('INSERT INTO history (user_id, sent, accepted) VALUES (?, 0, 0)',
+                               ((i,) for i in range(1, users_count + 1)))
+        connection.executemany('INSERT INTO contacts (user_id, contact_id) VALUES (?, ?)', (
+            (i, contact_id) for i in range(1, users_count + 1)
+            for contact_id in random.sample(range(1, users_count + 1), contacts_per_user)))
+        connection.executemany(
+            "INSERT INTO login_history (user_id, date_time, ip_address, port) VALUES (?, datetime('now'), ?, ?)",
+            ((i, '127.0.0.1', 7777) for i in range(1, users_count + 1) for _ in range(logins_per_user)))
+    connection.close()
+    print(f'Заполнение БД: {users_count:,} пользователей, {users_count * contacts_per_user:,} контактов, '
+          f'{users_count * logins_per_user:,} входов - {time.perf_counter() - started:.1f} с')
+    database._load_users()
+
+    usernames = [f'user_{random.randint(1, users_count)}' for _ in range(queries)]
+    cases = {
+        'get_contacts': lambda name: database.get_contacts(name),
+        'add_contact (есть)': lambda name: database.add_contact(name, database.get_contacts(name)[0]),
+        'contact_id (del_user)': lambda name: database.session.query(UserContact).filter_by(
+            contact_id=database._users[name].id).count(),
+        'history.user_id': lambda name: database.session.query(UserHistory.id).filter_by(
+            user_id=database._users[name].id).first(),
+        'get_login_history': lambda name: database.get_login_history(name),
+    }
+
+    def measure():
+        result = dict()
+        for title, case in cases.items():
+            started = time.perf_counter()
+            for name in usernames:
+                case(name)
+            database.session.rollback()
+            result[title] = (time.perf_counter() - started) / len(usernames) * 1000
+        return result
+
+    before = measure()
+    raw_connection = database.session.get_bind().raw_connection()
+    try:
+        started = time.perf_counter()
+        upgrade(raw_connection.dbapi_connection)
+        print(f'Миграция до версии {SCHEMA_VERSION}: {time.perf_counter() - started:.1f} с')
+    finally:
+        raw_connection.close()
+    after = measure()
+    for title in cases:
+        print(f'{title:>22}: без индексов {before[title]:>9.3f} мс | '
+              f'с индексами {after[title]:>7.3f} мс | x{before[title] / after[title]:,.0f}')
+    database.session.close()
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    __benchmark()
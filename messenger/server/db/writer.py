@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+from server import logger
+from server.db.database import ServerDatabase
+
+LOGGER_NAME = logger.__name__
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+class DatabaseWriter:
+    """Поток записи в БД сервера.
+
+    Изменения БД ставятся в ограниченную очередь и выполняются одним потоком:
+    подряд идущие операции (до max_batch) объединяются в одну транзакцию.
+    Ошибка одной операции откатывает только её изменения (точка сохранения)
+    и не затрагивает остальные операции пакета.
+    Каждая операция возвращает Future с результатом; заполненная очередь
+    блокирует поставщика (обратное давление на сетевой цикл).
+    Между пакетами и при простое выполняются фоновые задачи (housekeeping).
+    """
+    _STOP = object()
+
+    def __init__(self, database: ServerDatabase, max_queue: int = 10_000, max_batch: int = 256,
+                 idle_interval: float = 1.0, housekeeping: Iterable[Callable[[], None]] = ()):
+        self.database = database
+        self.max_batch = max_batch
+        self.idle_interval = idle_interval
+        self.housekeeping = tuple(housekeeping)
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._local = threading.local()  # Собираемая группа операций потока-поставщика (group)
+        # Метрики для мониторинга
+        self.operations = 0
+        self.batches = 0
+        self.last_commit_latency = 0.0  # с
+        self.max_commit_latency = 0.0
+        self._commit_time_total = 0.0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Выполнение оставшихся в очереди операций и остановка потока"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Постановка изменения БД в очередь; func - метод ServerDatabase"""
+        future = Future()
+        group = getattr(self._local, 'group', None)
+        if group is not None:
+            group.append((func, args, kwargs, future))
+        else:
+            self._queue.put((func, args, kwargs, future))
+        return future
+
+    @contextmanager
+    def group(self):
+        """Операции, поставленные в очередь внутри блока этим потоком, выполняются одной транзакцией.
+
+        Группа встаёт в очередь целиком при выходе из блока и не делится между пакетами.
+        Блок получает список уже поставленных операций: (func, args, kwargs, future).
+        """
+        operations = self._local.group = []
+        try:
+            yield operations
+        finally:
+            self._local.group = None
+            if operations:
+                self._queue.put(operations)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def get_metrics(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'operations': self.operations,
+            'batches': self.batches,
+            'last_commit_ms': self.last_commit_latency * 1000,
+            'max_commit_ms': self.max_commit_latency * 1000,
+            'avg_commit_ms': self._commit_time_total / self.batches * 1000 if self.batches else 0.0,
+        }
+
+    # -------------------------------------------------------------------------
+    def _run(self):
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.idle_interval)
+            except queue.Empty:
+                self._run_housekeeping()
+                continue
+            batch = []
+            while item is not self._STOP:
+                if isinstance(item, list):  # группа операций (group)
+                    batch.extend(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            running = item is not self._STOP
+            if batch:
+                self._execute(batch)
+            self._run_housekeeping()
+        self.database.flush_counters(force=True)  # при остановке сбрасываем накопленные счётчики
+
+    def _execute(self, batch: list):
+        results = []
+        started = time.perf_counter()
+        try:
+            with self.database.batch():
+                for func, args, kwargs, future in batch:
+                    # Каждая операция - в своей точке сохранения: ошибка откатывает только её изменения
+                    try:
+                        with self.database.savepoint():
+                            result = func(*args, **kwargs)
+                    except ValueError as err:  # отказ операции (например, неверный пароль), не ошибка БД
+                        results.append((future, None, err))
+                    except Exception as err:
+                        LOGGER.error(f'Ошибка операции записи в БД {getattr(func, "__name__", func)}: {err}')
+                        results.append((future, None, err))
+                    else:
+                        results.append((future, result, None))
+        except Exception as err:
+            LOGGER.error(f'Ошибка записи в БД, отменено операций: {len(batch)}: {err}')
+            for *_, future in batch:
+                future.set_exception(err)
+            return
+        latency = time.perf_counter() - started
+        self.operations += len(batch)
+        self.batches += 1
+        self.last_commit_latency = latency
+        self.max_commit_latency = max(self.max_commit_latency, latency)
+        self._commit_time_total += latency
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _run_housekeeping(self):
+        for func in self.housekeeping:
+            try:
+                func()
+            except Exception as err:
+                LOGGER.error(f'Ошибка фоновой задачи БД {func!r}: {err}')
@@ -0,0 +1,106 @@
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, Optional
+
+from common import settings
+
+Route = namedtuple('Route', ('handler', 'required', 'owner_field'))
+
+
+class Dispatcher:
+    """Реестр обработчиков запросов: значение ACTION -> обработчик и проверка полей.
+
+    Набор обязательных полей каждого действия собирается в frozenset при регистрации,
+    поэтому разбор сообщения - один поиск в словаре и одна проверка подмножества ключей.
+    """
+
+    def __init__(self, is_owner: Callable[[str, object], bool]):
+        self._routes: Dict[str, Route] = dict()
+        self._is_owner = is_owner
+
+    def register(self, action: str, handler: Callable[[dict, object], None],
+                 required: Iterable[str] = (), owner_field: Optional[str] = None):
+        """Регистрация обработчика действия.
+
+        required - поля, обязательные в сообщении (ACTION проверяется поиском маршрута);
+        owner_field - поле с именем пользователя, который должен владеть соединением.
+        """
+        fields = frozenset(required) | ({owner_field} if owner_field else frozenset())
+        self._routes[action] = Route(handler, fields, owner_field)
+
+    def dispatch(self, message: dict, client) -> bool:
+        """Вызов обработчика сообщения; False - если сообщение не прошло проверку"""
+        route = self._routes.get(message.get(settings.ACTION))
+        if route is None or not message.keys() >= route.required:
+            return False
+        if route.owner_field and not self._is_owner(message[route.owner_field], client):
+            return False
+        route.handler(message, client)
+        return True
+
+
+# -----------------------------------------------------------------------------
+def __benchmark(number=200_000):
+    """Сравнение пропускной способности разбора: цепочка условий против таблицы маршрутов"""
+    import timeit
+
+    client = object()
+    clients = {'user_01': client}
+
+    def handler(message, sock):
+        pass
+
+    def legacy_dispatch(message, sock):
+        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.PRESENCE,
+                settings.TIME in message, settings.USER in message)):
+            return handler(message, sock)
+        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.MESSAGE,
+                settings.DESTINATION in message, settings.TIME in message,
+                settings.SENDER in message, settings.MESSAGE_TEXT in message,
+                clients.get(message.get(settings.SENDER)) == sock)):
+            return handler(message, sock)
+        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.EXIT,
+                settings.ACCOUNT_NAME in message,
+                clients.get(message.get(settings.ACCOUNT_NAME)) == sock)):
+            return handler(message, sock)
+        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.GET_CONTACTS,
+                settings.USER in message, clients.get(message.get(settings.USER)) == sock)):
+            return handler(message, sock)
+        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.ADD_CONTACT,
+                settings.ACCOUNT_NAME in message, settings.USER in message,
+                clients.get(message.get(settings.USER)) == sock)):
+            return handler(message, sock)
+        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.REMOVE_CONTACT,
+                settings.ACCOUNT_NAME in message, settings.USER in message,
+                clients.get(message.get(settings.USER)) == sock)):
+            return handler(message, sock)
+        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.USERS_REQUEST,
+                settings.ACCOUNT_NAME in message,
+                clients.get(message.get(settings.ACCOUNT_NAME)) == sock)):
+            return handler(message, sock)
+
+    dispatcher = Dispatcher(lambda username, sock: clients.get(username) is sock)
+    dispatcher.register(settings.PRESENCE, handler, (settings.TIME, settings.USER))
+    dispatcher.register(settings.MESSAGE, handler, (settings.DESTINATION, settings.TIME, settings.MESSAGE_TEXT),
+                        owner_field=settings.SENDER)
+    dispatcher.register(settings.EXIT, handler, owner_field=settings.ACCOUNT_NAME)
+    dispatcher.register(settings.GET_CONTACTS, handler, owner_field=settings.USER)
+    dispatcher.register(settings.ADD_CONTACT, handler, (settings.ACCOUNT_NAME,), owner_field=settings.USER)
+    dispatcher.register(settings.REMOVE_CONTACT, handler, (settings.ACCOUNT_NAME,), owner_field=settings.USER)
+    dispatcher.register(settings.USERS_REQUEST, handler, owner_field=settings.ACCOUNT_NAME)
+
+    messages = {
+        'message': {settings.ACTION: settings.MESSAGE, settings.SENDER: 'user_01', settings.DESTINATION: 'user_02',
+                    settings.TIME: 1.0, settings.MESSAGE_TEXT: 'Привет!'},
+        'get_users': {settings.ACTION: settings.USERS_REQUEST, settings.TIME: 1.0,
+                      settings.ACCOUNT_NAME: 'user_01'},
+        'invalid': {settings.ACTION: 'unknown', settings.TIME: 1.0},
+    }
+    for name, message in messages.items():
+        legacy = timeit.timeit(lambda: legacy_dispatch(message, client), number=number)
+        table = timeit.timeit(lambda: dispatcher.dispatch(message, client), number=number)
+        print(f'{name:>10}: if-chain {number / legacy:>12,.0f} msg/s | '
+              f'table {number / table:>12,.0f} msg/s | x{legacy / table:.1f}')
+
+
+if __name__ == '__main__':
+    __benchmark()
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from common import settings, utils
+from server import logger
+from server.connection import Connection, connections_in
+from server.fanout import encode_once
+
+LOGGER_NAME = logger.__name__
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+class AsyncConnection(Connection):
+    """Клиентское соединение движка asyncio"""
+    __slots__ = ('reader', 'writer')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        super().__init__(writer.get_extra_info('socket'), writer.get_extra_info('peername'))
+        self.reader = reader
+        self.writer = writer
+
+    def queue_size(self) -> int:
+        """Размер буфера исходящих данных транспорта в байтах"""
+        return self.writer.transport.get_write_buffer_size()
+
+    def write(self, data: bytes, close_after: bool = False, limit: int = 0):
+        if self.writer.is_closing():
+            return
+        self.writer.write(data)
+        if close_after:
+            self.writer.close()
+        elif limit and self.queue_size() > limit:
+            LOGGER.warning(f'Клиент {self.address} не успевает принимать данные '
+                           f'({self.queue_size()} байт в очереди), соединение закрыто')
+            self.writer.transport.abort()
+
+
+class AsyncioEngine:
+    """Движок сервера на asyncio.
+
+    Каждое соединение обслуживается корутиной поверх потоков asyncio.start_server.
+    Обработчики сервера (и блокирующие обращения к БД внутри них) выполняются
+    в отдельном потоке-исполнителе, поэтому цикл событий не блокируется.
+    Исполнитель однопоточный - обработчики работают последовательно, как и в SelectorEngine.
+    В нём же разбираются принятые байты: буфер соединения меняют и разбор, и переход
+    на согласованный формат (apply_features), поэтому буфер используется одним потоком.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.connections = server.connections
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='server-handlers')
+
+    def call_soon(self, callback, *args):
+        """Выполнение вызова в потоке обработчиков (безопасно для вызова из любого потока)"""
+        self.executor.submit(self._call, callback, *args)
+
+    def call_later(self, delay: float, callback, *args):
+        """Вызов через delay секунд в потоке обработчиков (безопасно для вызова из любого потока)"""
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, self.call_soon, callback, *args)
+
+    def _call(self, callback, *args):
+        """Отложенный вызов; ошибка закрывает только соединения из его аргументов.
+
+        Future исполнителя никто не ждёт, поэтому ошибка записывается в журнал здесь.
+        """
+        try:
+            callback(*args)
+        except Exception:
+            LOGGER.exception(f'Ошибка отложенного вызова {callback!r}')
+            for client in connections_in(args):
+                self.close_connection(client)
+        try:
+            self.server.process_messages()
+        except Exception:
+            LOGGER.exception('Ошибка доставки сообщений')
+
+    def disconnect_user(self, username: str):
+        """Запрос на отключение пользователя (безопасен для вызова из любого потока)"""
+        self.call_soon(self._disconnect_user, username)
+
+    def _disconnect_user(self, username: str):
+        client = self.connections.get_by_username(username)
+        if client:
+            self.close_connection(client)
+
+    def send_message(self, client: AsyncConnection, message: dict, close_after: bool = False):
+        """Отправка сообщения; вызывается из потока-исполнителя обработчиков"""
+        client.messages_sent += 1
+        data = client.buffer.encode(message)
+        self.loop.call_soon_threadsafe(client.write, data, close_after, self.server.OUTGOING_LIMIT)
+
+    def send_messages(self, client: AsyncConnection, messages: list):
+        """Отправка пачки сообщений одной записью в транспорт"""
+        if not messages:
+            return
+        client.messages_sent += len(messages)
+        data = b''.join(client.buffer.encode(message) for message in messages)
+        self.loop.call_soon_threadsafe(client.write, data, False, self.server.OUTGOING_LIMIT)
+
+    def send_to_many(self, clients: list, message: dict):
+        """Отправка одного сообщения многим клиентам одним переходом в цикл событий"""
+        pairs = list(encode_once(message, clients))
+        for client, _ in pairs:
+            client.messages_sent += 1
+        self.loop.call_soon_threadsafe(self._write_many, pairs)
+
+    def _write_many(self, pairs: list):
+        for client, data in pairs:
+            client.write(data, False, self.server.OUTGOING_LIMIT)
+
+    def queue_size(self, client: AsyncConnection) -> int:
+        """Размер очереди исходящих данных соединения в байтах"""
+        return client.queue_size()
+
+    def apply_features(self, client: AsyncConnection, features: dict):
+        """Переход соединения на формат, согласованный в presence-сообщении"""
+        messages = client.buffer.apply_features(features)
+        if messages:  # кадры, пришедшие вслед за presence, - после ответа на него
+            self.call_soon(self._process_messages, messages, client)
+
+    def close_connection(self, client: AsyncConnection):
+        """Закрытие соединения; вызывается из потока-исполнителя обработчиков"""
+        self.server.forget_client(client)
+        self.loop.call_soon_threadsafe(client.writer.close)
+
+    def _process_data(self, data: bytes, client: AsyncConnection):
+        messages = client.buffer.feed(data)
+        if messages:
+            self._process_messages(messages, client)
+
+    def _process_messages(self, messages: list, client: AsyncConnection):
+        for message in messages:
+            if client not in self.connections:
+                break  # соединение закрыто обработчиком
+            client.messages_received += 1
+            self.server.process_incoming_message(message, client)
+        self.server.process_messages()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = AsyncConnection(reader, writer)
+        writer.transport.set_write_buffer_limits(
+            high=self.server.OUTGOING_HIGH_WATER, low=self.server.OUTGOING_LOW_WATER)
+        LOGGER.info(f'Установленно соединение с {client.address}')
+        await self.loop.run_in_executor(self.executor, self.connections.add, client)
+        try:
+            while not writer.is_closing():
+                data = await reader.read(settings.MAX_PACKET_LENGTH)
+                if not data:
+                    break
+                await self.loop.run_in_executor(self.executor, self._process_data, data, client)
+                # Клиент не забирает ответы - не читаем новые запросы, пока буфер не разгрузится
+                await writer.drain()
+        except (OSError, TypeError, ValueError, RecursionError):
+            pass
+        except Exception:
+            LOGGER.exception(f'Ошибка обработки запроса клиента {client.address}, соединение закрыто')
+        finally:
+            LOGGER.debug(f'Клиент {client.address} отключился от сервера')
+            await self.loop.run_in_executor(self.executor, self.server.forget_client, client)
+            writer.close()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        LOGGER.info(f"Запущен сервер (asyncio): '{self.server.ip_address}:{self.server.port}'")
+        server = await asyncio.start_server(
+            self._handle_connection, self.server.ip_address or None, self.server.port,
+            backlog=self.server.MAX_NUMBER_CONNECTIONS)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        asyncio.run(self._serve())
@@ -0,0 +1,265 @@
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import time
+from collections import deque
+
+from common import settings, utils
+from server import logger
+from server.connection import Connection, connections_in
+from server.fanout import encode_once
+
+LOGGER_NAME = logger.__name__
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+class SelectorEngine:
+    """Однопоточный движок сервера на основе selectors (epoll/kqueue/select в зависимости от ОС).
+
+    Прослушиваемый сокет и все клиентские сокеты зарегистрированы в селекторе, поэтому
+    приём подключений, чтение и запись выполняются только по готовности сокета.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.connections = server.connections
+        self.selector = selectors.DefaultSelector()
+        self.socket_app = None
+        # Пара сокетов для пробуждения цикла из других потоков (GUI)
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._callbacks = deque()  # Вызовы, переданные из других потоков (GUI, поток записи БД)
+        self._timers = []  # Куча отложенных вызовов: (срок, номер, вызов, аргументы)
+        self._timer_numbers = itertools.count()
+
+    def _init_socket(self):
+        LOGGER.info(f"Запущен сервер: '{self.server.ip_address}:{self.server.port}'")
+        self.socket_app = socket.create_server(
+            (self.server.ip_address, self.server.port), reuse_port=self.server.router is not None)
+        self.socket_app.listen(self.server.MAX_NUMBER_CONNECTIONS)
+        self.socket_app.setblocking(False)
+        self.selector.register(self.socket_app, selectors.EVENT_READ, (self._accept_connections, self.socket_app))
+        self.selector.register(self._wakeup_reader, selectors.EVENT_READ, (self._process_wakeup, self._wakeup_reader))
+        if self.server.router:
+            self.server.router.attach(self.selector)
+
+    def call_soon(self, callback, *args):
+        """Выполнение вызова в потоке цикла (безопасно для вызова из любого потока)"""
+        self._callbacks.append((callback, args))
+        try:
+            self._wakeup_writer.send(b'\0')
+        except OSError:
+            pass  # буфер пробуждения заполнен - цикл и так проснётся
+
+    def call_later(self, delay: float, callback, *args):
+        """Вызов через delay секунд в потоке цикла (вызывается только из потока цикла)"""
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_numbers), callback, args))
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._timers)
+            self._run_callback(callback, args)
+
+    def _run_callback(self, callback, args: tuple):
+        """Отложенный вызов; ошибка закрывает только соединения из его аргументов, цикл продолжает работу"""
+        try:
+            callback(*args)
+        except Exception:
+            LOGGER.exception(f'Ошибка отложенного вызова {callback!r}')
+            for client in connections_in(args):
+                self.close_connection(client)
+
+    def disconnect_user(self, username: str):
+        """Запрос на отключение пользователя (безопасен для вызова из любого потока)"""
+        self.call_soon(self._disconnect_user, username)
+
+    def _disconnect_user(self, username: str):
+        client = self.connections.get_by_username(username)
+        if client:
+            self.close_connection(client)
+
+    def _process_wakeup(self, sock: socket.socket, mask: int):
+        try:
+            while sock.recv(settings.MAX_PACKET_LENGTH):
+                pass
+        except BlockingIOError:
+            pass
+        while self._callbacks:
+            callback, args = self._callbacks.popleft()
+            self._run_callback(callback, args)
+
+    def _accept_connections(self, sock: socket.socket, mask: int):
+        """Приём всех ожидающих подключений прослушиваемого сокета"""
+        while True:
+            try:
+                client_socket, address = sock.accept()
+            except BlockingIOError:
+                return
+            except OSError as err:
+                LOGGER.error(f'Не удалось принять подключение: {err}')
+                return
+            LOGGER.info(f'Установленно соединение с {address}')
+            client_socket.setblocking(False)
+            client = Connection(client_socket, address)
+            self.connections.add(client)
+            self.selector.register(client_socket, selectors.EVENT_READ, (self._process_client_event, client))
+
+    def _process_client_event(self, client: Connection, mask: int):
+        if mask & selectors.EVENT_READ:
+            try:
+                data = client.sock.recv(settings.MAX_PACKET_LENGTH)
+                if not data:
+                    raise ConnectionResetError
+                messages = client.buffer.feed(data)
+            except BlockingIOError:
+                messages = []  # ложное срабатывание готовности
+            except (OSError, TypeError, ValueError, RecursionError):
+                LOGGER.debug(f'Клиент {client!r} отключился от сервера')
+                self.close_connection(client)
+                return
+            if not self._process_messages(client, messages):
+                return
+        if mask & selectors.EVENT_WRITE and client.outgoing is not None:
+            self._flush_outgoing(client)
+
+    def _process_messages(self, client: Connection, messages: list) -> bool:
+        """Обработка собранных сообщений клиента; False - соединение закрыто"""
+        try:
+            for message in messages:
+                if client not in self.connections:
+                    return False  # соединение закрыто обработчиком
+                client.messages_received += 1
+                self.server.process_incoming_message(message, client)
+        except (OSError, TypeError, ValueError, RecursionError):
+            LOGGER.debug(f'Клиент {client!r} отключился от сервера')
+            self.close_connection(client)
+            return False
+        except Exception:
+            LOGGER.exception(f'Ошибка обработки запроса клиента {client!r}, соединение закрыто')
+            self.close_connection(client)
+            return False
+        return client in self.connections
+
+    def _update_events(self, client: Connection):
+        events = 0
+        if not client.throttled:
+            events |= selectors.EVENT_READ
+        if client.outgoing is not None:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(client.sock, events, (self._process_client_event, client))
+
+    def send_message(self, client: Connection, message: dict, close_after: bool = False):
+        """Отправка сообщения клиенту.
+
+        Если очередь соединения пуста, данные отправляются сразу; не поместившийся в буфер ядра
+        остаток ставится в очередь и отправляется при готовности сокета к записи.
+        """
+        if client not in self.connections:
+            return
+        if close_after:
+            client.closing = True
+        client.messages_sent += 1
+        self._send_data(client, client.buffer.encode(message))
+
+    def send_messages(self, client: Connection, messages: list):
+        """Отправка пачки сообщений клиенту одной записью в сокет"""
+        if client not in self.connections or not messages:
+            return
+        client.messages_sent += len(messages)
+        self._send_data(client, b''.join(client.buffer.encode(message) for message in messages))
+
+    def send_to_many(self, clients: list, message: dict):
+        """Отправка одного сообщения многим клиентам (кодируется один раз на формат соединений)"""
+        for client, data in encode_once(message, clients):
+            client.messages_sent += 1
+            self._send_data(client, data)
+
+    def _send_data(self, client: Connection, data: bytes):
+        if client.outgoing is None:
+            try:
+                sent = client.sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError as err:
+                LOGGER.debug(f'Ошибка отправки клиенту {client!r}: {err}')
+                self.close_connection(client)
+                return
+            if sent == len(data):
+                if client.closing:
+                    self.close_connection(client)
+                return
+            client.outgoing = bytearray()
+            data = memoryview(data)[sent:]
+            self._update_events(client)
+        client.outgoing += data
+        self._check_backpressure(client)
+
+    def _check_backpressure(self, client: Connection):
+        """Ограничение очереди: выше верхней отметки перестаём читать из сокета, выше предела - отключаем"""
+        size = len(client.outgoing)
+        if size > self.server.OUTGOING_LIMIT:
+            LOGGER.warning(f'Клиент {client!r} не успевает принимать данные '
+                           f'({size} байт в очереди), соединение закрыто')
+            self.close_connection(client)
+        elif size > self.server.OUTGOING_HIGH_WATER and not client.throttled:
+            LOGGER.debug(f'Чтение от клиента {client!r} приостановлено: {size} байт в очереди')
+            client.throttled = True
+            self._update_events(client)
+
+    def _flush_outgoing(self, client: Connection):
+        queue = client.outgoing
+        try:
+            sent = client.sock.send(queue)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            LOGGER.debug(f'Ошибка отправки клиенту {client!r}: {err}')
+            self.close_connection(client)
+            return
+        del queue[:sent]
+        if queue:
+            if client.throttled and len(queue) < self.server.OUTGOING_LOW_WATER:
+                client.throttled = False
+                self._update_events(client)
+            return
+        client.outgoing = None
+        if client.closing:
+            self.close_connection(client)
+            return
+        client.throttled = False
+        self._update_events(client)
+
+    def queue_size(self, client: Connection) -> int:
+        """Размер очереди исходящих данных соединения в байтах"""
+        return client.queue_size()
+
+    def apply_features(self, client: Connection, features: dict):
+        """Переход соединения на формат, согласованный в presence-сообщении"""
+        messages = client.buffer.apply_features(features)
+        if messages:  # кадры, пришедшие вслед за presence, - после ответа на него
+            self.call_soon(self._process_messages, client, messages)
+
+    def close_connection(self, client: Connection):
+        """Закрытие соединения и удаление всех связанных с ним данных"""
+        if client not in self.connections:
+            return
+        self.selector.unregister(client.sock)
+        self.server.forget_client(client)
+        client.outgoing = None
+        client.sock.close()
+
+    def run(self):
+        """Цикл работы прослушиваемого сокета с клиентами"""
+        self._init_socket()
+        while True:
+            timeout = max(self._timers[0][0] - time.monotonic(), 0) if self._timers else None
+            for key, mask in self.selector.select(timeout):
+                callback, target = key.data
+                callback(target, mask)
+            self._run_timers()
+            # ----------------------------------------
+            # Распределяем принятые сообщения по очередям получателей.
+            self.server.process_messages()
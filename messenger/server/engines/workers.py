@@ -0,0 +1,236 @@
+import logging
+import selectors
+import socket
+from pathlib import Path
+from typing import Dict, Optional
+
+from common import settings, utils
+from server import logger
+from server.connection import Connection
+
+LOGGER_NAME = logger.__name__
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+# Служебные сообщения между процессами-обработчиками
+ROUTE = 'route'
+ROUTE_ONLINE = 'online'
+ROUTE_OFFLINE = 'offline'
+ROUTE_DELIVER = 'deliver'
+ROUTE_DELIVER_GROUP = 'deliver_group'
+ROUTE_GROUP_CHANGED = 'group_changed'
+ROUTE_DISCONNECT = 'disconnect'
+ROUTE_USER_DELETED = 'user_deleted'
+WORKER = 'worker'
+LINK_READ_SIZE = 64 * 1024
+
+
+def get_worker_path(directory: str, worker_id: int) -> str:
+    return str(Path(directory) / f'worker_{worker_id}.sock')
+
+
+def send_command(directory: str, workers_count: int, command: dict):
+    """Отправка служебной команды всем обработчикам (используется процессом GUI)"""
+    for worker_id in range(workers_count):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(get_worker_path(directory, worker_id))
+                utils.send_message_to_socket(sock, command, utils.MessageBuffer(framed=True))
+        except OSError as err:
+            LOGGER.error(f'Обработчик №{worker_id} недоступен: {err}')
+
+
+class WorkerRouter:
+    """Маршрутизация сообщений между процессами-обработчиками сервера.
+
+    Процессы делят прослушиваемый порт через SO_REUSEPORT, поэтому отправитель
+    и получатель могут оказаться в разных процессах. Каждый обработчик слушает
+    Unix-сокет и держит соединение с каждым из соседей; по ним рассылаются
+    события входа/выхода пользователей (локальный справочник пользователь -> обработчик)
+    и пересылаются сообщения. Все сокеты обслуживаются селектором движка.
+    """
+
+    def __init__(self, server, worker_id: int, workers_count: int, directory: str):
+        self.server = server
+        self.worker_id = worker_id
+        self.workers_count = workers_count
+        self.directory = directory
+        self.remote_users: Dict[str, int] = dict()  # пользователь -> номер обработчика
+        self.peers: Dict[int, Connection] = dict()
+        self.selector: Optional[selectors.BaseSelector] = None
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(get_worker_path(directory, worker_id))
+        self.listener.listen(workers_count + 1)
+        self.listener.setblocking(False)
+
+    def attach(self, selector: selectors.BaseSelector):
+        """Подключение к соседям и регистрация сокетов в селекторе движка.
+
+        Вызывается, когда все обработчики уже слушают свои Unix-сокеты.
+        """
+        self.selector = selector
+        selector.register(self.listener, selectors.EVENT_READ, (self._accept_links, self.listener))
+        for worker_id in range(self.workers_count):
+            if worker_id == self.worker_id:
+                continue
+            path = get_worker_path(self.directory, worker_id)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(path)
+            sock.setblocking(False)
+            link = Connection(sock, path)
+            link.buffer.framed = True
+            self.peers[worker_id] = link
+            selector.register(sock, selectors.EVENT_READ, (self._process_link_event, link))
+
+    # -------------------------------------------------------------------------
+    def is_remote_online(self, username: str) -> bool:
+        return username in self.remote_users
+
+    def announce_online(self, username: str):
+        self._broadcast({ROUTE: ROUTE_ONLINE, settings.ACCOUNT_NAME: username, WORKER: self.worker_id})
+
+    def announce_offline(self, username: str):
+        self._broadcast({ROUTE: ROUTE_OFFLINE, settings.ACCOUNT_NAME: username, WORKER: self.worker_id})
+
+    def forward(self, message: dict) -> bool:
+        """Пересылка сообщения обработчику получателя; False - получатель нигде не подключен"""
+        worker_id = self.remote_users.get(message.get(settings.DESTINATION))
+        if worker_id is None or worker_id not in self.peers:
+            return False
+        return self._write(self.peers[worker_id], {ROUTE: ROUTE_DELIVER, settings.MESSAGE: message})
+
+    def forward_group(self, message: dict, usernames: list) -> list:
+        """Пересылка сообщения группы: одна команда на обработчик со списком его получателей.
+
+        Возвращает имена получателей, не подключенных ни к одному обработчику
+        (и тех, чей обработчик недоступен).
+        """
+        by_worker = dict()
+        missed = []
+        for username in usernames:
+            worker_id = self.remote_users.get(username)
+            if worker_id is None or worker_id not in self.peers:
+                missed.append(username)
+            else:
+                by_worker.setdefault(worker_id, []).append(username)
+        for worker_id, names in by_worker.items():
+            link = self.peers.get(worker_id)  # связь могла оборваться при записи соседу
+            if link is None or not self._write(link, {ROUTE: ROUTE_DELIVER_GROUP, settings.MESSAGE: message,
+                                                      settings.LIST_INFO: names}):
+                missed.extend(names)
+        return missed
+
+    def announce_group_changed(self, group: str):
+        """Состав группы изменён - соседи перечитают его из БД"""
+        self._broadcast({ROUTE: ROUTE_GROUP_CHANGED, settings.GROUP: group})
+
+    def _broadcast(self, command: dict):
+        data = utils.encode_message(command, framed=True)
+        for link in list(self.peers.values()):
+            self._write(link, data)
+
+    # -------------------------------------------------------------------------
+    def _write(self, link: Connection, data) -> bool:
+        """Отправка команды соседу; False - связь с ним потеряна и команда не отправлена"""
+        if isinstance(data, dict):
+            data = utils.encode_message(data, framed=True)
+        if link.outgoing is None:
+            try:
+                sent = link.sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError as err:
+                LOGGER.error(f'Ошибка связи с обработчиком {link.address}: {err}')
+                self._drop_link(link)
+                return False
+            if sent == len(data):
+                return True
+            link.outgoing = bytearray()
+            data = memoryview(data)[sent:]
+            self.selector.modify(link.sock, selectors.EVENT_READ | selectors.EVENT_WRITE,
+                                 (self._process_link_event, link))
+        link.outgoing += data
+        return True
+
+    def _drop_link(self, link: Connection):
+        """Закрытие связи с соседом; пользователи оборвавшегося обработчика считаются отключившимися"""
+        if link.sock.fileno() < 0:
+            return  # связь уже закрыта
+        self.selector.unregister(link.sock)
+        link.sock.close()
+        link.outgoing = None
+        worker_id = next((worker_id for worker_id, peer in self.peers.items() if peer is link), None)
+        if worker_id is None:
+            return  # входящая связь: о сбое соседа сообщит и связь к нему
+        del self.peers[worker_id]
+        lost = [username for username, worker in self.remote_users.items() if worker == worker_id]
+        LOGGER.error(f'Потеряна связь с обработчиком {worker_id}, его пользователей: {len(lost)}')
+        for username in lost:
+            del self.remote_users[username]
+            self.server.notify_presence(username, False)
+
+    def _accept_links(self, sock: socket.socket, mask: int):
+        while True:
+            try:
+                link_socket, _ = sock.accept()
+            except BlockingIOError:
+                return
+            link_socket.setblocking(False)
+            link = Connection(link_socket, self.listener.getsockname())
+            link.buffer.framed = True
+            self.selector.register(link_socket, selectors.EVENT_READ, (self._process_link_event, link))
+
+    def _process_link_event(self, link: Connection, mask: int):
+        if mask & selectors.EVENT_READ:
+            try:
+                data = link.sock.recv(LINK_READ_SIZE)
+                if not data:
+                    raise ConnectionResetError
+                for command in link.buffer.feed(data):
+                    self._process_command(command)
+            except BlockingIOError:
+                pass
+            except (OSError, TypeError, ValueError, RecursionError):
+                self._drop_link(link)
+                return
+        if mask & selectors.EVENT_WRITE and link.outgoing is not None:
+            try:
+                sent = link.sock.send(link.outgoing)
+            except BlockingIOError:
+                return
+            except OSError as err:
+                LOGGER.error(f'Ошибка связи с обработчиком {link.address}: {err}')
+                self._drop_link(link)
+                return
+            del link.outgoing[:sent]
+            if not link.outgoing:
+                link.outgoing = None
+                self.selector.modify(link.sock, selectors.EVENT_READ, (self._process_link_event, link))
+
+    def _process_command(self, command: dict):
+        route = command.get(ROUTE)
+        username = command.get(settings.ACCOUNT_NAME)
+        if route == ROUTE_ONLINE:
+            self.remote_users[username] = command[WORKER]
+            self.server.notify_presence(username, True)
+        elif route == ROUTE_OFFLINE:
+            if self.remote_users.get(username) == command[WORKER]:
+                del self.remote_users[username]
+                self.server.notify_presence(username, False)
+        elif route == ROUTE_DELIVER:
+            # Получатель мог отключиться, пока сообщение было в пути
+            message = command[settings.MESSAGE]
+            if not self.server.deliver_local(message):
+                self.server.spool_message(message)
+        elif route == ROUTE_DELIVER_GROUP:
+            message = command[settings.MESSAGE]
+            missed = self.server.deliver_group_local(message, command[settings.LIST_INFO])
+            if missed:
+                self.server.spool_group_message(message, missed)
+        elif route == ROUTE_GROUP_CHANGED:
+            self.server.database.forget_group(command[settings.GROUP])
+        elif route in (ROUTE_DISCONNECT, ROUTE_USER_DELETED):
+            if route == ROUTE_USER_DELETED:
+                self.server.database.forget_user(username)
+            client = self.server.connections.get_by_username(username)
+            if client:
+                self.server.close_connection(client)
@@ -0,0 +1,108 @@
+from typing import Iterable, Iterator, Tuple
+
+from common import utils
+from server.connection import Connection
+
+
+def encode_once(message: dict, clients: Iterable[Connection]) -> Iterator[Tuple[Connection, bytes]]:
+    """Пары (соединение, данные) для рассылки одного сообщения многим клиентам.
+
+    Сообщение кодируется один раз для каждого формата соединений (заголовок длины,
+    кодек, сжатие) - обычно это одна-две сериализации на всю группу.
+    """
+    encoded = dict()
+    for client in clients:
+        buffer = client.buffer
+        wire_format = (buffer.framed, buffer.codec, buffer.compress)
+        data = encoded.get(wire_format)
+        if data is None:
+            data = encoded[wire_format] = utils.encode_message(message, *wire_format)
+        yield client, data
+
+
+# -----------------------------------------------------------------------------
+def __benchmark(members=5_000, number=50):
+    """Рассылка сообщения группы: кодирование для каждого получателя и один раз на формат"""
+    import logging
+    import tempfile
+    import time
+    from pathlib import Path
+    from types import SimpleNamespace
+
+    from common import settings
+    from server.connection import ConnectionRegistry
+    from server.db.database import ServerDatabase
+    from server.engines.selector import SelectorEngine
+
+    class NullSocket:
+        """Сокет, принимающий любые данные сразу (измеряется только работа сервера)"""
+        _next_fileno = 1_000_000
+
+        def __init__(self):
+            NullSocket._next_fileno += 1
+            self._fileno = NullSocket._next_fileno
+
+        def fileno(self):
+            return self._fileno
+
+        @staticmethod
+        def send(data):
+            return len(data)
+
+    logging.disable(logging.INFO)
+    directory = tempfile.TemporaryDirectory()
+    database = ServerDatabase(str(Path(directory.name) / 'benchmark.db3'))
+    usernames = [f'user_{i:05}' for i in range(members)]
+    database.add_users((username, 'hash') for username in usernames)
+    database.create_group('benchmark', usernames[0])
+    for username in usernames[1:]:
+        database.add_group_member('benchmark', usernames[0], username)
+
+    connections = ConnectionRegistry()
+    server = SimpleNamespace(connections=connections, OUTGOING_LIMIT=4 * 1024 * 1024,
+                             OUTGOING_HIGH_WATER=256 * 1024, OUTGOING_LOW_WATER=64 * 1024)
+    engine = SelectorEngine(server)
+    binary = {settings.FRAMING: settings.FRAMING_LENGTH_PREFIX, settings.CODEC: settings.CODEC_BINARY}
+    for number_, username in enumerate(usernames):
+        client = Connection(NullSocket(), ('127.0.0.1', number_))
+        if number_ % 2:  # половина клиентов - на двоичном кодеке
+            client.buffer.apply_features(binary)
+        connections.add(client)
+        connections.bind(client, username)
+    message = {settings.ACTION: settings.GROUP_MESSAGE, settings.SENDER: usernames[0],
+               settings.GROUP: 'benchmark', settings.TIME: time.time(), settings.MESSAGE_TEXT: 'Привет, группа! ' * 8}
+
+    def recipients():
+        sender = message[settings.SENDER]
+        return [connections.get_by_username(username) for username in database.get_group_members('benchmark')
+                if username != sender]
+
+    def per_recipient():
+        for client in recipients():
+            engine.send_message(client, message)
+            database.msg_registration(message[settings.SENDER], client.username)
+
+    def fan_out():
+        clients = recipients()
+        engine.send_to_many(clients, message)
+        database.group_msg_registration(message[settings.SENDER], [client.username for client in clients])
+
+    for title, case in (('кодирование на получателя', per_recipient), ('кодирование на формат', fan_out)):
+        timings = []
+        for _ in range(number):
+            started = time.perf_counter()
+            case()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f'{title:>26}: медиана {timings[len(timings) // 2]:>7.2f} мс, '
+              f'p90 {timings[len(timings) * 9 // 10]:>7.2f} мс на сообщение группы из {members:,} участников')
+    started = time.perf_counter()
+    database.flush_counters(force=True)
+    print(f'{"запись счётчиков":>26}: {(time.perf_counter() - started) * 1000:>7.2f} мс '
+          f'({members:,} строк одним UPDATE)')
+    database.session.close()
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    __benchmark()
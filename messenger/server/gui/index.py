@@ -22,9 +22,10 @@ class ServerMainWindow(QMainWindow):
 
     def __init__(self, slot_statistic__btn=None, slot_setting__btn=None,
                  slot_register__btn=None, slot_del_user__btn=None,
-                 *args, **kwargs):
+                 slot_login_history__btn=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._slot_statistic__btn = slot_statistic__btn
+        self._slot_login_history__btn = slot_login_history__btn
         self._slot_setting__btn = slot_setting__btn
         self._slot_register__btn = slot_register__btn
         self._slot_delete_user__btn = slot_del_user__btn
@@ -44,6 +45,8 @@ class ServerMainWindow(QMainWindow):
         toolbar.setMovable(False)
         statistic__btn = QAction(
             QIcon(_get_path_img('history_icon.png')), 'История клиентов', self)
+        login_history__btn = QAction(
+            QIcon(_get_path_img('history_icon.png')), 'История входов', self)
         setting__btn = QAction(
             QIcon(_get_path_img('settings_icon.png')), 'Настройки сервера', self)
         register__btn = QAction(
@@ -53,6 +56,7 @@ class ServerMainWindow(QMainWindow):
         exit__btn = QAction(
             QIcon(_get_path_img('exit_icon.png')), 'Выход', self)
         toolbar.addAction(statistic__btn)
+        toolbar.addAction(login_history__btn)
         toolbar.addAction(setting__btn)
         toolbar.addAction(register__btn)
         toolbar.addAction(delete_user__btn)
@@ -60,6 +64,8 @@ class ServerMainWindow(QMainWindow):
         exit__btn.setShortcut('Ctrl+Q')
         if self._slot_statistic__btn:
             statistic__btn.triggered.connect(self._slot_statistic__btn)
+        if self._slot_login_history__btn:
+            login_history__btn.triggered.connect(self._slot_login_history__btn)
         if self._slot_setting__btn:
             setting__btn.triggered.connect(self._slot_setting__btn)
         if self._slot_register__btn:
@@ -86,10 +92,10 @@ class ServerMainWindow(QMainWindow):
     def fill_table(self, data: list):
         item_model = QStandardItemModel(self)
         item_model.setHorizontalHeaderLabels(
-            ['Имя Клиента', 'IP Адрес', 'Порт', 'Время подключения'])
+            ['Имя Клиента', 'IP Адрес', 'Порт', 'Время подключения', 'Очередь, байт'])
         for item in data:
             row = (QStandardItem(item.get(key))
-                   for key in ('username', 'ip_address', 'port', 'login_time'))
+                   for key in ('username', 'ip_address', 'port', 'login_time', 'queue_size'))
             item_model.appendRow(row)
         self._connection_table.setModel(item_model)
         self._connection_table.resizeColumnsToContents()
@@ -122,9 +128,9 @@ def __test_server_window(argv):
                               slot_del_user__btn=__slot_del_user__btn)
     data = [
         {'username': 'Rick', 'ip_address': '192.168.1.10', 'port': '1234',
-         'connection_time': '2022-08-14 20:00'},
+         'login_time': '2022-08-14 20:00', 'queue_size': '0'},
         {'username': 'Morty', 'ip_address': '192.168.1.11', 'port': '7777',
-         'connection_time': '2022-08-14 20:01'},
+         'login_time': '2022-08-14 20:01', 'queue_size': '1024'},
     ]
     window.statusBar().showMessage('Testing...')
     window.fill_table(data)
@@ -1,18 +1,89 @@
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QTableView, QPushButton, QDialog, QApplication
-from PyQt5.QtGui import QStandardItemModel, QStandardItem
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QTableView, QPushButton, QDialog, QApplication, QLineEdit
+
+
+class PagedTableModel(QAbstractTableModel):
+    """Модель таблицы, подгружающая строки страницами по мере прокрутки.
+
+    fetch_page(cursor, limit, **filters) возвращает (rows, cursor) - страницу строк-кортежей
+    и ключ следующей страницы (None - строк больше нет). QTableView сам вызывает
+    fetchMore, когда пользователь прокручивает таблицу до конца загруженных строк.
+    Значения преобразуются в текст только при отображении ячейки.
+    """
+
+    def __init__(self, headers, fetch_page, page_size: int = 100, parent=None):
+        super().__init__(parent)
+        self._headers = list(headers)
+        self._fetch_page = fetch_page
+        self._page_size = page_size
+        self._filters = dict()
+        self._rows = []
+        self._cursor = None
+        self._exhausted = False
+
+    def set_filters(self, **filters):
+        """Новая выборка с заданными фильтрами (значения None не учитываются)"""
+        self.beginResetModel()
+        self._filters = {key: value for key, value in filters.items() if value is not None}
+        self._rows = []
+        self._cursor = None
+        self._exhausted = False
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return str(self._rows[index.row()][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self._headers[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent):
+        if parent.isValid() or self._exhausted:
+            return
+        rows, self._cursor = self._fetch_page(self._cursor, self._page_size, **self._filters)
+        self._exhausted = self._cursor is None
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
 
 
 class StatisticsWindow(QDialog):
-    def __init__(self, *args, **kwargs):
+    """Статистика сообщений клиентов"""
+    TITLE = 'Statistics'
+    HEADERS = ('Имя Клиента', 'Последний раз входил', 'Отправлено', 'Получено')
+    FILTER_HINT = 'Имя клиента начинается с...'
+    FILTER_NAME = 'username_prefix'
+
+    def __init__(self, fetch_page=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._model = PagedTableModel(self.HEADERS, fetch_page, parent=self) if fetch_page else None
         self._main_window_config()
+        self._create_filter()
         self._create_table()
         self._create_close_btn()
+        if self._model:
+            self._model.set_filters()
+            self._history_table.resizeColumnsToContents()
         self.show()
 
     def _main_window_config(self):
-        self.setWindowTitle('Statistics')
+        self.setWindowTitle(self.TITLE)
         self.setFixedSize(640, 640)
         self.setAttribute(Qt.WA_DeleteOnClose)
 
@@ -21,33 +92,45 @@ class StatisticsWindow(QDialog):
         close_btn.move(520, 600)
         close_btn.clicked.connect(self.close)
 
+    def _create_filter(self):
+        self._filter__edit = QLineEdit(self)
+        self._filter__edit.setPlaceholderText(self.FILTER_HINT)
+        self._filter__edit.move(10, 10)
+        self._filter__edit.setFixedWidth(300)
+        self._filter__edit.editingFinished.connect(self._slot_filter__edit)
+
     def _create_table(self):
         self._history_table = QTableView(self)
-        self._history_table.move(10, 10)
-        self._history_table.setFixedSize(620, 580)
-
-    def fill_table(self, data):
-        item_model = QStandardItemModel(self)
-        item_model.setHorizontalHeaderLabels(
-            ['Имя Клиента', 'Последний раз входил', 'Отправлено', 'Получено'])
-        for item in data:
-            row = (QStandardItem(item.get(key))
-                   for key in ('username', 'last_login', 'sent', 'accepted'))
-            item_model.appendRow(row)
-        self._history_table.setModel(item_model)
-        self._history_table.resizeColumnsToContents()
-        self._history_table.resizeRowsToContents()
+        self._history_table.move(10, 45)
+        self._history_table.setFixedSize(620, 545)
+        if self._model:
+            self._history_table.setModel(self._model)
+
+    def _slot_filter__edit(self):
+        if self._model:
+            self._model.set_filters(**{self.FILTER_NAME: self._filter__edit.text().strip() or None})
+
+
+class LoginHistoryWindow(StatisticsWindow):
+    """История входов клиентов, от новых к старым"""
+    TITLE = 'Login history'
+    HEADERS = ('Имя Клиента', 'Время входа', 'IP Адрес', 'Порт')
+    FILTER_HINT = 'Имя клиента'
+    FILTER_NAME = 'username'
 
 
 # -----------------------------------------------------------------------------
 def __test_statistics_window(argv):
     _app = QApplication(argv)
-    window = StatisticsWindow()
-    data = [
-        {'username': 'Rick', 'last_login': '2022-08-13 15:12', 'sent': '3', 'accepted': '5'},
-        {'username': 'Marty', 'last_login': '2022-07-13 16:16', 'sent': '0', 'accepted': '1'},
-    ]
-    window.fill_table(data)
+    data = [(f'user_{i:06}', '2022-08-13 15:12', i % 7, i % 5) for i in range(100_000)]
+
+    def fetch_page(cursor, limit, username_prefix=None):
+        print(f'== Загрузка страницы с позиции {cursor!r} ==')
+        rows = [el for el in data if not username_prefix or el[0].startswith(username_prefix)]
+        start = cursor or 0
+        return rows[start:start + limit], (start + limit if start + limit < len(rows) else None)
+
+    window = StatisticsWindow(fetch_page)
     return _app.exec_()
 
 
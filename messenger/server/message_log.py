@@ -0,0 +1,342 @@
+import bisect
+import functools
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from common import settings, utils
+from server import logger
+
+LOGGER_NAME = logger.__name__
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+# Запись журнала: длина JSON, время приёма сервером, хэш беседы; затем JSON сообщения
+RECORD_HEADER = struct.Struct('!IdQ')
+# Элемент разреженного индекса сегмента: хэш беседы, время записи, смещение записи в сегменте
+INDEX_ENTRY = struct.Struct('!QdQ')
+SEGMENT_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+
+
+def conversation_id(sender: str, destination: str) -> str:
+    """Идентификатор личной беседы - не зависит от направления сообщения"""
+    return '\0'.join(sorted((sender, destination)))
+
+
+def group_conversation_id(group: str) -> str:
+    """Идентификатор беседы группы - её имя (в отличие от личных бесед, не содержит '\\0')"""
+    return group
+
+
+@functools.lru_cache(maxsize=65536)
+def conversation_hash(conversation: str) -> int:
+    return int.from_bytes(hashlib.blake2b(conversation.encode(settings.DEFAULT_ENCODING), digest_size=8).digest(),
+                          'big')
+
+
+class Segment:
+    """Файл сегмента журнала и его разреженный индекс в памяти"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.index_path = path.with_suffix(INDEX_SUFFIX)
+        self.size = path.stat().st_size if path.exists() else 0
+        self.index: Dict[int, List[Tuple[float, int]]] = dict()  # хэш беседы -> [(время, смещение)]
+        self._map: Optional[mmap.mmap] = None
+        self._map_size = 0
+        if self.index_path.exists():
+            data = self.index_path.read_bytes()
+            usable = len(data) - len(data) % INDEX_ENTRY.size  # хвост недописанного элемента отбрасываем
+            for key, timestamp, offset in INDEX_ENTRY.iter_unpack(data[:usable]):
+                if offset < self.size:
+                    self.index.setdefault(key, []).append((timestamp, offset))
+
+    def view(self) -> Optional[mmap.mmap]:
+        """Отображение сегмента в память; переотображается, если файл вырос.
+
+        Прежнее отображение не закрывается явно: его может ещё читать другой вызов,
+        оно освободится вместе с последней ссылкой.
+        """
+        if self.size == 0:
+            return None
+        if self._map is None or self._map_size != self.size:
+            with open(self.path, 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._map_size = self.size
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class MessageLog:
+    """Журнал сообщений сервера: файлы-сегменты только с дозаписью.
+
+    append вызывается сетевым потоком и лишь ставит сообщение в очередь в памяти;
+    flush (поток записи БД, между пакетами и при простое) кодирует очередь и дописывает
+    её в текущий сегмент одной записью. При превышении segment_size начинается новый
+    сегмент. Для каждой беседы в индекс сегмента попадает её первая запись и далее
+    запись не реже чем через index_interval байт сегмента, поэтому чтение диапазона
+    начинается с ближайшей точки индекса и просматривает отображённый в память сегмент.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, index_interval: int = 64 * 1024,
+                 readonly: bool = False):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.readonly = readonly  # только чтение журнала, который пишет другой процесс
+        self._lock = threading.Lock()  # очередь append/flush
+        self._write_lock = threading.Lock()  # запись в сегмент и чтение его индекса
+        self._pending: List[Tuple[float, str, dict]] = []
+        self._last_timestamp = 0.0
+        self._last_indexed: Dict[int, int] = dict()  # хэш беседы -> смещение последней точки индекса
+        self._file = self._index_file = None
+        if not readonly:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._segments: List[Segment] = [
+            Segment(path) for path in sorted(self.directory.glob(f'*{SEGMENT_SUFFIX}'))]
+        if readonly:
+            return
+        if not self._segments:
+            self._segments.append(Segment(self._segment_path(0)))
+        self._recover(self._segments[-1])
+        self._file = open(self._segments[-1].path, 'ab')
+        self._index_file = open(self._segments[-1].index_path, 'ab')
+
+    def _recover(self, segment: Segment):
+        """Продолжение текущего сегмента после перезапуска.
+
+        Просматриваются записи начиная с последней точки индекса: недописанный при сбое
+        хвост обрезается, недостающие точки индекса (данные записаны, индекс - нет)
+        добавляются, и файл индекса переписывается только из действительных точек.
+        """
+        points = [point for entries in segment.index.values() for point in entries]
+        offset = max(points, key=lambda point: point[1])[1] if points else 0
+        for key, entries in segment.index.items():
+            self._last_indexed[key] = entries[-1][1]
+        with open(segment.path, 'a+b') as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            file.seek(offset)
+            while offset + RECORD_HEADER.size <= size:
+                length, timestamp, key = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+                if offset + RECORD_HEADER.size + length > size:
+                    break
+                last = self._last_indexed.get(key)
+                if last is None or offset - last >= self.index_interval:
+                    self._last_indexed[key] = offset
+                    segment.index.setdefault(key, []).append((timestamp, offset))
+                file.seek(length, os.SEEK_CUR)
+                offset += RECORD_HEADER.size + length
+                self._last_timestamp = timestamp
+            if offset < size:
+                LOGGER.warning(f'Журнал сообщений: отброшен недописанный хвост сегмента {segment.path.name} '
+                               f'({size - offset} байт)')
+                file.truncate(offset)
+        segment.size = offset
+        entries = sorted((offset, key, timestamp) for key, points in segment.index.items()
+                         for timestamp, offset in points)
+        temporary = segment.index_path.with_suffix('.tmp')
+        temporary.write_bytes(b''.join(INDEX_ENTRY.pack(key, timestamp, offset)
+                                       for offset, key, timestamp in entries))
+        os.replace(temporary, segment.index_path)
+
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f'{number:010d}{SEGMENT_SUFFIX}'
+
+    def append(self, conversation: str, message: dict):
+        """Постановка сообщения в очередь записи (безопасно для вызова из любого потока)"""
+        with self._lock:
+            # Время записи не убывает - на этом основан поиск по индексу
+            timestamp = self._last_timestamp = max(time.time(), self._last_timestamp)
+            self._pending.append((timestamp, conversation, message))
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self):
+        """Запись накопленных сообщений в сегмент"""
+        if self.readonly:
+            return
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+        with self._write_lock:
+            segment = self._segments[-1]
+            data = bytearray()
+            index = bytearray()
+            for timestamp, conversation, message in pending:
+                if segment.size + len(data) >= self.segment_size:
+                    self._write(segment, data, index)
+                    data, index = bytearray(), bytearray()
+                    segment = self._rotate()
+                key = conversation_hash(conversation)
+                payload = utils.JSON_CODEC.encode(message)
+                offset = segment.size + len(data)
+                last = self._last_indexed.get(key)
+                if last is None or offset - last >= self.index_interval:
+                    self._last_indexed[key] = offset
+                    index += INDEX_ENTRY.pack(key, timestamp, offset)
+                    segment.index.setdefault(key, []).append((timestamp, offset))
+                data += RECORD_HEADER.pack(len(payload), timestamp, key)
+                data += payload
+            self._write(segment, data, index)
+
+    def _write(self, segment: Segment, data: bytearray, index: bytearray):
+        # Индекс пишется после данных: точка индекса не может указывать за конец сегмента
+        self._file.write(data)
+        self._file.flush()
+        self._index_file.write(index)
+        self._index_file.flush()
+        segment.size += len(data)
+
+    def _rotate(self) -> Segment:
+        self._file.close()
+        self._index_file.close()
+        segment = Segment(self._segment_path(int(self._segments[-1].path.stem) + 1))
+        self._segments.append(segment)
+        self._last_indexed = dict()
+        self._file = open(segment.path, 'ab')
+        self._index_file = open(segment.index_path, 'ab')
+        LOGGER.info(f'Журнал сообщений: начат сегмент {segment.path.name}')
+        return segment
+
+    def read(self, conversation: str, since: float = 0.0, until: float = float('inf'),
+             limit: Optional[int] = None) -> List[Tuple[float, dict]]:
+        """Сообщения беседы за интервал времени [since, until) в порядке записи"""
+        result = []
+        for item in self.iter_range(conversation, since, until):
+            result.append(item)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def iter_range(self, conversation: str, since: float = 0.0,
+                   until: float = float('inf')) -> Iterator[Tuple[float, dict]]:
+        key = conversation_hash(conversation)
+        with self._write_lock:
+            segments = [(segment, list(segment.index.get(key, ())), segment.size) for segment in self._segments]
+        for segment, points, size in segments:
+            # Первая запись беседы в сегменте всегда есть в индексе: без точек беседы в сегменте нет
+            if not points or points[0][0] >= until:
+                continue
+            position = bisect.bisect_right(points, (since, float('inf'))) - 1
+            offset = points[max(position, 0)][1]
+            view = segment.view()
+            while offset + RECORD_HEADER.size <= size:
+                length, timestamp, record_key = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + RECORD_HEADER.size
+                offset = start + length
+                if timestamp >= until or offset > size:
+                    return
+                if record_key == key and timestamp >= since:
+                    yield timestamp, utils.JSON_CODEC.decode(view[start:offset])
+
+    def close(self):
+        self.flush()
+        with self._write_lock:
+            if self._file:
+                self._file.close()
+                self._index_file.close()
+            for segment in self._segments:
+                segment.close()
+
+
+def read_conversation(root: str, conversation: str, since: float = 0.0,
+                      until: float = float('inf')) -> List[Tuple[float, dict]]:
+    """Сообщения беседы из журналов всех процессов сервера (подкаталоги root), по времени"""
+    logs = [MessageLog(str(path), readonly=True) for path in sorted(Path(root).iterdir()) if path.is_dir()]
+    try:
+        return list(heapq.merge(*(log.iter_range(conversation, since, until) for log in logs),
+                                key=lambda item: item[0]))
+    finally:
+        for log in logs:
+            log.close()
+
+
+# -----------------------------------------------------------------------------
+def __benchmark(messages_count=500_000, users_count=10_000, batch=10_000):
+    """Стоимость журнала для сетевого потока и скорость чтения диапазона по индексу"""
+    import random
+    import tempfile
+
+    logging.disable(logging.INFO)
+    random.seed(1)
+    users = [f'user_{number:05}' for number in range(users_count)]
+    messages = []
+    for number in range(messages_count):
+        # Каждое сотое сообщение - в одной «активной» беседе, остальные - между случайными пользователями
+        sender, destination = ('user_a', 'user_b') if number % 100 == 0 else random.sample(users, 2)
+        messages.append({settings.ACTION: settings.MESSAGE, settings.SENDER: sender, settings.DESTINATION: destination,
+                         settings.TIME: 1.0, settings.MESSAGE_TEXT: f'Сообщение №{number}'})
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Без очереди: каждое сообщение пишется в файл сразу, в сетевом потоке
+        started = time.perf_counter()
+        with open(Path(directory) / 'direct.log', 'ab') as file:
+            for message in messages:
+                payload = utils.JSON_CODEC.encode(message)
+                file.write(RECORD_HEADER.pack(len(payload), time.time(), 0) + payload)
+                file.flush()
+        direct = time.perf_counter() - started
+
+        log = MessageLog(str(Path(directory) / 'log'), segment_size=16 * 1024 * 1024)
+        appended = flushed = 0.0
+        for start in range(0, messages_count, batch):  # поток записи сбрасывает очередь пачками
+            started = time.perf_counter()
+            for message in messages[start:start + batch]:
+                log.append(conversation_id(message[settings.SENDER], message[settings.DESTINATION]), message)
+            appended += time.perf_counter() - started
+            started = time.perf_counter()
+            log.flush()
+            flushed += time.perf_counter() - started
+        size = sum(segment.size for segment in log._segments)
+        print(f'   запись по одному в сетевом потоке: {messages_count / direct:>10,.0f} сообщ/с')
+        print(f'  append (сетевой поток, с журналом): {messages_count / appended:>10,.0f} сообщ/с')
+        print(f'  flush (поток записи, по {batch} шт.): {messages_count / flushed:>10,.0f} сообщ/с, '
+              f'{size / flushed / 2 ** 20:,.1f} МБ/с, сегментов: {len(log._segments)}')
+
+        conversation = conversation_id('user_a', 'user_b')
+        first, last = log.read(conversation, limit=1)[0][0], log._last_timestamp
+        since = last - (last - first) / 10  # последние 10% времени
+        number = 20
+        started = time.perf_counter()
+        for _ in range(number):
+            found = log.read(conversation, since)
+        indexed = (time.perf_counter() - started) / number
+        started = time.perf_counter()
+        key = conversation_hash(conversation)
+        scanned = [item for segment in log._segments for item in _scan_segment(segment, key, since)]
+        full_scan = time.perf_counter() - started
+        assert [el[0] for el in found] == [el[0] for el in scanned]
+        print(f'    чтение диапазона беседы по индексу: {indexed * 1000:>8.1f} мс (сообщений: {len(found)}) | '
+              f'просмотр всех сегментов: {full_scan * 1000:,.0f} мс')
+        log.close()
+
+
+def _scan_segment(segment: Segment, key: int, since: float):
+    """Просмотр сегмента целиком без индекса (для сравнения в __benchmark)"""
+    view, offset = segment.view(), 0
+    while offset < segment.size:
+        length, timestamp, record_key = RECORD_HEADER.unpack_from(view, offset)
+        start = offset + RECORD_HEADER.size
+        offset = start + length
+        if record_key == key and timestamp >= since:
+            yield timestamp, utils.JSON_CODEC.decode(view[start:offset])
+
+
+if __name__ == '__main__':
+    __benchmark()
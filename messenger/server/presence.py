@@ -0,0 +1,58 @@
+from typing import Dict, List, Tuple
+
+
+class PresenceEvents:
+    """Накопление событий входа и выхода пользователей за короткое окно.
+
+    Для каждого пользователя запоминается состояние до первого события окна и последнее
+    состояние. Событие попадает в рассылку, только если к концу окна состояние изменилось:
+    переподключение (выход и вход) в пределах окна не порождает ни одного события.
+    """
+
+    def __init__(self):
+        self._initial: Dict[str, bool] = dict()  # состояние до первого события окна
+        self._current: Dict[str, bool] = dict()
+
+    def add(self, username: str, online: bool) -> bool:
+        """Событие входа (online) или выхода; True - первое событие окна (пора запланировать рассылку)"""
+        first = not self._current
+        self._initial.setdefault(username, not online)
+        self._current[username] = online
+        return first
+
+    def take(self) -> Tuple[List[str], List[str]]:
+        """Итог окна: (вошедшие, вышедшие); накопленные события сбрасываются"""
+        online, offline = [], []
+        for username, state in self._current.items():
+            if state != self._initial[username]:
+                (online if state else offline).append(username)
+        self._initial.clear()
+        self._current.clear()
+        return online, offline
+
+    def __len__(self) -> int:
+        return len(self._current)
+
+
+# -----------------------------------------------------------------------------
+def __benchmark(users=1_000, flaps=20):
+    """Переподключения в пределах окна: событий без объединения и после него"""
+    import time
+
+    events = PresenceEvents()
+    started = time.perf_counter()
+    for _ in range(flaps):
+        for number in range(users):
+            events.add(f'user_{number:05}', False)
+            events.add(f'user_{number:05}', True)
+    for number in range(0, users, 10):  # каждый десятый в итоге отключился
+        events.add(f'user_{number:05}', False)
+    online, offline = events.take()
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f'Событий без объединения: {users * flaps * 2 + users // 10:,}, '
+          f'после объединения: {len(online) + len(offline):,} '
+          f'(вошли {len(online)}, вышли {len(offline)}), {elapsed:.1f} мс')
+
+
+if __name__ == '__main__':
+    __benchmark()
@@ -0,0 +1,118 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, TextIO, Tuple
+
+from common import settings, utils
+from server import logger
+from server.db.database import ServerDatabase, DEFAULT_PATH_DB
+
+LOGGER_NAME = logger.__name__
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+PROVISIONING_BATCH = 10_000  # пользователей в одной транзакции
+HASH_CHUNK = 256  # паролей в одном задании процесса хэширования
+
+
+def read_accounts(stream: TextIO, fmt: str = FORMAT_CSV) -> Iterator[Tuple[str, str]]:
+    """Чтение пар (имя, пароль) из потока.
+
+    CSV - колонки username,password (строка заголовка необязательна),
+    JSON Lines - объекты {"username": ..., "password": ...}. Строки без имени
+    или пароля пропускаются с предупреждением в журнале.
+    """
+    if fmt == FORMAT_CSV:
+        rows = ((row[0].strip(), row[1]) if len(row) >= 2 else (None, None) for row in csv.reader(stream))
+    elif fmt == FORMAT_JSONL:
+        rows = ((item.get('username'), item.get('password')) if isinstance(item, dict) else (None, None)
+                for item in (json.loads(line) for line in stream if line.strip()))
+    else:
+        raise ValueError(f'Неизвестный формат файла пользователей: {fmt}')
+    for number, (username, password) in enumerate(rows, 1):
+        if number == 1 and fmt == FORMAT_CSV and (username, password) == ('username', 'password'):
+            continue
+        if not username or not password:
+            LOGGER.warning(f'Запись №{number} пропущена: не указано имя пользователя или пароль')
+            continue
+        yield username, password
+
+
+def _hash_accounts(accounts: list) -> list:
+    """Хэширование паролей пачки пользователей (выполняется в процессе пула)"""
+    return [(username, utils.get_hash(word=password, salt=username)) for username, password in accounts]
+
+
+def provision_users(database: ServerDatabase, accounts: Iterable[Tuple[str, str]],
+                    processes: Optional[int] = None, batch_size: int = PROVISIONING_BATCH) -> Tuple[int, int]:
+    """Массовая регистрация пользователей; возвращает (добавлено, пропущено).
+
+    Пароли хэшируются (PBKDF2) пулом процессов, пользователи и строки счётчиков
+    добавляются транзакциями по batch_size. Пока одна пачка записывается в БД,
+    пул уже хэширует следующую.
+    """
+    added = skipped = 0
+    accounts = iter(accounts)
+    with ProcessPoolExecutor(processes) as pool:
+        pending = None
+        while True:
+            batch = list(itertools.islice(accounts, batch_size))
+            hashing = pool.map(_hash_accounts, (batch[start:start + HASH_CHUNK]
+                                                for start in range(0, len(batch), HASH_CHUNK))) if batch else None
+            if pending is not None:
+                batch_added, batch_skipped = database.add_users(itertools.chain.from_iterable(pending))
+                added, skipped = added + batch_added, skipped + batch_skipped
+                LOGGER.info(f'Зарегистрировано пользователей: {added}, пропущено: {skipped}')
+            if hashing is None:
+                return added, skipped
+            pending = hashing
+
+
+def generate_accounts(count: int, prefix: str = 'test_') -> Iterator[Tuple[str, str]]:
+    """Тестовые учётные записи test_000001 ... с паролем, равным имени"""
+    width = len(str(count))
+    return ((f'{prefix}{number:0{width}}', f'{prefix}{number:0{width}}') for number in range(1, count + 1))
+
+
+# -----------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk user registration for the messenger server')
+    parser.add_argument('source', nargs='?', default='-',
+                        help='CSV (username,password) or JSON Lines file with accounts, "-" - stdin')
+    parser.add_argument('-f', '--format', dest='format', choices=(FORMAT_CSV, FORMAT_JSONL),
+                        help='Source format (by default - by file extension, csv for stdin)')
+    parser.add_argument('-d', '--db', dest='db', default=DEFAULT_PATH_DB, help='Server database path')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                        help='Number of hashing processes (by default - number of CPUs)')
+    parser.add_argument('-b', '--batch', dest='batch', type=int, default=PROVISIONING_BATCH,
+                        help='Users per database transaction')
+    parser.add_argument('-g', '--generate', dest='generate', type=int, default=0,
+                        help='Register N test accounts (password equals username) instead of reading a file')
+    arguments = parser.parse_args(argv)
+
+    database = ServerDatabase(arguments.db, clear_active=False)
+    started = time.perf_counter()
+    if arguments.generate:
+        added, skipped = provision_users(database, generate_accounts(arguments.generate),
+                                         arguments.jobs, arguments.batch)
+    else:
+        fmt = arguments.format or (FORMAT_JSONL if arguments.source.endswith(('.jsonl', '.ndjson')) else FORMAT_CSV)
+        if arguments.source == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding=settings.DEFAULT_ENCODING, newline='')
+        else:
+            stream = open(arguments.source, encoding=settings.DEFAULT_ENCODING, newline='')
+        with stream:
+            added, skipped = provision_users(database, read_accounts(stream, fmt), arguments.jobs, arguments.batch)
+    print(f'Добавлено пользователей: {added}, пропущено: {skipped}, '
+          f'время: {time.perf_counter() - started:.1f} с')
+
+
+if __name__ == '__main__':
+    main()
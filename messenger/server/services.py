@@ -1,25 +1,38 @@
 import argparse
 import configparser
 import logging
-import select
+import multiprocessing
+import shutil
+import signal
 import socket
 import sys
+import tempfile
 import threading
+import time
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Union
 
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QSocketNotifier, QTimer
 from PyQt5.QtWidgets import QApplication, QMessageBox
 
 from common import settings, utils
 from server import logger
-from server.db.database import ServerDatabase, DEFAULT_PATH_DB
+from server.db.database import ServerDatabase, Delta, DEFAULT_PATH_DB
+from server.db.writer import DatabaseWriter
+from server.connection import BatchReply, BatchSlot, Connection, ConnectionRegistry
+from server.dispatcher import Dispatcher
+from server.engines.aio import AsyncioEngine
+from server.engines.selector import SelectorEngine
+from server.message_log import MessageLog, conversation_id, group_conversation_id
+from server.presence import PresenceEvents
+from server.engines.workers import WorkerRouter, ROUTE, ROUTE_DISCONNECT, ROUTE_USER_DELETED, send_command
 from server.gui.deluser import DelUserWindow
 from server.gui.index import ServerMainWindow
 from server.gui.registration import RegistrationWindow
 from server.gui.settings import SettingsWindow
-from server.gui.statistics import StatisticsWindow
+from server.gui.statistics import LoginHistoryWindow, StatisticsWindow
 
 # -----------------------------------------------------------------------------
 LOGGER_NAME = logger.__name__
@@ -54,30 +67,115 @@ def get_data_from_config(default_ip_address, default_port, default_db_path):
     return ip_address, int(port), db_path
 
 
+def get_settings_from_config(defaults: Dict[str, Union[int, float, str]]) -> Dict[str, Union[int, float, str]]:
+    """Параметры из config.ini с типами значений из defaults; отсутствующие и некорректные берутся из defaults"""
+    values = dict(defaults)
+    path = _PATH_TO_CONFIG
+    if not path.exists():
+        return values
+    config = configparser.ConfigParser()
+    config.read(str(path), encoding=settings.DEFAULT_ENCODING)
+    for key, default in defaults.items():
+        try:
+            values[key] = type(default)(config['SETTINGS'][key])
+        except (KeyError, ValueError):
+            pass
+    return values
+
+
+def raise_open_files_limit():
+    """Поднятие мягкого лимита открытых файлов до жёсткого (для тысяч одновременных соединений)"""
+    try:
+        import resource
+    except ImportError:  # resource доступен только на POSIX-системах
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as err:
+            LOGGER.warning(f'Не удалось поднять лимит открытых файлов: {err}')
+
+
 # -----------------------------------------------------------------------------
 class Server:
-    MAX_NUMBER_CONNECTIONS = 0
-    TIMEOUT_BLOCKING_SOCKET = 0.5
+    MAX_NUMBER_CONNECTIONS = socket.SOMAXCONN
+    # Ограничения очереди исходящих данных одного соединения (байт):
+    # выше верхней отметки чтение от клиента приостанавливается до опускания ниже нижней,
+    # выше предела медленный клиент отключается.
+    OUTGOING_HIGH_WATER = 256 * 1024
+    OUTGOING_LOW_WATER = 64 * 1024
+    OUTGOING_LIMIT = 4 * 1024 * 1024
+    # Отложенные сообщения для пользователей не в сети: срок хранения (с) и размер очереди получателя
+    SPOOL_TTL = 7 * 24 * 3600
+    SPOOL_LIMIT = 1000
+    # Действия, недопустимые внутри пакета: меняют состояние соединения или сами являются пакетом
+    BATCH_EXCLUDED_ACTIONS = frozenset((settings.PRESENCE, settings.EXIT, settings.BATCH))
+    # Действия пакета, которые только ставят изменения в очередь записи и ничего не читают:
+    # идущие подряд записываются одной транзакцией, остальные запросы ждут записи предыдущих изменений
+    BATCH_WRITE_ACTIONS = frozenset((settings.ADD_CONTACT, settings.REMOVE_CONTACT, settings.CREATE_GROUP,
+                                     settings.ADD_MEMBER, settings.REMOVE_MEMBER))
+    # Проверка входа: число потоков и предел одновременно проверяемых входов (остальные ждут в очереди)
+    AUTH_SETTINGS = {'auth_workers': 4, 'auth_max_pending': 256}
+    # События присутствия (вход/выход контактов) объединяются за окно presence_window (с):
+    # переподключение в пределах окна не рассылается
+    PRESENCE_SETTINGS = {'presence_window': 0.5}
+    # Журнал сообщений: каталог ('' - рядом с БД) и размер сегмента, переопределяются в config.ini
+    MESSAGE_LOG_SETTINGS = {'message_log_dir': '', 'message_log_segment_size': 64 * 1024 * 1024}
+    # Параметры ServerDatabase, переопределяемые в config.ini
+    DATABASE_SETTINGS = {
+        'counters_flush_interval': 5.0, 'counters_flush_count': 1000,
+        'sqlite_synchronous': 'NORMAL', 'sqlite_cache_size': -16000, 'sqlite_mmap_size': 256 * 1024 * 1024,
+        'login_history_retention_days': 90, 'login_history_archive': '',
+    }
+    # Поток записи в БД: размер очереди, размер пакета и интервал фоновых задач при простое (с)
+    WRITER_MAX_QUEUE = 10_000
+    WRITER_MAX_BATCH = 256
+    HOUSEKEEPING_INTERVAL = 1.0
+    GUI_DIAGNOSTICS_INTERVAL = 1000  # мс между обновлениями очередей и метрик записи в окне сервера
+    ENGINES = {'selector': SelectorEngine, 'asyncio': AsyncioEngine}
 
     def __init__(self):
-        self.clients: Dict[str, Optional[socket.socket]] = dict()  # Словарь данных клиентов (имя клиента=сокет)
+        self.connections = ConnectionRegistry()  # Соединения клиентов с индексами по сокету и имени
         self.messages = deque()  # Список сообщений
-        self.connections = set()  # множество подключенных сокетов
+        self.spool_ttl, self.spool_limit = self.SPOOL_TTL, self.SPOOL_LIMIT
+        self.database_settings = dict(self.DATABASE_SETTINGS)
+        self.message_log_settings = dict(self.MESSAGE_LOG_SETTINGS)
+        self.auth_settings = dict(self.AUTH_SETTINGS)
+        self.presence_settings = dict(self.PRESENCE_SETTINGS)
+        self.presence_events = PresenceEvents()  # Входы и выходы пользователей, ещё не разосланные контактам
+        self.auth_pool: Optional[ThreadPoolExecutor] = None  # Потоки проверки входа (создаются вместе с движком)
+        self._auth_pending = 0  # Входов на проверке в пуле
+        self._auth_waiting = deque()  # Входы сверх auth_max_pending: (presence, соединение)
+        self.message_log: Optional[MessageLog] = None  # Журнал сообщений процесса (создаётся вместе с движком)
+        self.engine: Optional[Union[SelectorEngine, AsyncioEngine]] = None
+        self.dispatcher: Optional[Dispatcher] = None
+        self.writer: Optional[DatabaseWriter] = None  # Поток записи в БД (создаётся вместе с движком)
+        self.router: Optional[WorkerRouter] = None  # Маршрутизатор между процессами (режим --workers)
+        self.workers = []  # Процессы-обработчики (режим --workers)
+        self.routing_dir: Optional[str] = None
         # ----------------------------------------
         self.db_path: Optional[str] = None
         self.ip_address: Optional[str] = None
         self.port: Optional[int] = None
         self.database: Optional[ServerDatabase] = None
-        self.is_connections_changed = False
-        self.lock_flag = threading.Lock()
+        # Пробуждение GUI при изменении списка подключений: пишут потоки и процессы-обработчики,
+        # читает QSocketNotifier главного окна
+        self._gui_wakeup_reader: Optional[socket.socket] = None
+        self._gui_wakeup_writer: Optional[socket.socket] = None
+        self._gui_refresh_scheduled = False
+        self._active_users: List[dict] = []
+        self._last_queue_sizes: Dict[str, int] = dict()
         # ----------------------------------------
         self.window_main: Optional[ServerMainWindow] = None
         self.window_statistic: Optional[StatisticsWindow] = None
+        self.window_login_history: Optional[LoginHistoryWindow] = None
         self.window_settings: Optional[SettingsWindow] = None
         self.window_register_user: Optional[RegistrationWindow] = None
         self.window_del_user: Optional[DelUserWindow] = None
         # ----------------------------------------
         self._init_console_parser()
+        self._init_dispatcher()
 
     def _init_console_parser(self):
         """Получение параметров из консоли"""
@@ -85,6 +183,10 @@ class Server:
         parser.add_argument('-a', '--addr', dest='addr', default='', help='IP address to listen on')
         parser.add_argument('-P', '--port', dest='port', default=settings.DEFAULT_PORT, type=int,
                             help='The port the application is running on')
+        parser.add_argument('-e', '--engine', dest='engine', default='selector', choices=tuple(self.ENGINES),
+                            help='Network engine: single thread on selectors or asyncio streams')
+        parser.add_argument('-w', '--workers', dest='workers', default=1, type=int,
+                            help='Number of worker processes sharing the port via SO_REUSEPORT (selector engine)')
         self.parser_arguments = parser.parse_args()
         ip_address = self.parser_arguments.addr
         if ip_address and not utils.is_valid_ip_address(ip_address):
@@ -92,212 +194,614 @@ class Server:
                 "Invalid IP address specified. The IP address must be in the format ipv4, ipv6 or equal to ''")
         if not utils.is_valid_port(self.parser_arguments.port):
             raise SystemExit('Invalid port - the port must be in the range of registered or private')
+        if self.parser_arguments.workers < 1:
+            raise SystemExit('The number of workers must be positive')
+        if self.parser_arguments.workers > 1:
+            if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(socket, 'AF_UNIX'):
+                raise SystemExit('Worker processes require SO_REUSEPORT and Unix domain sockets')
+            if self.parser_arguments.engine != 'selector':
+                raise SystemExit('Worker processes are supported only by the selector engine')
 
     # -------------------------------------------------------------------------
-    def presence_msg_processing(self, message: dict, client_socket: socket.socket):
+    def presence_msg_processing(self, message: dict, client: Connection):
         """Обработка сообщений о присутствии"""
-        username = message.get(settings.USER).get(settings.ACCOUNT_NAME)
-        if username in self.clients:
+        user = message[settings.USER]
+        if not isinstance(user, dict):
+            response = settings.RESPONSE_400.copy()
+            response[settings.ERROR] = 'Некорректный запрос'
+            self.send_message(client, response, close_after=True)
+            return
+        username = user.get(settings.ACCOUNT_NAME)
+        if self.connections.is_online(username) or self.is_user_online(username):  # в т.ч. ожидающий проверки
             # Клиент с таким именем уже подключен
             response = settings.RESPONSE_400.copy()
             response[settings.ERROR] = 'Имя пользователя занято'
-            utils.send_message_to_socket(client_socket, response)
-            self.connections.discard(client_socket)
-            client_socket.close()
+            self.send_message(client, response, close_after=True)
             return
         if not self.database.is_user_registered(username):
             # Клиента нет в БД
             response = settings.RESPONSE_400.copy()
             response[settings.ERROR] = 'Пользователь не зарегистрирован'
-            utils.send_message_to_socket(client_socket, response)
-            self.connections.discard(client_socket)
-            client_socket.close()
+            self.send_message(client, response, close_after=True)
             return
-        # Проверка пароля
-        try:
-            password_hash = message.get(settings.USER).get(settings.PASSWORD_HASH)
-        except KeyError:
-            password_hash = None
-        self.clients[username] = client_socket
-        client_ip, client_port = client_socket.getpeername()
+        # Имя занимается сразу: повторный presence до завершения входа получит отказ.
+        # До проверки пароля соединение не может отправлять запросы и не получает сообщений.
+        self.connections.bind(client, username)
+        client.auth_pending = True
+        if self._auth_pending < self.auth_settings['auth_max_pending']:
+            self._start_auth(message, client)
+        else:
+            self._auth_waiting.append((message, client))
+
+    def _start_auth(self, message: dict, client: Connection):
+        """Проверка пароля в пуле потоков; ответ - в _complete_presence"""
+        self._auth_pending += 1
+        future = self.auth_pool.submit(self.database.authenticate, client.username,
+                                       message[settings.USER].get(settings.PASSWORD_HASH))
+        self._when_done(future, self._complete_presence, message, client)
+
+    def _complete_presence(self, message: dict, client: Connection, future: Future):
+        """Ответ на presence после проверки пароля"""
+        self._auth_pending -= 1
+        while self._auth_waiting and self._auth_pending < self.auth_settings['auth_max_pending']:
+            waiting_message, waiting_client = self._auth_waiting.popleft()
+            if waiting_client in self.connections:
+                self._start_auth(waiting_message, waiting_client)
+        if client not in self.connections:
+            return  # клиент отключился, не дождавшись ответа
+        username = client.username
+        client.auth_pending = False
         try:
-            self.database.user_login(
-                username=username, password_hash=password_hash, ip_address=client_ip, port=client_port)
-        except ValueError as err:
+            future.result()
+        except Exception as err:
+            self.connections.unbind(client)
             response = settings.RESPONSE_400.copy()
             response[settings.ERROR] = f'{err}'
-            utils.send_message_to_socket(client_socket, response)
+            self.send_message(client, response)
+            return
+        features = message.get(settings.FEATURES)
+        try:
+            accepted = self._negotiate_features(features) if isinstance(features, dict) else None
+        except (TypeError, ValueError, RecursionError):
+            # Вход не записан и никому не объявлен: отказ касается только этого клиента
+            response = settings.RESPONSE_400.copy()
+            response[settings.ERROR] = 'Некорректный запрос'
+            self.send_message(client, response, close_after=True)
+            return
+        # Вход записывается в БД в фоне: ответ клиенту его не ждёт, окно сервера обновится после записи
+        client_ip, client_port = client.getpeername()
+        future = self.writer.submit(self.database.record_login, username, client_ip, client_port)
+        future.add_done_callback(lambda done: self._mark_connections_changed())
+        if accepted is not None:
+            response = settings.RESPONSE_200.copy()
+            response[settings.FEATURES] = accepted
+            self.send_message(client, response)
+            self.engine.apply_features(client, accepted)
+            client.status_events = True
+            self._send_contacts_status(client)
         else:
-            utils.send_message_to_socket(client_socket, settings.RESPONSE_200)
-            with self.lock_flag:
-                self.is_connections_changed = True
+            self.send_message(client, settings.RESPONSE_200)
+        if self.router:
+            self.router.announce_online(username)
+        self.notify_presence(username, True)
+        # Отложенные сообщения отправляем одной пачкой. Только клиентам, приславшим FEATURES:
+        # они разбирают сообщения, пришедшие между запросом и ответом.
+        if accepted is not None:
+            future = self.writer.submit(self.database.peek_spooled_messages, username, self.spool_ttl)
+            self._when_done(future, self._send_spooled_messages, client)
 
-    # -------------------------------------------------------------------------
-    def _init_socket(self):
-        LOGGER.info(f"Запущен сервер: '{self.ip_address}:{self.port}'")
-        self.socket_app = socket.create_server((self.ip_address, self.port))
-        self.socket_app.settimeout(self.TIMEOUT_BLOCKING_SOCKET)
-        self.socket_app.listen(self.MAX_NUMBER_CONNECTIONS)
+    def _send_contacts_status(self, client: Connection):
+        """Состояние контактов вошедшего клиента; дальше он получает только изменения"""
+        contacts = self.database.get_contacts(client.username)
+        if not contacts:
+            return
+        online, offline = [], []
+        for contact in contacts:
+            (online if self.is_user_online(contact) else offline).append(contact)
+        self.send_message(client, {settings.ACTION: settings.STATUS, settings.TIME: time.time(),
+                                   settings.ONLINE: online, settings.OFFLINE: offline})
 
-    def del_socket_by_username(self, username: str):
-        sock = self.clients.get(username)
-        if sock:
-            sock.close()
-            del self.clients[username]
-        with self.lock_flag:
-            self.is_connections_changed = True
-
-    def _process_incoming_message(self, message: dict, client: socket.socket):
-        LOGGER.debug(f'Разбор сообщения от клиента : {client.getpeername()!r}')
-        # Если это сообщение о присутствии пытаемся авторизовать и отвечаем
-        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.PRESENCE,
-                settings.TIME in message, settings.USER in message)):
-            self.presence_msg_processing(message, client)
+    def notify_presence(self, username: str, online: bool):
+        """Вход или выход пользователя (этого или соседнего обработчика) для рассылки его наблюдателям.
+
+        События копятся presence_window секунд и рассылаются одним сообщением на получателя.
+        """
+        if self.presence_events.add(username, online):
+            self.engine.call_later(self.presence_settings['presence_window'], self._send_presence_events)
+
+    def _send_presence_events(self):
+        """Рассылка итога окна событий присутствия подключенным к процессу наблюдателям"""
+        online, offline = self.presence_events.take()
+        if not online and not offline:
             return
-        # ---------------------------------------------------------------------
-        # Если это сообщение, то добавляем его в очередь сообщений,
-        # проверяем наличие в сети и отвечаем.
-        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.MESSAGE,
-                settings.DESTINATION in message, settings.TIME in message,
-                settings.SENDER in message, settings.MESSAGE_TEXT in message,
-                self.clients.get(message.get(settings.SENDER)) == client)):
-            if message.get(settings.DESTINATION) in self.clients:
-                self.messages.append(message)
-                self.database.msg_registration(message[settings.SENDER], message[settings.DESTINATION])
-                utils.send_message_to_socket(client, settings.RESPONSE_200)
-            else:
-                response = settings.RESPONSE_400.copy()
-                response[settings.ERROR] = 'Пользователь не зарегистрирован на сервере'
-                utils.send_message_to_socket(client, response)
+        online = set(online)
+        now = time.time()
+        for watcher, usernames in self.database.get_contact_watchers(online.union(offline)).items():
+            client = self.connections.get_by_username(watcher)
+            if client is None or client.auth_pending or not client.status_events:
+                continue
+            self.send_message(client, {
+                settings.ACTION: settings.STATUS, settings.TIME: now,
+                settings.ONLINE: [username for username in usernames if username in online],
+                settings.OFFLINE: [username for username in usernames if username not in online]})
+        LOGGER.debug(f'Разосланы события присутствия: вошли {len(online)}, вышли {len(offline)}')
+
+    def _send_spooled_messages(self, client: Connection, future: Future):
+        """Отправка отложенных сообщений; из очереди они удаляются только после отправки"""
+        if future.exception() is not None:
+            LOGGER.error(f'Не удалось прочитать отложенные сообщения для {client!r}: {future.exception()}')
             return
-        # ---------------------------------------------------------------------
-        # Если клиент выходит
-        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.EXIT,
-                settings.ACCOUNT_NAME in message,
-                self.clients.get(message.get(settings.ACCOUNT_NAME)) == client)):
-            LOGGER.info(f'Клиент {message[settings.ACCOUNT_NAME]} корректно отключился от сервера')
-            self.database.user_logout(message[settings.ACCOUNT_NAME])
-            self.connections.discard(client)
-            self.del_socket_by_username(message[settings.ACCOUNT_NAME])
+        spooled = future.result()
+        if not spooled or client not in self.connections:
+            return  # клиент отключился - сообщения останутся в очереди до следующего входа
+        self.send_messages(client, [message for _, message in spooled])
+        self.writer.submit(self.database.ack_spooled_messages, client.username, spooled)
+
+    def _when_done(self, future: Future, callback, *args):
+        """Вызов callback(*args, future) в потоке движка после выполнения операции в другом потоке"""
+        future.add_done_callback(lambda done: self.engine.call_soon(callback, *args, done))
+
+    def _reply_when_written(self, future: Future, client: Connection):
+        """Ответ клиенту после фиксации изменения в БД"""
+        self._when_done(future, self._send_write_result, client)
+
+    def _send_write_result(self, client: Connection, future: Future):
+        if future.exception() is None:
+            self.send_message(client, settings.RESPONSE_200)
+            return
+        response = settings.RESPONSE_400.copy()
+        response[settings.ERROR] = f'{future.exception()}'
+        self.send_message(client, response)
+
+    @staticmethod
+    def _negotiate_features(features: dict) -> dict:
+        """Выбор возможностей протокола из предложенных клиентом в presence-сообщении.
+
+        Значения, кроме списков строк, не рассматриваются: неизвестное предложение оставляет JSON.
+        """
+        def offered(name: str) -> list:
+            values = features.get(name)
+            return [el for el in values if isinstance(el, str)] if isinstance(values, list) else []
+
+        accepted = dict()
+        if settings.FRAMING_LENGTH_PREFIX in offered(settings.FRAMING):
+            accepted[settings.FRAMING] = settings.FRAMING_LENGTH_PREFIX
+        # Кодек - первый известный серверу из списка клиента (в порядке его предпочтения).
+        # Двоичный кодек требует заголовка длины, без него остаётся JSON.
+        if isinstance(features.get(settings.CODEC), list) and settings.FRAMING in accepted:
+            accepted[settings.CODEC] = next(
+                (name for name in offered(settings.CODEC) if name in utils.CODECS), settings.CODEC_JSON)
+        if settings.COMPRESSION_ZLIB in offered(settings.COMPRESSION) and settings.FRAMING in accepted:
+            accepted[settings.COMPRESSION] = settings.COMPRESSION_ZLIB
+        return accepted
+
+    # -------------------------------------------------------------------------
+    def send_message(self, client: Connection, message: dict, close_after: bool = False):
+        """Отправка сообщения клиенту через активный движок (ответ на запрос из пакета - в ответ пакета)"""
+        if isinstance(client, BatchSlot):
+            if client.reply.set(client.index, message):
+                self._send_batch_reply(client.reply)
+            return
+        self.engine.send_message(client, message, close_after)
+
+    def send_messages(self, client: Connection, messages: list):
+        """Отправка пачки сообщений клиенту одной записью через активный движок"""
+        self.engine.send_messages(client, messages)
+
+    def close_connection(self, client: Connection):
+        """Закрытие соединения клиента через активный движок"""
+        self.engine.close_connection(client)
+
+    def del_socket_by_username(self, username: str):
+        """Отключение пользователя (безопасно для вызова из потока GUI)"""
+        if self.workers:
+            send_command(self.routing_dir, len(self.workers),
+                         {ROUTE: ROUTE_DISCONNECT, settings.ACCOUNT_NAME: username})
+        elif self.engine:
+            self.engine.disconnect_user(username)
+
+    def get_outgoing_queue_sizes(self) -> Dict[str, int]:
+        """Размеры очередей исходящих данных по именам пользователей (для диагностики)"""
+        if not self.engine:
+            return dict()
+        return {username: self.engine.queue_size(client) for username, client in self.connections.users()}
+
+    def forget_client(self, client: Connection):
+        """Удаление данных о закрытом соединении (в т.ч. оборванном без EXIT)"""
+        if not self.connections.remove(client) or client.username is None or client.auth_pending:
+            return  # вход не был завершён - о пользователе никому не сообщалось
+        username = client.username
+        if self.router:
+            self.router.announce_offline(username)
+        self.notify_presence(username, False)
+        future = self.writer.submit(self.database.user_logout, username)
+        future.add_done_callback(lambda done: self._mark_connections_changed())
+
+    def _mark_connections_changed(self):
+        """Пробуждение GUI: список подключений в БД изменён (из любого потока и процесса-обработчика)"""
+        if self._gui_wakeup_writer is None:
             return
-        # ---------------------------------------------------------------------
-        # Если это запрос контакт-листа
-        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.GET_CONTACTS,
-                settings.USER in message, self.clients.get(message.get(settings.USER)) == client)):
+        try:
+            self._gui_wakeup_writer.send(b'\0')
+        except OSError:
+            pass  # буфер пробуждения заполнен - GUI и так обновит таблицу
+
+    def is_user_online(self, username: str) -> bool:
+        """Подключен ли пользователь к этому или (в режиме --workers) к соседнему процессу"""
+        client = self.connections.get_by_username(username)
+        if client and not client.auth_pending:
+            return True
+        return bool(self.router and self.router.is_remote_online(username))
+
+    def _init_dispatcher(self):
+        """Регистрация обработчиков запросов клиентов"""
+        self.dispatcher = Dispatcher(self.is_client_owner)
+        self.dispatcher.register(settings.PRESENCE, self.presence_msg_processing,
+                                 (settings.TIME, settings.USER))
+        self.dispatcher.register(settings.MESSAGE, self._message_processing,
+                                 (settings.DESTINATION, settings.TIME, settings.MESSAGE_TEXT),
+                                 owner_field=settings.SENDER)
+        self.dispatcher.register(settings.EXIT, self._exit_processing,
+                                 owner_field=settings.ACCOUNT_NAME)
+        self.dispatcher.register(settings.GET_CONTACTS, self._get_contacts_processing,
+                                 owner_field=settings.USER)
+        self.dispatcher.register(settings.ADD_CONTACT, self._add_contact_processing,
+                                 (settings.ACCOUNT_NAME,), owner_field=settings.USER)
+        self.dispatcher.register(settings.REMOVE_CONTACT, self._remove_contact_processing,
+                                 (settings.ACCOUNT_NAME,), owner_field=settings.USER)
+        self.dispatcher.register(settings.USERS_REQUEST, self._users_request_processing,
+                                 owner_field=settings.ACCOUNT_NAME)
+        self.dispatcher.register(settings.GROUP_MESSAGE, self._group_message_processing,
+                                 (settings.GROUP, settings.TIME, settings.MESSAGE_TEXT), owner_field=settings.SENDER)
+        self.dispatcher.register(settings.CREATE_GROUP, self._create_group_processing,
+                                 (settings.GROUP,), owner_field=settings.USER)
+        self.dispatcher.register(settings.ADD_MEMBER, self._add_member_processing,
+                                 (settings.GROUP, settings.ACCOUNT_NAME), owner_field=settings.USER)
+        self.dispatcher.register(settings.REMOVE_MEMBER, self._remove_member_processing,
+                                 (settings.GROUP, settings.ACCOUNT_NAME), owner_field=settings.USER)
+        self.dispatcher.register(settings.GET_GROUPS, self._get_groups_processing,
+                                 owner_field=settings.USER)
+        self.dispatcher.register(settings.BATCH, self._batch_processing,
+                                 (settings.LIST_INFO,), owner_field=settings.ACCOUNT_NAME)
+
+    def is_client_owner(self, username: str, client: Connection) -> bool:
+        """Проверка, что соединение принадлежит пользователю с заданным именем"""
+        return client.username == username and not client.auth_pending
+
+    def process_incoming_message(self, message: dict, client: Connection):
+        LOGGER.debug(f'Разбор сообщения от клиента : {client.getpeername()!r}')
+        if not self.dispatcher.dispatch(message, client):
+            response = settings.RESPONSE_400.copy()
+            response[settings.ERROR] = 'Некорректный запрос'
+            self.send_message(client, response)
+
+    def _message_processing(self, message: dict, client: Connection):
+        """Сообщение добавляется в очередь сообщений, если получатель в сети, иначе откладывается"""
+        if self.is_user_online(message[settings.DESTINATION]):
+            self.messages.append(message)
+            self.message_log.append(conversation_id(message[settings.SENDER], message[settings.DESTINATION]), message)
+            self.database.msg_registration(message[settings.SENDER], message[settings.DESTINATION])
+            self.send_message(client, settings.RESPONSE_200)
+        elif not self.database.is_user_registered(message[settings.DESTINATION]):
+            response = settings.RESPONSE_400.copy()
+            response[settings.ERROR] = 'Пользователь не зарегистрирован на сервере'
+            self.send_message(client, response)
+        else:
+            self.spool_message(message, client)
+
+    def _exit_processing(self, message: dict, client: Connection):
+        LOGGER.info(f'Клиент {message[settings.ACCOUNT_NAME]} корректно отключился от сервера')
+        self.close_connection(client)  # выход записывается в БД при удалении соединения
+
+    def _get_contacts_processing(self, message: dict, client: Connection):
+        """Список контактов; клиенту, приславшему ревизию, - только изменения после неё"""
+        revision = message.get(settings.REVISION)
+        if revision is None:
             response = settings.RESPONSE_202.copy()
             response[settings.LIST_INFO] = self.database.get_contacts(message[settings.USER])
-            utils.send_message_to_socket(client, response)
+            self.send_message(client, response)
             return
-        # ---------------------------------------------------------------------
-        # Если это добавление контакта
-        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.ADD_CONTACT,
-                settings.ACCOUNT_NAME in message, settings.USER in message,
-                self.clients.get(message.get(settings.USER)) == client)):
-            self.database.add_contact(required_username=message[settings.USER],
-                                      sender_username=message[settings.ACCOUNT_NAME])
-            utils.send_message_to_socket(client, settings.RESPONSE_200)
-            return
-        # ---------------------------------------------------------------------
-        # Если это удаление контакта
-        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.REMOVE_CONTACT,
-                settings.ACCOUNT_NAME in message, settings.USER in message,
-                self.clients.get(message.get(settings.USER)) == client)):
-            self.database.del_contact(message[settings.USER], message[settings.ACCOUNT_NAME])
-            utils.send_message_to_socket(client, settings.RESPONSE_200)
+        self._send_delta(client, self.database.get_contacts_delta(
+            message[settings.USER], revision if isinstance(revision, int) else 0))
+
+    def _add_contact_processing(self, message: dict, client: Connection):
+        future = self.writer.submit(self.database.add_contact, required_username=message[settings.USER],
+                                    sender_username=message[settings.ACCOUNT_NAME])
+        self._reply_when_written(future, client)
+
+    def _remove_contact_processing(self, message: dict, client: Connection):
+        future = self.writer.submit(self.database.del_contact, message[settings.USER], message[settings.ACCOUNT_NAME])
+        self._reply_when_written(future, client)
+
+    def _group_message_processing(self, message: dict, client: Connection):
+        """Сообщение группы рассылается всем её участникам, кроме отправителя"""
+        members = self.database.get_group_members(message[settings.GROUP])
+        if not members or message[settings.SENDER] not in members:
+            response = settings.RESPONSE_400.copy()
+            response[settings.ERROR] = 'Группа не найдена'
+            self.send_message(client, response)
             return
-        # ---------------------------------------------------------------------
-        # Если это запрос известных пользователей
-        if all((settings.ACTION in message, message.get(settings.ACTION) == settings.USERS_REQUEST,
-                settings.ACCOUNT_NAME in message,
-                self.clients.get(message.get(settings.ACCOUNT_NAME)) == client)):
+        self.message_log.append(group_conversation_id(message[settings.GROUP]), message)
+        self.send_message(client, settings.RESPONSE_200)
+        self.fan_out(message, members)
+
+    def _create_group_processing(self, message: dict, client: Connection):
+        future = self.writer.submit(self.database.create_group, message[settings.GROUP], message[settings.USER])
+        self._reply_when_written(future, client)
+
+    def _add_member_processing(self, message: dict, client: Connection):
+        future = self.writer.submit(self.database.add_group_member, message[settings.GROUP],
+                                    message[settings.USER], message[settings.ACCOUNT_NAME])
+        self._when_done(future, self._complete_group_change, message[settings.GROUP], client)
+
+    def _remove_member_processing(self, message: dict, client: Connection):
+        future = self.writer.submit(self.database.remove_group_member, message[settings.GROUP],
+                                    message[settings.USER], message[settings.ACCOUNT_NAME])
+        self._when_done(future, self._complete_group_change, message[settings.GROUP], client)
+
+    def _complete_group_change(self, group: str, client: Connection, future: Future):
+        if self.router and future.exception() is None:
+            self.router.announce_group_changed(group)
+        self._send_write_result(client, future)
+
+    def _get_groups_processing(self, message: dict, client: Connection):
+        response = settings.RESPONSE_202.copy()
+        response[settings.LIST_INFO] = self.database.get_user_groups(message[settings.USER])
+        self.send_message(client, response)
+
+    def _users_request_processing(self, message: dict, client: Connection):
+        """Список пользователей; клиенту, приславшему ревизию, - только изменения после неё"""
+        revision = message.get(settings.REVISION)
+        if revision is None:
             response = settings.RESPONSE_202.copy()
             response[settings.LIST_INFO] = self.database.get_list_of_usernames()
-            utils.send_message_to_socket(client, response)
+            self.send_message(client, response)
             return
-            # ---------------------------------------------------------------------
-        response = settings.RESPONSE_400.copy()
-        response[settings.ERROR] = 'Некорректный запрос'
-        utils.send_message_to_socket(client, response)
-
-    def _process_outgoing_message(self, message: dict, listen_socks: list):
-        username_to = message.get(settings.DESTINATION)
-        if all((username_to in self.clients,
-                self.clients.get(username_to) in listen_socks)):
-            utils.send_message_to_socket(self.clients.get(username_to), message)
-            LOGGER.info(f'Отправлено сообщение пользователю {message[settings.DESTINATION]} '
-                        f'от пользователя {message[settings.SENDER]}.')
-        elif all((username_to in self.clients,
-                  self.clients.get(username_to) not in listen_socks)):
-            raise ConnectionError
+        self._send_delta(client, self.database.get_users_delta(revision if isinstance(revision, int) else 0))
+
+    def _batch_processing(self, message: dict, client: Connection):
+        """Пакет запросов: ответы собираются в один кадр RESPONSE_207 в порядке запросов.
+
+        Запросы выполняются по порядку: идущие подряд изменения (BATCH_WRITE_ACTIONS) записываются
+        одной транзакцией, а следующий за ними запрос обрабатывается после их записи и видит их.
+        """
+        requests = message[settings.LIST_INFO]
+        if not isinstance(requests, list) or not 0 < len(requests) <= settings.MAX_BATCH_REQUESTS:
+            response = settings.RESPONSE_400.copy()
+            response[settings.ERROR] = f'Пакет должен содержать от 1 до {settings.MAX_BATCH_REQUESTS} запросов'
+            self.send_message(client, response)
+            return
+        self._process_batch_requests(BatchReply(client, len(requests)), requests, 0)
+
+    def _process_batch_requests(self, reply: BatchReply, requests: list, start: int, *_):
+        """Запросы пакета, начиная с номера start (продолжение - после записи предыдущих изменений).
+
+        Продолжение вызывается движком вне разбора сообщений клиента, поэтому ошибка запроса
+        обрабатывается здесь так же, как при разборе: закрывается только соединение этого клиента.
+        """
+        if reply.connection not in self.connections:
+            return
+        try:
+            with self.writer.group() as operations:
+                for index in range(start, len(requests)):
+                    request, slot = requests[index], BatchSlot(reply, index)
+                    action = request.get(settings.ACTION) if isinstance(request, dict) else None
+                    if not isinstance(action, str) or action in self.BATCH_EXCLUDED_ACTIONS:
+                        response = settings.RESPONSE_400.copy()
+                        response[settings.ERROR] = 'Некорректный запрос'
+                        self.send_message(slot, response)
+                    elif operations and action not in self.BATCH_WRITE_ACTIONS:
+                        # Группа не делится между транзакциями: её последняя операция выполняется последней
+                        self._when_done(operations[-1][-1], self._process_batch_requests, reply, requests, index)
+                        return
+                    else:
+                        self.process_incoming_message(request, slot)
+        except (OSError, TypeError, ValueError, RecursionError):
+            LOGGER.debug(f'Некорректный запрос в пакете клиента {reply.connection!r}, соединение закрыто')
+            self.close_connection(reply.connection)
+
+    def _send_batch_reply(self, reply: BatchReply):
+        if reply.connection not in self.connections:
+            return
+        response = settings.RESPONSE_207.copy()
+        response[settings.LIST_INFO] = reply.responses
+        self.engine.send_message(reply.connection, response)
+
+    def _send_delta(self, client: Connection, delta: Delta):
+        """Ответ 202 с изменениями после ревизии клиента (без REMOVED - полный список)"""
+        response = settings.RESPONSE_202.copy()
+        response[settings.LIST_INFO] = delta.added
+        response[settings.REVISION] = delta.revision
+        if delta.removed is not None:
+            response[settings.REMOVED] = delta.removed
+        self.send_message(client, response)
+
+    def _process_outgoing_message(self, message: dict):
+        if self.deliver_local(message):
+            return
+        if self.router and self.router.forward(message):
+            LOGGER.debug(f'Сообщение для пользователя {message[settings.DESTINATION]} '
+                         f'передано соседнему обработчику')
         else:
-            LOGGER.error(f'Пользователь {message[settings.DESTINATION]} '
-                         f'не зарегистрирован на сервере, отправка сообщения невозможна.')
+            self.spool_message(message)
 
-    def _run_mainloop(self):
-        """Цикл работы прослушиваемого сокета с клиентами"""
-        while True:
-            # Ждём подключения, если таймаут вышел, ловим исключение.
-            try:
-                client_socket, address = self.socket_app.accept()
-            except OSError:
-                pass  # не удалось подключиться к клиенту
+    def deliver_local(self, message: dict) -> bool:
+        """Отправка сообщения получателю, подключенному к этому процессу"""
+        client = self.connections.get_by_username(message.get(settings.DESTINATION))
+        if not client or client.auth_pending:
+            return False  # ожидающему проверки входа сообщение откладывается до её завершения
+        self.send_message(client, message)
+        LOGGER.info(f'Отправлено сообщение пользователю {message[settings.DESTINATION]} '
+                    f'от пользователя {message[settings.SENDER]}.')
+        return True
+
+    def fan_out(self, message: dict, members: Iterable[str]):
+        """Доставка сообщения группы участникам, кроме отправителя.
+
+        Подключенным к процессу - одной рассылкой (сообщение кодируется один раз на формат),
+        подключенным к соседним обработчикам - одной командой на обработчик,
+        остальным - в отложенные сообщения одной операцией БД.
+        """
+        sender = message[settings.SENDER]
+        missed = self.deliver_group_local(message, [username for username in members if username != sender])
+        if missed and self.router:
+            missed = self.router.forward_group(message, missed)
+        if missed:
+            self.spool_group_message(message, missed)
+
+    def deliver_group_local(self, message: dict, usernames: List[str]) -> List[str]:
+        """Отправка сообщения группы получателям этого процесса; возвращает остальных получателей"""
+        clients, delivered, missed = [], [], []
+        for username in usernames:
+            client = self.connections.get_by_username(username)
+            if client is None or client.auth_pending:
+                missed.append(username)
             else:
-                LOGGER.info(f'Установленно соединение с {address}')
-                self.connections.add(client_socket)
-            # ----------------------------------------
-            rlist, wlist, xlist = [], [], []
-            # Проверяем на наличие ждущих клиентов
-            if self.connections:
-                try:
-                    rlist, wlist, xlist = select.select(self.connections, self.connections, [], 0)
-                except OSError as err:
-                    LOGGER.error(f'Ошибка работы с сокетами: {err}')
-                    with self.lock_flag:
-                        self.is_connections_changed = True
-            # ----------------------------------------
-            # принимаем сообщения и если ошибка, исключаем клиента.
-            if rlist:
-                for sock in rlist:
-                    try:
-                        self._process_incoming_message(
-                            utils.get_message_from_socket(sock), sock)
-                    except (OSError, TypeError, ValueError):
-                        LOGGER.debug(f'Клиент {sock.getpeername()} отключился от сервера')
-                        self.connections.discard(sock)
-                        for key, value in self.clients.copy().items():
-                            if value == sock:
-                                del self.clients[key]
-                                break
-                        with self.lock_flag:
-                            self.is_connections_changed = True
-            # ----------------------------------------
-            # Если есть сообщения, обрабатываем каждое.
-            while self.messages:
-                message = self.messages.popleft()
-                try:
-                    self._process_outgoing_message(message, wlist)
-                except (OSError, TypeError, ConnectionAbortedError,
-                        ConnectionError, ConnectionResetError, ConnectionRefusedError):
-                    self.clients.pop(message.to, default=None)  # Удаляем клиента из словаря данных клиента
-                    with self.lock_flag:
-                        self.is_connections_changed = True
+                clients.append(client)
+                delivered.append(username)
+        if clients:
+            self.engine.send_to_many(clients, message)
+            self.database.group_msg_registration(message[settings.SENDER], delivered)
+            LOGGER.debug(f'Сообщение группы {message[settings.GROUP]} отправлено {len(clients)} участникам')
+        return missed
+
+    def spool_group_message(self, message: dict, usernames: List[str]):
+        future = self.writer.submit(self.database.spool_group_message, usernames, message, self.spool_limit)
+        self._when_done(future, self._complete_group_spool, message, len(usernames))
+
+    @staticmethod
+    def _complete_group_spool(message: dict, count: int, future: Future):
+        stored = future.result() if future.exception() is None else 0
+        if stored < count:
+            LOGGER.error(f'Сообщение группы {message[settings.GROUP]} не сохранено для {count - stored} '
+                         f'участников не в сети: очередь получателя заполнена')
+
+    def spool_message(self, message: dict, client: Optional[Connection] = None):
+        """Сохранение сообщения до подключения получателя; client - отправитель, ожидающий ответа"""
+        future = self.writer.submit(
+            self.database.spool_message, message[settings.DESTINATION], message, self.spool_limit)
+        self._when_done(future, self._complete_spool, message, client)
+
+    def _complete_spool(self, message: dict, client: Optional[Connection], future: Future):
+        stored = future.exception() is None and future.result()
+        if stored:
+            LOGGER.info(f'Сообщение для пользователя {message[settings.DESTINATION]} отложено до его подключения')
+            if client is not None:  # сообщение принято от отправителя, а не возвращено из очереди доставки
+                self.message_log.append(
+                    conversation_id(message[settings.SENDER], message[settings.DESTINATION]), message)
+        else:
+            LOGGER.error(f'Сообщение для пользователя {message[settings.DESTINATION]} не сохранено: '
+                         f'очередь получателя заполнена или он не зарегистрирован')
+        if client is None or client not in self.connections:
+            return
+        if stored:
+            self.send_message(client, settings.RESPONSE_200)
+        else:
+            response = settings.RESPONSE_400.copy()
+            response[settings.ERROR] = 'Очередь сообщений получателя заполнена'
+            self.send_message(client, response)
+
+    def process_messages(self):
+        """Распределение принятых сообщений по очередям получателей"""
+        while self.messages:
+            self._process_outgoing_message(self.messages.popleft())
 
     def work_with_clients(self):
         """Функция обработки соединений к серверу"""
-        self._init_socket()
-        self._run_mainloop()
+        raise_open_files_limit()
+        self.message_log = self._open_message_log()
+        self.auth_pool = ThreadPoolExecutor(max_workers=self.auth_settings['auth_workers'], thread_name_prefix='auth')
+        housekeeping = [self.database.flush_counters, lambda: self.database.purge_spool(self.spool_ttl),
+                        self.message_log.flush]
+        if self.router is None or self.router.worker_id == 0:
+            # Архив истории входов общий - переносом занимается только один процесс
+            housekeeping.append(self.database.compact_login_history)
+        self.writer = DatabaseWriter(
+            self.database, max_queue=self.WRITER_MAX_QUEUE, max_batch=self.WRITER_MAX_BATCH,
+            idle_interval=self.HOUSEKEEPING_INTERVAL, housekeeping=housekeeping)
+        self.writer.start()
+        self.engine = self.ENGINES[self.parser_arguments.engine](self)
+        self.engine.run()
+
+    def _open_message_log(self) -> MessageLog:
+        """Журнал сообщений процесса: у каждого обработчика свой подкаталог"""
+        root = self.message_log_settings['message_log_dir']
+        if not root:
+            db_path = Path(self.db_path).resolve()
+            root = db_path.with_name(f'{db_path.stem}_messages')
+        node = f'worker_{self.router.worker_id}' if self.router else 'main'
+        return MessageLog(str(Path(root) / node), segment_size=self.message_log_settings['message_log_segment_size'])
+
+    def stop_writer(self):
+        """Запись оставшихся изменений в БД и журнал сообщений при завершении сервера"""
+        if self.writer:
+            self.writer.stop()
+        else:
+            self.database.flush_counters(force=True)
+        if self.message_log:
+            self.message_log.close()
+
+    def _run_worker(self, worker_id: int, barrier):
+        """Точка входа процесса-обработчика (режим --workers)"""
+        self.router = WorkerRouter(self, worker_id, self.parser_arguments.workers, self.routing_dir)
+        barrier.wait()  # все обработчики слушают Unix-сокеты, активные пользователи в БД очищены
+        self.database = ServerDatabase(path=self.db_path, clear_active=False, **self.database_settings)
+        # Главный процесс завершает обработчики сигналом SIGTERM - сохраняем накопленные счётчики
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            self.work_with_clients()
+        finally:
+            self.stop_writer()
+
+    def _start_workers(self):
+        """Запуск процессов-обработчиков, делящих порт через SO_REUSEPORT.
+
+        Процессы создаются до открытия БД в главном процессе, чтобы не наследовать её соединения.
+        """
+        count = self.parser_arguments.workers
+        self.routing_dir = tempfile.mkdtemp(prefix='messenger_')
+        barrier = multiprocessing.Barrier(count + 1)
+        context = multiprocessing.get_context('fork')
+        for worker_id in range(count):
+            process = context.Process(target=self._run_worker, args=(worker_id, barrier), daemon=True)
+            process.start()
+            self.workers.append(process)
+        LOGGER.info(f'Запущено процессов-обработчиков: {count}')
+        return barrier
 
     # -------------------------------------------------------------------------
     def run(self):
         ip_address, port, db_path = get_data_from_config(
             self.parser_arguments.addr, self.parser_arguments.port, DEFAULT_PATH_DB)
         self.ip_address, self.port, self.db_path = ip_address, port, db_path
-        self.database = ServerDatabase(path=db_path)
+        spool = get_settings_from_config({'spool_ttl': self.SPOOL_TTL, 'spool_limit': self.SPOOL_LIMIT})
+        self.spool_ttl, self.spool_limit = spool['spool_ttl'], spool['spool_limit']
+        self.database_settings = get_settings_from_config(self.DATABASE_SETTINGS)
+        self.message_log_settings = get_settings_from_config(self.MESSAGE_LOG_SETTINGS)
+        self.auth_settings = get_settings_from_config(self.AUTH_SETTINGS)
+        self.presence_settings = get_settings_from_config(self.PRESENCE_SETTINGS)
+        # До запуска обработчиков: процессы наследуют сокет пробуждения GUI
+        self._gui_wakeup_reader, self._gui_wakeup_writer = socket.socketpair()
+        self._gui_wakeup_reader.setblocking(False)
+        self._gui_wakeup_writer.setblocking(False)
+        if self.parser_arguments.workers > 1:
+            barrier = self._start_workers()
+            self.database = ServerDatabase(path=db_path, **self.database_settings)
+            barrier.wait()
+            try:
+                self.run_main__gui()
+            finally:
+                shutil.rmtree(self.routing_dir, ignore_errors=True)
+            return
+        self.database = ServerDatabase(path=db_path, **self.database_settings)
 
         stream_for_clients = threading.Thread(target=self.work_with_clients)
         stream_for_clients.daemon = True
         stream_for_clients.start()
-        self.run_main__gui()
+        try:
+            self.run_main__gui()
+        finally:
+            self.stop_writer()
 
     # -------------------------------------------------------------------------
     def run_main__gui(self):
@@ -306,30 +810,63 @@ class Server:
         app = QApplication(sys.argv)
         self.window_main = ServerMainWindow(
             slot_statistic__btn=self._slot_statistic__btn__gui,
+            slot_login_history__btn=self._slot_login_history__btn__gui,
             slot_setting__btn=self._slot_setting__btn__gui,
             slot_register__btn=self._slot_register__btn__gui,
             slot_del_user__btn=self._slot_del_user__btn__gui
         )
         self.window_main.statusBar().showMessage('Server Working')
 
+        # Таблица подключений перечитывается из БД только по сигналу об изменении,
+        # таймер обновляет лишь данные в памяти: очереди соединений и метрики записи
+        notifier = QSocketNotifier(self._gui_wakeup_reader.fileno(), QSocketNotifier.Read)
+        notifier.activated.connect(self._slot_connections_changed__gui)
         timer = QTimer()
-        timer.timeout.connect(self._update_active_users__gui)
-        timer.start(1000)
+        timer.timeout.connect(self._update_diagnostics__gui)
+        timer.start(self.GUI_DIAGNOSTICS_INTERVAL)
+        self._refresh_active_users__gui()
         app.exec_()
 
-    def _update_active_users__gui(self):
-        if not self.is_connections_changed:
-            return
-        active_users = self.database.get_active_users()
-        self.window_main.fill_table(active_users)
-        with self.lock_flag:
-            self.is_connections_changed = False
+    def _slot_connections_changed__gui(self):
+        """Сигнал об изменении подключений: таблица обновляется один раз за окно presence_window"""
+        try:
+            while self._gui_wakeup_reader.recv(settings.MAX_PACKET_LENGTH):
+                pass
+        except BlockingIOError:
+            pass
+        if not self._gui_refresh_scheduled:
+            self._gui_refresh_scheduled = True
+            QTimer.singleShot(int(self.presence_settings['presence_window'] * 1000), self._refresh_active_users__gui)
+
+    def _refresh_active_users__gui(self):
+        self._gui_refresh_scheduled = False
+        self._active_users = self.database.get_active_users()
+        self._fill_active_users__gui(self.get_outgoing_queue_sizes())
+
+    def _update_diagnostics__gui(self):
+        if self.writer:
+            metrics = self.writer.get_metrics()
+            self.window_main.statusBar().showMessage(
+                f"Server Working | Запись в БД: очередь {metrics['queue_depth']}, "
+                f"фиксация {metrics['last_commit_ms']:.1f} мс (средняя {metrics['avg_commit_ms']:.1f}, "
+                f"максимальная {metrics['max_commit_ms']:.1f})")
+        queue_sizes = self.get_outgoing_queue_sizes()
+        if queue_sizes != self._last_queue_sizes:
+            self._fill_active_users__gui(queue_sizes)
+
+    def _fill_active_users__gui(self, queue_sizes: Dict[str, int]):
+        self._last_queue_sizes = queue_sizes
+        for user in self._active_users:
+            user['queue_size'] = str(queue_sizes.get(user['username'], 0))
+        self.window_main.fill_table(self._active_users)
 
     def _slot_statistic__btn__gui(self):
         """Слот нажатия на кнопку истории клиентов"""
-        self.window_statistic = StatisticsWindow()
-        statistics = self.database.get_msg_count_info()
-        self.window_statistic.fill_table(statistics)
+        self.window_statistic = StatisticsWindow(self.database.get_msg_count_page)
+
+    def _slot_login_history__btn__gui(self):
+        """Слот нажатия на кнопку истории входов"""
+        self.window_login_history = LoginHistoryWindow(self.database.get_login_history_page)
 
     def _slot_setting__btn__gui(self):
         """Слот нажатия на кнопку настройки сервера"""
@@ -346,7 +883,9 @@ class Server:
         dir_name = self.window_settings.db_path__edit.text()
         file_name = self.window_settings.db_file__edit.text()
         config = configparser.ConfigParser()
-        config.add_section('SETTINGS')
+        config.read(str(_PATH_TO_CONFIG), encoding=settings.DEFAULT_ENCODING)  # сохраняем прочие настройки
+        if not config.has_section('SETTINGS'):
+            config.add_section('SETTINGS')
         try:
             port = int(self.window_settings.port__edit.text())
             if not (settings.MIN_ADMISSIBLE_PORT <= port < settings.MAX_ADMISSIBLE_PORT):
@@ -385,5 +924,10 @@ class Server:
         username = self.window_del_user.get_selected_username()
         self.database.del_user(username)
         message.information(self.window_del_user, 'Успех', 'Пользователь удалён')
-        self.del_socket_by_username(username)
+        if self.workers:
+            # Обработчики держат свои справочники пользователей - удаляем и из них
+            send_command(self.routing_dir, len(self.workers),
+                         {ROUTE: ROUTE_USER_DELETED, settings.ACCOUNT_NAME: username})
+        else:
+            self.del_socket_by_username(username)
         self.window_del_user.close()
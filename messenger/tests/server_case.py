@@ -0,0 +1,111 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from typing import Dict, Optional
+from unittest import mock
+
+from common import settings, utils
+from server.db.database import ServerDatabase
+from server.services import Server
+
+PASSWORD = 'password'
+USERS = tuple(f'user_{number}' for number in range(1, 41))
+_database: Optional[ServerDatabase] = None
+_servers: Dict[str, Server] = dict()
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_database() -> ServerDatabase:
+    """БД сервера во временном каталоге.
+
+    Схема БД отображается на классы один раз за процесс, поэтому БД одна на все тесты:
+    тесты разных модулей работают с разными пользователями.
+    """
+    global _database
+    if _database is None:
+        _database = ServerDatabase(os.path.join(tempfile.mkdtemp(), 'server.db3'))
+        for username in USERS:
+            _database.add_user(username, utils.get_hash(PASSWORD, username))
+    return _database
+
+
+def get_server(engine: str = 'selector') -> Server:
+    """Сервер с заданным движком в отдельном потоке на свободном порту (один на процесс)"""
+    server = _servers.get(engine)
+    if server is not None:
+        return server
+    with mock.patch('sys.argv', ['server', '-P', str(get_free_port()), '-e', engine]):
+        server = _servers[engine] = Server()
+    server.ip_address = '127.0.0.1'
+    server.port = server.parser_arguments.port
+    server.database = get_database()
+    server.db_path = str(server.database.path)
+    server.message_log_settings['message_log_dir'] = str(server.database.path.with_name(f'{engine}_messages'))
+    threading.Thread(target=server.work_with_clients, daemon=True).start()
+    for _ in range(50):  # сервер запускается в отдельном потоке
+        try:
+            socket.create_connection((server.ip_address, server.port), timeout=5).close()
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    return server
+
+
+class RawClient:
+    """Клиент поверх сокета без ClientTransport: запросы и ответы в том виде, как их видит сервер"""
+
+    def __init__(self, server: Server, username: str, features: Optional[dict] = None, password: str = PASSWORD):
+        self.sock = socket.create_connection((server.ip_address, server.port), timeout=5)
+        self.buffer = utils.MessageBuffer()
+        presence = {
+            settings.ACTION: settings.PRESENCE,
+            settings.TIME: time.time(),
+            settings.USER: {settings.ACCOUNT_NAME: username,
+                            settings.PASSWORD_HASH: utils.get_hash(password, username)},
+        }
+        if features is not None:
+            presence[settings.FEATURES] = features
+        self.presence_response = self.request(presence)
+        accepted = self.presence_response.get(settings.FEATURES)
+        if isinstance(accepted, dict):
+            self.buffer.pending.extend(self.buffer.apply_features(accepted))
+
+    def send(self, message: dict):
+        utils.send_message_to_socket(self.sock, message, self.buffer)
+
+    def receive(self) -> dict:
+        return utils.get_message_from_socket(self.sock, self.buffer)
+
+    def request(self, message: dict) -> dict:
+        self.send(message)
+        return self.receive()
+
+    def is_closed_by_server(self) -> bool:
+        """Ожидание закрытия соединения сервером; уже отправленные сервером сообщения пропускаются"""
+        try:
+            while self.sock.recv(settings.MAX_PACKET_LENGTH):
+                pass
+        except socket.timeout:
+            return False
+        except ConnectionResetError:
+            pass
+        return True
+
+    def close(self):
+        self.sock.close()
+
+
+class ServerTestCase(unittest.TestCase):
+    ENGINE = 'selector'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = get_server(cls.ENGINE)
@@ -0,0 +1,110 @@
+import json
+import socket
+import time
+
+from common import settings, utils
+from server_case import PASSWORD, RawClient, ServerTestCase
+
+
+class BatchTestCase(ServerTestCase):
+    """Пакеты запросов (BATCH) на работающем сервере"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sock = socket.create_connection((cls.server.ip_address, cls.server.port), timeout=5)
+        cls.buffer = utils.MessageBuffer()
+        response = cls.request({
+            settings.ACTION: settings.PRESENCE,
+            settings.TIME: time.time(),
+            settings.USER: {settings.ACCOUNT_NAME: 'user_1',
+                            settings.PASSWORD_HASH: utils.get_hash(PASSWORD, 'user_1')},
+        })
+        assert response[settings.RESPONSE] == 200, response
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sock.close()
+
+    @classmethod
+    def request(cls, message: dict) -> dict:
+        utils.send_message_to_socket(cls.sock, message, cls.buffer)
+        return utils.get_message_from_socket(cls.sock, cls.buffer)
+
+    def batch(self, requests: list) -> list:
+        response = self.request({
+            settings.ACTION: settings.BATCH,
+            settings.TIME: time.time(),
+            settings.ACCOUNT_NAME: 'user_1',
+            settings.LIST_INFO: requests,
+        })
+        self.assertEqual(response[settings.RESPONSE], 207, json.dumps(response, ensure_ascii=False))
+        return response[settings.LIST_INFO]
+
+    @staticmethod
+    def contact_request(action: str, contact: str) -> dict:
+        return {settings.ACTION: action, settings.TIME: time.time(),
+                settings.USER: 'user_1', settings.ACCOUNT_NAME: contact}
+
+    @staticmethod
+    def contacts_request() -> dict:
+        return {settings.ACTION: settings.GET_CONTACTS, settings.TIME: time.time(), settings.USER: 'user_1'}
+
+    def test_read_after_write(self):
+        """Чтение после изменения в том же пакете видит это изменение"""
+        responses = self.batch([
+            self.contact_request(settings.ADD_CONTACT, 'user_2'),
+            self.contact_request(settings.ADD_CONTACT, 'user_3'),
+            self.contacts_request(),
+            self.contact_request(settings.REMOVE_CONTACT, 'user_2'),
+            self.contacts_request(),
+        ])
+        self.assertEqual([el[settings.RESPONSE] for el in responses], [200, 200, 202, 200, 202])
+        self.assertEqual(sorted(responses[2][settings.LIST_INFO]), ['user_2', 'user_3'])
+        self.assertEqual(responses[4][settings.LIST_INFO], ['user_3'])
+
+    def test_invalid_requests(self):
+        """Некорректные запросы получают ответ 400 на своих местах, остальные выполняются"""
+        responses = self.batch([
+            {settings.ACTION: settings.PRESENCE},
+            self.contact_request(settings.ADD_CONTACT, 'user_unknown'),
+            5,
+            self.contacts_request(),
+        ])
+        self.assertEqual([el[settings.RESPONSE] for el in responses], [400, 400, 400, 202])
+
+
+    def test_invalid_request_after_write(self):
+        """Некорректное действие в продолжении пакета (после записи) получает ответ 400"""
+        responses = self.batch([
+            self.contact_request(settings.ADD_CONTACT, 'user_2'),
+            self.contacts_request(),
+            {settings.ACTION: [1]},
+        ])
+        self.assertEqual([el[settings.RESPONSE] for el in responses], [200, 202, 400])
+
+    def test_malformed_message_after_write(self):
+        """Ошибка разбора в продолжении пакета закрывает только соединение этого клиента"""
+        client = RawClient(self.server, 'user_2')
+        self.assertEqual(client.presence_response[settings.RESPONSE], 200)
+        client.send({
+            settings.ACTION: settings.BATCH,
+            settings.TIME: time.time(),
+            settings.ACCOUNT_NAME: 'user_2',
+            settings.LIST_INFO: [
+                {settings.ACTION: settings.ADD_CONTACT, settings.TIME: time.time(),
+                 settings.USER: 'user_2', settings.ACCOUNT_NAME: 'user_3'},
+                {settings.ACTION: settings.MESSAGE, settings.TIME: time.time(), settings.SENDER: 'user_2',
+                 settings.DESTINATION: ['user_3'], settings.MESSAGE_TEXT: 'Привет'},
+            ],
+        })
+        self.assertTrue(client.is_closed_by_server())
+        client.close()
+        self.assertEqual(self.request(self.contacts_request())[settings.RESPONSE], 202)
+        other = RawClient(self.server, 'user_3')
+        self.assertEqual(other.presence_response[settings.RESPONSE], 200)
+        other.close()
+
+
+class AsyncioBatchTestCase(BatchTestCase):
+    ENGINE = 'asyncio'
@@ -0,0 +1,60 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import client.db.database
+from client.db.database import ClientDatabase
+from client.transport import ClientTransport
+from common.errors import ServerError
+from server_case import PASSWORD, ServerTestCase
+
+
+class ClientTransportTestCase(ServerTestCase):
+    """Группы и пакетное изменение контактов через ClientTransport"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.patcher = mock.patch.object(client.db.database, '_BASE_DIR', Path(cls.tmp_dir.name))
+        cls.patcher.start()
+        # Схема клиентской БД отображается на классы один раз за процесс - БД у клиентов общая
+        cls.database = ClientDatabase('tests')
+        cls.clients = {
+            username: ClientTransport(cls.server.port, cls.server.ip_address, username, PASSWORD, cls.database)
+            for username in ('user_4', 'user_5')
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        for transport in cls.clients.values():
+            transport.transport_shutdown()
+        cls.database.session.close()
+        cls.patcher.stop()
+        cls.tmp_dir.cleanup()
+
+    def test_group_chat(self):
+        """Сообщение группы хранится в истории группы, даже если имя группы совпадает с именем пользователя"""
+        owner, member = self.clients['user_4'], self.clients['user_5']
+        owner.create_group('user_6')
+        owner.add_group_member('user_6', 'user_5')
+        self.assertEqual(member.get_groups(), ['user_6'])
+        owner.send_group_message('user_6', 'Привет, группа!')
+        member.get_groups()  # сообщение группы приходит раньше ответа и обрабатывается по пути
+        self.assertEqual(sorted((el['sender'], el['direction'], el['msg_text'])
+                                for el in self.database.get_group_history('user_6')),
+                         [('user_4', 'in', 'Привет, группа!'), ('user_4', 'out', 'Привет, группа!')])
+        self.assertEqual(self.database.get_msg_history('user_6'), [])
+        member.remove_group_member('user_6', 'user_5')
+        self.assertEqual(member.get_groups(), [])
+        with self.assertRaises(ServerError):
+            member.send_group_message('user_6', 'Уже не участник')
+
+    def test_edit_contacts(self):
+        """Несколько контактов меняются одним пакетом; ошибки собираются в одно исключение"""
+        transport = self.clients['user_5']
+        transport.edit_contacts(added=['user_4', 'user_6'])
+        self.assertEqual(sorted(self.server.database.get_contacts('user_5')), ['user_4', 'user_6'])
+        with self.assertRaises(ServerError):
+            transport.edit_contacts(added=['user_unknown'], removed=['user_4'])
+        self.assertEqual(self.server.database.get_contacts('user_5'), ['user_6'])
@@ -0,0 +1,38 @@
+import unittest
+
+from common import utils
+from server_case import PASSWORD, get_database
+
+
+class ServerDatabaseTestCase(unittest.TestCase):
+    """БД сервера без сетевой части"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.database = get_database()
+
+    def counters(self, username: str) -> tuple:
+        (row,), _ = self.database.get_msg_count_page(username_prefix=username, limit=1)
+        return row[2], row[3]
+
+    def test_message_counters(self):
+        """Счётчики видны до записи в БД и не удваиваются после неё"""
+        sent, accepted = self.counters('user_33')
+        self.database.msg_registration('user_33', 'user_34', 3)
+        self.assertEqual(self.counters('user_33'), (sent + 3, accepted))
+        self.database.flush_counters(force=True)
+        self.assertEqual(self.counters('user_33'), (sent + 3, accepted))
+        self.assertEqual(self.counters('user_34')[1], 3)
+
+    def test_add_users(self):
+        """Пачка пользователей: повторы и уже зарегистрированные имена пропускаются"""
+        hashes = {username: utils.get_hash(PASSWORD, username) for username in ('bulk_1', 'bulk_2')}
+        added = self.database.add_users([
+            ('bulk_1', hashes['bulk_1']), ('bulk_2', hashes['bulk_2']),
+            ('bulk_1', 'other_hash'), ('user_1', 'other_hash'),
+        ])
+        self.assertEqual(added, (2, 2))
+        for username, password_hash in hashes.items():
+            self.database.authenticate(username, password_hash)
+        with self.assertRaises(ValueError):
+            self.database.authenticate('user_1', 'other_hash')
@@ -0,0 +1,36 @@
+import unittest
+
+from common import settings
+from server.dispatcher import Dispatcher
+
+
+class DispatcherTestCase(unittest.TestCase):
+    """Разбор запросов по таблице обработчиков"""
+
+    def setUp(self):
+        self.client = object()
+        self.handled = []
+        self.dispatcher = Dispatcher(lambda username, client: username == 'user_1' and client is self.client)
+        self.dispatcher.register(settings.MESSAGE, lambda message, client: self.handled.append(message),
+                                 (settings.DESTINATION, settings.MESSAGE_TEXT), owner_field=settings.SENDER)
+
+    def test_dispatch(self):
+        message = {settings.ACTION: settings.MESSAGE, settings.SENDER: 'user_1',
+                   settings.DESTINATION: 'user_2', settings.MESSAGE_TEXT: 'Привет'}
+        self.assertTrue(self.dispatcher.dispatch(message, self.client))
+        self.assertEqual(self.handled, [message])
+
+    def test_rejected(self):
+        """Неизвестное действие, пропущенное поле и чужое имя отправителя не доходят до обработчика"""
+        message = {settings.ACTION: settings.MESSAGE, settings.SENDER: 'user_1',
+                   settings.DESTINATION: 'user_2', settings.MESSAGE_TEXT: 'Привет'}
+        cases = (
+            {**message, settings.ACTION: 'unknown'},
+            {key: value for key, value in message.items() if key != settings.MESSAGE_TEXT},
+            {**message, settings.SENDER: 'user_2'},
+        )
+        for case in cases:
+            with self.subTest(message=case):
+                self.assertFalse(self.dispatcher.dispatch(case, self.client))
+        self.assertFalse(self.dispatcher.dispatch(message, object()))
+        self.assertEqual(self.handled, [])
@@ -0,0 +1,26 @@
+from server_case import RawClient, ServerTestCase
+
+
+class EngineCallbacksTestCase(ServerTestCase):
+    """Ошибка отложенного вызова движка закрывает только связанное с вызовом соединение"""
+    USERNAMES = ('user_7', 'user_8')
+
+    def test_callback_error_closes_only_its_client(self):
+        def failing_callback(connection):
+            raise RuntimeError(f'Сбой обработки {connection!r}')
+
+        username, other_username = self.USERNAMES
+        client = RawClient(self.server, username)
+        self.assertEqual(client.presence_response['response'], 200)
+        self.server.engine.call_soon(failing_callback, self.server.connections.get_by_username(username))
+        self.assertTrue(client.is_closed_by_server())
+        client.close()
+        # Цикл движка продолжает работу: новые входы обслуживаются
+        other = RawClient(self.server, other_username)
+        self.assertEqual(other.presence_response['response'], 200)
+        other.close()
+
+
+class AsyncioEngineCallbacksTestCase(EngineCallbacksTestCase):
+    ENGINE = 'asyncio'
+    USERNAMES = ('user_9', 'user_10')
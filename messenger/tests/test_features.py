@@ -0,0 +1,128 @@
+import socket
+import time
+import unittest
+
+from common import settings, utils
+from server_case import RawClient, ServerTestCase
+
+
+class FeaturesTestCase(ServerTestCase):
+    """Согласование формата обмена в presence-сообщении"""
+
+    def login(self, username: str, features) -> RawClient:
+        client = RawClient(self.server, username, features)
+        self.addCleanup(client.close)
+        self.assertEqual(client.presence_response[settings.RESPONSE], 200, client.presence_response)
+        # Соединение продолжает работать в согласованном формате
+        response = client.request(self.contacts_request(username))
+        self.assertEqual(response[settings.RESPONSE], 202)
+        return client
+
+    def contacts_request(self, username: str) -> dict:
+        return {settings.ACTION: settings.GET_CONTACTS, settings.TIME: time.time(), settings.USER: username}
+
+    def test_length_prefix(self):
+        """Кадры с заголовком длины, отправленные одной записью, разбираются по отдельности"""
+        client = self.login('user_22', {settings.FRAMING: [settings.FRAMING_LENGTH_PREFIX]})
+        self.assertEqual(client.presence_response[settings.FEATURES],
+                         {settings.FRAMING: settings.FRAMING_LENGTH_PREFIX})
+        self.assertTrue(client.buffer.framed)
+        request = client.buffer.encode(self.contacts_request('user_22'))
+        client.sock.sendall(request * 3)
+        self.assertEqual([client.receive()[settings.RESPONSE] for _ in range(3)], [202, 202, 202])
+
+    def test_binary_codec(self):
+        """Кодек - первый известный серверу из списка клиента; ответы приходят в нём"""
+        client = self.login('user_23', {settings.FRAMING: [settings.FRAMING_LENGTH_PREFIX],
+                                        settings.CODEC: ['unknown', settings.CODEC_BINARY, settings.CODEC_JSON]})
+        self.assertEqual(client.presence_response[settings.FEATURES][settings.CODEC], settings.CODEC_BINARY)
+        client.send(self.contacts_request('user_23'))
+        data = client.sock.recv(settings.MAX_PACKET_LENGTH)
+        _, flags = utils.FRAME_HEADER.unpack_from(data)
+        self.assertEqual(flags & utils.FRAME_CODEC_MASK, utils.BINARY_CODEC.flag)
+        self.assertEqual(client.buffer.feed(data)[0][settings.RESPONSE], 202)
+
+    def test_compression(self):
+        """Крупный ответ сжимается, если клиент согласовал сжатие"""
+        client = self.login('user_24', {settings.FRAMING: [settings.FRAMING_LENGTH_PREFIX],
+                                        settings.COMPRESSION: [settings.COMPRESSION_ZLIB]})
+        self.assertEqual(client.presence_response[settings.FEATURES][settings.COMPRESSION], settings.COMPRESSION_ZLIB)
+        users_request = {settings.ACTION: settings.USERS_REQUEST, settings.TIME: time.time(),
+                         settings.ACCOUNT_NAME: 'user_24'}
+        client.send({settings.ACTION: settings.BATCH, settings.TIME: time.time(), settings.ACCOUNT_NAME: 'user_24',
+                     settings.LIST_INFO: [users_request] * 10})
+        data = client.sock.recv(settings.MAX_PACKET_LENGTH)
+        _, flags = utils.FRAME_HEADER.unpack_from(data)
+        self.assertTrue(flags & utils.FRAME_COMPRESSED)
+        messages = client.buffer.feed(data)
+        while not messages:
+            messages = client.buffer.feed(client.sock.recv(settings.MAX_PACKET_LENGTH))
+        self.assertEqual([el[settings.RESPONSE] for el in messages[0][settings.LIST_INFO]], [202] * 10)
+
+    def test_compression_requires_framing(self):
+        """Без заголовка длины сжатие не согласуется"""
+        client = self.login('user_25', {settings.COMPRESSION: [settings.COMPRESSION_ZLIB]})
+        self.assertEqual(client.presence_response[settings.FEATURES], {})
+
+    def test_unframed_limit(self):
+        """Незавершённое сообщение без заголовка длины ограничено одним пакетом"""
+        with socket.create_connection((self.server.ip_address, self.server.port), timeout=5) as sock:
+            sock.sendall(b'{"action": "' + b'x' * settings.MAX_UNFRAMED_LENGTH)
+            try:
+                self.assertEqual(sock.recv(settings.MAX_PACKET_LENGTH), b'')
+            except ConnectionResetError:
+                pass
+
+    def test_malformed_features(self):
+        """Некорректные предложения не прерывают вход: остаётся JSON без заголовка длины"""
+        cases = (
+            ('user_17', {settings.FRAMING: [settings.FRAMING_LENGTH_PREFIX], settings.CODEC: [[1]]},
+             {settings.FRAMING: settings.FRAMING_LENGTH_PREFIX, settings.CODEC: settings.CODEC_JSON}),
+            ('user_18', {settings.FRAMING: [[settings.FRAMING_LENGTH_PREFIX]], settings.CODEC: {},
+                         settings.COMPRESSION: [{}, settings.COMPRESSION_ZLIB]}, {}),
+            ('user_19', {settings.FRAMING: settings.FRAMING_LENGTH_PREFIX,
+                         settings.COMPRESSION: [[settings.COMPRESSION_ZLIB]]}, {}),
+            ('user_20', [settings.FRAMING_LENGTH_PREFIX], None),
+        )
+        for username, features, accepted in cases:
+            with self.subTest(features=features):
+                client = self.login(username, features)
+                self.assertEqual(client.presence_response.get(settings.FEATURES), accepted)
+
+
+class AsyncioFeaturesTestCase(FeaturesTestCase):
+    ENGINE = 'asyncio'
+
+
+class CompressionTestCase(unittest.TestCase):
+    """Сжатие кадров"""
+
+    def test_threshold(self):
+        """Кадры меньше COMPRESSION_THRESHOLD не сжимаются, крупные - сжимаются и разбираются"""
+        small = {settings.RESPONSE: 202, settings.LIST_INFO: ['user_1']}
+        large = {settings.RESPONSE: 202, settings.LIST_INFO: [f'user_{number}' for number in range(1000)]}
+        for message, compressed in ((small, False), (large, True)):
+            with self.subTest(compressed=compressed):
+                data = utils.encode_message(message, framed=True, compress=True)
+                _, flags = utils.FRAME_HEADER.unpack_from(data)
+                self.assertEqual(bool(flags & utils.FRAME_COMPRESSED), compressed)
+                self.assertEqual(utils.MessageBuffer(framed=True).feed(data), [message])
+
+
+class BinaryCodecTestCase(unittest.TestCase):
+    """Двоичный кодек сообщений"""
+
+    def test_round_trip(self):
+        message = {settings.ACTION: settings.MESSAGE, settings.TIME: 1.5, settings.SENDER: 'user_1',
+                   settings.LIST_INFO: ['Привет', 2 ** 40, -7, None, True, False, {'ключ': []}]}
+        self.assertEqual(utils.BINARY_CODEC.decode(utils.BINARY_CODEC.encode(message)), message)
+
+    def test_nesting_limit(self):
+        """Сообщение с вложенностью сверх MAX_NESTING_DEPTH не кодируется"""
+        message = {settings.LIST_INFO: []}
+        value = message[settings.LIST_INFO]
+        for _ in range(settings.MAX_NESTING_DEPTH):
+            value.append([])
+            value = value[0]
+        with self.assertRaises(ValueError):
+            utils.BINARY_CODEC.encode(message)
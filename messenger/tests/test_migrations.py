@@ -0,0 +1,49 @@
+import sqlite3
+import unittest
+
+from server.db import migrations
+from server.db.migrations import Migration
+from server_case import get_database
+
+
+class MigrationsTestCase(unittest.TestCase):
+    """Миграции схемы БД сервера"""
+
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        self.addCleanup(self.connection.close)
+
+    def table_names(self) -> list:
+        return [el for el, in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+    def test_upgrade_from_current_version(self):
+        """Применяются только миграции новее версии схемы"""
+        self.connection.execute('PRAGMA user_version = 1')
+        version = migrations.upgrade(self.connection, (
+            Migration(1, 'уже применена', ('CREATE TABLE first (id INTEGER)',)),
+            Migration(2, 'новая', ('CREATE TABLE second (id INTEGER)',)),
+        ))
+        self.assertEqual(version, 2)
+        self.assertEqual(migrations.get_schema_version(self.connection), 2)
+        self.assertEqual(self.table_names(), ['second'])
+
+    def test_failed_migration(self):
+        """Ошибка миграции оставляет БД в исходной версии без изменений предыдущих миграций"""
+        with self.assertRaises(sqlite3.OperationalError):
+            migrations.upgrade(self.connection, (
+                Migration(1, 'успешная', ('CREATE TABLE first (id INTEGER)',)),
+                Migration(2, 'ошибочная', ('INSERT INTO missing VALUES (1)',)),
+            ))
+        self.assertEqual(migrations.get_schema_version(self.connection), 0)
+        self.assertEqual(self.table_names(), [])
+
+    def test_server_database(self):
+        """БД сервера создаётся в последней версии схемы, повторный запуск ничего не меняет"""
+        connection = sqlite3.connect(get_database().path)
+        self.addCleanup(connection.close)
+        self.assertEqual(migrations.get_schema_version(connection), migrations.SCHEMA_VERSION)
+        indexes = {el for el, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('ux_contacts_user_id_contact_id', indexes)
+        changes = connection.execute('SELECT COUNT(*) FROM user_changes').fetchone()
+        self.assertEqual(migrations.upgrade(connection), migrations.SCHEMA_VERSION)
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM user_changes').fetchone(), changes)
@@ -0,0 +1,37 @@
+from unittest import mock
+
+from common import settings
+from server.services import Server
+from server_case import RawClient, ServerTestCase
+
+
+class PresenceTestCase(ServerTestCase):
+    """Вход клиента (presence) на работающем сервере"""
+
+    def receive_status(self, client: RawClient) -> tuple:
+        message = client.receive()
+        self.assertEqual(message[settings.ACTION], settings.STATUS)
+        return message[settings.ONLINE], message[settings.OFFLINE]
+
+    def test_status_events(self):
+        """Клиент, приславший FEATURES, получает состояние контактов при входе и затем их входы и выходы"""
+        self.server.database.add_contact('user_31', 'user_32')
+        watcher = RawClient(self.server, 'user_31', features={})
+        self.addCleanup(watcher.close)
+        self.assertEqual(self.receive_status(watcher), ([], ['user_32']))
+        contact = RawClient(self.server, 'user_32')
+        self.assertEqual(self.receive_status(watcher), (['user_32'], []))
+        contact.close()
+        self.assertEqual(self.receive_status(watcher), ([], ['user_32']))
+
+    def test_malformed_presence(self):
+        """Ошибка разбора presence после проверки пароля закрывает только соединение этого клиента"""
+        with mock.patch.object(Server, '_negotiate_features', side_effect=TypeError):
+            client = RawClient(self.server, 'user_21', features={})
+        self.assertEqual(client.presence_response[settings.RESPONSE], 400)
+        self.assertTrue(client.is_closed_by_server())
+        client.close()
+        # Имя освобождено, сервер продолжает принимать клиентов
+        client = RawClient(self.server, 'user_21', features={})
+        self.assertEqual(client.presence_response[settings.RESPONSE], 200)
+        client.close()
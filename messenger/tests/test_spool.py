@@ -0,0 +1,37 @@
+import time
+
+from common import settings
+from server_case import RawClient, ServerTestCase
+
+
+class SpoolTestCase(ServerTestCase):
+    """Доставка сообщений получателю, подключившемуся после отправки"""
+
+    def receive_message(self, client: RawClient) -> dict:
+        """Первое сообщение другого пользователя (уведомления о статусе пропускаются)"""
+        while True:
+            message = client.receive()
+            if message.get(settings.ACTION) == settings.MESSAGE:
+                return message
+
+    def test_offline_recipient(self):
+        """Сообщение получателю не в сети доставляется при его входе и удаляется из очереди"""
+        sender = RawClient(self.server, 'user_26')
+        self.addCleanup(sender.close)
+        texts = ['Первое', 'Второе']
+        for text in texts:
+            response = sender.request({settings.ACTION: settings.MESSAGE, settings.TIME: time.time(),
+                                       settings.SENDER: 'user_26', settings.DESTINATION: 'user_27',
+                                       settings.MESSAGE_TEXT: text})
+            self.assertEqual(response[settings.RESPONSE], 200)
+        recipient = RawClient(self.server, 'user_27', features={})
+        self.addCleanup(recipient.close)
+        self.assertEqual(recipient.presence_response[settings.RESPONSE], 200)
+        received = [self.receive_message(recipient) for _ in texts]
+        self.assertEqual([(el[settings.SENDER], el[settings.MESSAGE_TEXT]) for el in received],
+                         [('user_26', text) for text in texts])
+        for _ in range(50):  # отправленные сообщения удаляются потоком записи
+            if not self.server.database.peek_spooled_messages('user_27', self.server.spool_ttl):
+                break
+            time.sleep(0.1)
+        self.assertEqual(self.server.database.peek_spooled_messages('user_27', self.server.spool_ttl), [])
@@ -0,0 +1,73 @@
+import time
+
+from common import settings, utils
+from server_case import PASSWORD, RawClient, ServerTestCase
+
+
+class SyncTestCase(ServerTestCase):
+    """Синхронизация списков по ревизиям: клиент получает только изменения"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.client = RawClient(cls.server, 'user_28')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+
+    def users_request(self, revision=None) -> dict:
+        message = {settings.ACTION: settings.USERS_REQUEST, settings.TIME: time.time(),
+                   settings.ACCOUNT_NAME: 'user_28'}
+        if revision is not None:
+            message[settings.REVISION] = revision
+        response = self.client.request(message)
+        self.assertEqual(response[settings.RESPONSE], 202)
+        return response
+
+    def contacts_request(self, revision: int) -> dict:
+        response = self.client.request({settings.ACTION: settings.GET_CONTACTS, settings.TIME: time.time(),
+                                        settings.USER: 'user_28', settings.REVISION: revision})
+        self.assertEqual(response[settings.RESPONSE], 202)
+        return response
+
+    def edit_contact(self, action: str, contact: str):
+        response = self.client.request({settings.ACTION: action, settings.TIME: time.time(),
+                                        settings.USER: 'user_28', settings.ACCOUNT_NAME: contact})
+        self.assertEqual(response[settings.RESPONSE], 200)
+
+    def test_users_delta(self):
+        """Изменения справочника пользователей после ревизии клиента"""
+        response = self.users_request(0)
+        self.assertIn('user_28', response[settings.LIST_INFO])
+        self.assertNotIn(settings.REMOVED, response)
+        revision = response[settings.REVISION]
+        for username in ('sync_added', 'sync_removed'):
+            self.server.database.add_user(username, utils.get_hash(PASSWORD, username))
+        self.server.database.del_user('sync_removed')
+        response = self.users_request(revision)
+        self.assertEqual(response[settings.LIST_INFO], ['sync_added'])
+        self.assertEqual(response[settings.REMOVED], ['sync_removed'])
+        self.assertGreater(response[settings.REVISION], revision)
+        response = self.users_request(response[settings.REVISION])
+        self.assertEqual((response[settings.LIST_INFO], response[settings.REMOVED]), ([], []))
+        # Ревизия, которой нет на сервере (БД заменена), - полный список
+        response = self.users_request(response[settings.REVISION] + 1000)
+        self.assertIn('sync_added', response[settings.LIST_INFO])
+        self.assertNotIn(settings.REMOVED, response)
+
+    def test_contacts_delta(self):
+        """Изменения списка контактов после ревизии клиента"""
+        self.assertEqual(self.contacts_request(0)[settings.REVISION], 0)  # список ещё не менялся
+        self.edit_contact(settings.ADD_CONTACT, 'user_29')
+        response = self.contacts_request(0)
+        self.assertEqual(response[settings.LIST_INFO], ['user_29'])
+        self.assertNotIn(settings.REMOVED, response)
+        revision = response[settings.REVISION]
+        self.edit_contact(settings.ADD_CONTACT, 'user_30')
+        self.edit_contact(settings.REMOVE_CONTACT, 'user_29')
+        response = self.contacts_request(revision)
+        self.assertEqual((response[settings.LIST_INFO], response[settings.REMOVED]), (['user_30'], ['user_29']))
+        # Изменения других пользователей не меняют ревизию списка
+        self.server.database.add_contact('user_29', 'user_30')
+        self.assertEqual(self.contacts_request(response[settings.REVISION])[settings.LIST_INFO], [])
@@ -0,0 +1,43 @@
+import unittest
+
+from server.db.writer import DatabaseWriter
+from server_case import get_database
+
+
+class DatabaseWriterTestCase(unittest.TestCase):
+    """Транзакции пакетов записи в БД сервера"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.database = get_database()
+        cls.writer = DatabaseWriter(cls.database)
+        cls.writer.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.writer.stop()
+
+    def test_failed_operation(self):
+        """Ошибка операции откатывает только её изменения, остальные операции пакета фиксируются"""
+        def add_contact_and_fail():
+            self.database.add_contact('user_11', 'user_12')
+            raise RuntimeError('Сбой операции')
+
+        with self.writer.group() as operations:
+            self.writer.submit(self.database.add_contact, 'user_11', 'user_13')
+            self.writer.submit(add_contact_and_fail)
+            self.writer.submit(self.database.add_contact, 'user_11', 'user_14')
+        futures = [el[-1] for el in operations]
+        self.assertIsNone(futures[0].result(timeout=5))
+        self.assertIsInstance(futures[1].exception(timeout=5), RuntimeError)
+        self.assertIsNone(futures[2].result(timeout=5))
+        self.assertEqual(sorted(self.database.get_contacts('user_11')), ['user_13', 'user_14'])
+
+    def test_failed_batch(self):
+        """Ошибка пакета откатывает и уже выполненные точки сохранения"""
+        with self.assertRaises(RuntimeError):
+            with self.database.batch():
+                with self.database.savepoint():
+                    self.database.add_contact('user_15', 'user_16')
+                raise RuntimeError('Сбой пакета')
+        self.assertEqual(self.database.get_contacts('user_15'), [])